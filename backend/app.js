@@ -66,6 +66,46 @@ const authenticateToken = (req, res, next) => {
     });
 };
 
+// Embeddings for new registrations come from the warm enrollment worker
+// (flaskServer/enrollmentWorker.py); if it isn't running, spawn the script as before
+const ENROLLMENT_WORKER_URL = process.env.ENROLLMENT_WORKER_URL || "http://127.0.0.1:8002";
+
+const runEmbeddingScript = (uploadFolder) => {
+    const scriptPath = path.join(__dirname, "../flaskServer/createEmbeddings.py");
+    const command = `python "${scriptPath}" "${uploadFolder}"`;
+
+    exec(command, (error, stdout, stderr) => {
+        if (error) {
+            console.error(`[Embedding Error]: ${error.message}`);
+            return;
+        }
+        if (stderr) {
+            console.error(`[Embedding stderr]: ${stderr}`);
+        }
+        console.log(`[Embeddings Log]: ${stdout}`);
+    });
+};
+
+const generateEmbeddings = async (uploadFolder) => {
+    try {
+        const response = await fetch(`${ENROLLMENT_WORKER_URL}/jobs`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ folder: uploadFolder }),
+            signal: AbortSignal.timeout(2000),
+        });
+        const job = await response.json();
+        if (!response.ok) {
+            console.error(`[Embedding Error]: ${job.error || response.status}`);
+            return;
+        }
+        console.log(`[Embeddings Log]: Enrollment job ${job.job_id} ${job.status}`);
+    } catch (error) {
+        console.warn(`[Embeddings Log]: Enrollment worker unavailable (${error.message}), running createEmbeddings.py`);
+        runEmbeddingScript(uploadFolder);
+    }
+};
+
 // ✅ User registration with Profile Photo Upload
 app.post("/register", upload.array("profilePhotos"), async (req, res) => {
     try {
@@ -132,21 +172,7 @@ app.post("/register", upload.array("profilePhotos"), async (req, res) => {
         res.status(201).json({ message: "Registration Successful", designation: designation });
 
         // ✅ Trigger embeddings generation (keep this code AFTER successful registration)
-        const scriptPath = path.join(__dirname, "../flaskServer/createEmbeddings.py");
-        const uploadFolder = path.join(__dirname, "uploads", name);
-
-        const command = `python "${scriptPath}" "${uploadFolder}"`;
-
-        exec(command, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`[Embedding Error]: ${error.message}`);
-                return;
-            }
-            if (stderr) {
-                console.error(`[Embedding stderr]: ${stderr}`);
-            }
-            console.log(`[Embeddings Log]: ${stdout}`);
-        });
+        generateEmbeddings(path.join(__dirname, "uploads", name));
     } catch (error) {
         console.error("Error in registration", error);
         res.status(500).json({ error: "Internal Server Error" });
@@ -378,95 +404,171 @@ async function hashPassword(password) {
     return await bcrypt.hash(password, salt);
 }
 
-app.post("/mark-attendance", async (req, res) => {
-    try {
-        const { name, ppe_compliant, ppe_items, ppe_confidence } = req.body;
-        if (!name) {
-            return res.status(400).json({ error: "User name is required" });
-        }
+// Event ids the recognizer's offline spool has already delivered live in the
+// attendance_events table (event_id is its primary key), so a replayed batch
+// (answer lost before the spool could mark it sent) is not recorded twice, even
+// across a backend restart or when two replays race. Postgres unique_violation:
+const UNIQUE_VIOLATION = "23505";
+
+// Claims an event id before the attendance write. Returns "claimed", "duplicate"
+// or "error"; events without an id (old clients) are always "claimed".
+async function claimEvent(eventId, employeeId) {
+    if (!eventId) return "claimed";
+    const { error } = await supabase
+        .from("attendance_events")
+        .insert([{ event_id: eventId, employee_id: employeeId }]);
+    if (!error) return "claimed";
+    if (error.code === UNIQUE_VIOLATION) return "duplicate";
+    console.error("Error recording attendance event id:", error);
+    return "error";
+}
 
-        // Fetch correct employee_id from users table
-        const { data: users, error: userError } = await supabase
-            .from("users")
-            .select("employee_id, name")
-            .eq("name", name)
-            .limit(1);
+// Releases a claim whose attendance write failed, so the spool's retry is not
+// mistaken for a duplicate.
+async function releaseEvent(eventId) {
+    if (!eventId) return;
+    const { error } = await supabase.from("attendance_events").delete().eq("event_id", eventId);
+    if (error) {
+        console.error("Error releasing attendance event id:", error);
+    }
+}
 
-        if (userError) {
-            console.error("Error fetching user:", userError);
-            return res.status(500).json({ error: "Internal Server Error" });
-        }
+// Records one recognition event from the face recognizer (check-in, or check-out
+// if the employee already checked in today). Shared by the single and batch routes.
+async function recordAttendance(event) {
+    const { name, ppe_compliant, ppe_items, ppe_confidence, event_id, recognized_at } = event;
+    if (!name) {
+        return { status: 400, body: { error: "User name is required" } };
+    }
 
-        if (!users || users.length === 0) {
-            return res.status(404).json({ error: "User not found" });
-        }
+    // Fetch correct employee_id from users table
+    const { data: users, error: userError } = await supabase
+        .from("users")
+        .select("employee_id, name")
+        .eq("name", name)
+        .limit(1);
 
-        const employeeId = users[0].employee_id;
-        if (!employeeId) {
-            return res.status(400).json({ error: "Employee ID not found" });
-        }
+    if (userError) {
+        console.error("Error fetching user:", userError);
+        return { status: 500, body: { error: "Internal Server Error" } };
+    }
 
-        const currentDate = new Date().toLocaleDateString("en-GB", { timeZone: "Asia/Kolkata" }).split("/").reverse().join("-");
-        const currentTime = new Date().toLocaleTimeString("en-US", { timeZone: "Asia/Kolkata", hour12: false });
+    if (!users || users.length === 0) {
+        return { status: 404, body: { error: "User not found" } };
+    }
 
-        // Check if user has already checked in today
-        const { data: attendance, error: attendanceError } = await supabase
-            .from("attendance")
-            .select("*")
-            .eq("employee_id", employeeId)
-            .eq("date", currentDate)
-            .limit(1);
+    const employeeId = users[0].employee_id;
+    if (!employeeId) {
+        return { status: 400, body: { error: "Employee ID not found" } };
+    }
 
-        if (attendanceError) {
-            console.error("Error checking attendance:", attendanceError);
-            return res.status(500).json({ error: "Internal Server Error" });
-        }
+    // Claimed before the check-in / check-out decision: a replayed check-in must
+    // not be recorded as that day's check-out
+    const claim = await claimEvent(event_id, employeeId);
+    if (claim === "duplicate") {
+        return { status: 200, body: { message: "Duplicate event ignored", duplicate: true } };
+    }
+    if (claim === "error") {
+        return { status: 500, body: { error: "Internal Server Error" } };
+    }
 
-        // Always mark as "Present" when attendance is recorded (time-based logic removed)
-        let status = "Present";
-
-        if (attendance.length === 0) {
-            // First check-in: Insert new attendance record
-            const attendanceData = {
-                employee_id: employeeId,
-                date: currentDate,
-                check_in_time: currentTime,
-                check_out_time: null,
-                status: status,
-                ppe_compliant: ppe_compliant || false,
-                ppe_items_detected: ppe_items || {},
-                ppe_detection_confidence: ppe_confidence || 0.0,
-            };
-            
-            const { error: insertError } = await supabase.from("attendance").insert([attendanceData]);
+    // Spooled events can arrive long after recognition, so prefer the recognizer's timestamp
+    let eventTime = recognized_at ? new Date(recognized_at) : new Date();
+    if (isNaN(eventTime.getTime())) {
+        eventTime = new Date();
+    }
+    const currentDate = eventTime.toLocaleDateString("en-GB", { timeZone: "Asia/Kolkata" }).split("/").reverse().join("-");
+    const currentTime = eventTime.toLocaleTimeString("en-US", { timeZone: "Asia/Kolkata", hour12: false });
+
+    // Check if user has already checked in today
+    const { data: attendance, error: attendanceError } = await supabase
+        .from("attendance")
+        .select("*")
+        .eq("employee_id", employeeId)
+        .eq("date", currentDate)
+        .limit(1);
+
+    if (attendanceError) {
+        console.error("Error checking attendance:", attendanceError);
+        await releaseEvent(event_id);
+        return { status: 500, body: { error: "Internal Server Error" } };
+    }
 
-            if (insertError) {
-                console.error("Error inserting attendance:", insertError);
-                return res.status(500).json({ error: "Failed to record attendance" });
-            }
+    // Always mark as "Present" when attendance is recorded (time-based logic removed)
+    let status = "Present";
+
+    if (attendance.length === 0) {
+        // First check-in: Insert new attendance record
+        const attendanceData = {
+            employee_id: employeeId,
+            date: currentDate,
+            check_in_time: currentTime,
+            check_out_time: null,
+            status: status,
+            ppe_compliant: ppe_compliant || false,
+            ppe_items_detected: ppe_items || {},
+            ppe_detection_confidence: ppe_confidence || 0.0,
+        };
+        
+        const { error: insertError } = await supabase.from("attendance").insert([attendanceData]);
 
-            return res.status(200).json({ message: "Check-in recorded successfully" });
-        } else {
-            // Already checked in: Update check-out time
-            const { error: updateError } = await supabase
-                .from("attendance")
-                .update({ check_out_time: currentTime })
-                .eq("employee_id", employeeId)
-                .eq("date", currentDate);
+        if (insertError) {
+            console.error("Error inserting attendance:", insertError);
+            await releaseEvent(event_id);
+            return { status: 500, body: { error: "Failed to record attendance" } };
+        }
 
-            if (updateError) {
-                console.error("Error updating check-out time:", updateError);
-                return res.status(500).json({ error: "Failed to update check-out time" });
-            }
+        return { status: 200, body: { message: "Check-in recorded successfully" } };
+    } else {
+        // Already checked in: Update check-out time
+        const { error: updateError } = await supabase
+            .from("attendance")
+            .update({ check_out_time: currentTime })
+            .eq("employee_id", employeeId)
+            .eq("date", currentDate);
 
-            return res.status(200).json({ message: "Check-out recorded successfully" });
+        if (updateError) {
+            console.error("Error updating check-out time:", updateError);
+            await releaseEvent(event_id);
+            return { status: 500, body: { error: "Failed to update check-out time" } };
         }
+
+        return { status: 200, body: { message: "Check-out recorded successfully" } };
+    }
+}
+
+app.post("/mark-attendance", async (req, res) => {
+    try {
+        const { status, body } = await recordAttendance(req.body);
+        res.status(status).json(body);
     } catch (error) {
         console.error("Error in attendance route:", error);
         res.status(500).json({ error: "Internal Server Error" });
     }
 });
 
+// Batched variant used by the recognizer's background client: { events: [...] }.
+// Events are recorded in order; each gets its own status so one bad name does
+// not fail the rest of the batch.
+app.post("/mark-attendance/batch", async (req, res) => {
+    const events = Array.isArray(req.body.events) ? req.body.events : null;
+    if (!events) {
+        return res.status(400).json({ error: "events array is required" });
+    }
+
+    const results = [];
+    for (const event of events) {
+        try {
+            const { status, body } = await recordAttendance(event || {});
+            results.push({ name: event && event.name, status, ...body });
+        } catch (error) {
+            console.error("Error in batch attendance route:", error);
+            results.push({ name: event && event.name, status: 500, error: "Internal Server Error" });
+        }
+    }
+    res.status(200).json({ results });
+});
+
 // Automatic absent marking disabled - users can mark attendance as "Present" at any time
 // Date-based tracking is still active (one record per day)
 // async function markAbsentEmployees() {
@@ -0,0 +1,373 @@
+"""
+Pluggable nearest-neighbour indexes for the face gallery.
+
+All backends work on L2-normalised float32 embeddings and return cosine
+similarities (not distances), so the recognizer's THRESHOLD check
+(similarity >= THRESHOLD) means the same thing whichever backend is used.
+
+Backends:
+    brute    exact, one matrix-vector product (the reference)
+    sklearn  exact, NearestNeighbors(metric='cosine', algorithm='brute'),
+             the original implementation, kept for comparison
+    ivf      inverted file: spherical k-means coarse quantizer, searches the
+             nprobe closest lists exactly. Pure NumPy
+    lsh      random-hyperplane (SimHash) LSH over several tables, candidates
+             re-ranked exactly. Pure NumPy
+    hnsw     HNSW graph via the optional hnswlib package
+
+datasketch's LSH classes estimate Jaccard similarity of sets (MinHash), which
+does not fit cosine similarity of signed dense embeddings, so the LSH backend
+here uses random hyperplanes instead.
+
+Pick a setting by measuring recall@1 against brute force on a gallery:
+    python annIndex.py ./gallery --backend ivf --param nprobe=4 --param nprobe=16
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+# ------------------- Configuration -------------------
+ANN_BACKEND = "brute"      # Index used for large gallery segments
+ANN_PARAMS = {}            # Backend build/search parameters, e.g. {"nprobe": 8}
+ANN_MIN_SIZE = 2000        # Smaller segments always use exact search
+# -----------------------------------------------------
+
+
+def _top_k(scores, k):
+    """Indices and values of the k largest scores per row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.float32), np.empty((scores.shape[0], 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part_scores, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+def _pad(similarities, indices, k):
+    """Pad results with -inf / -1 up to k columns."""
+    missing = k - similarities.shape[1]
+    if missing <= 0:
+        return similarities, indices
+    rows = similarities.shape[0]
+    return (np.hstack([similarities, np.full((rows, missing), -np.inf, dtype=np.float32)]),
+            np.hstack([indices, np.full((rows, missing), -1, dtype=np.int64)]))
+
+
+class BruteForceIndex:
+    """Exact search with one (Q, D) x (D, N) product."""
+
+    name = "brute"
+
+    def __init__(self, embeddings):
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, queries, k=1):
+        """
+        Returns:
+            tuple: (similarities (Q, k), row indices (Q, k)), best first; padded
+            with -inf / -1 when the index holds fewer than k rows
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.embeddings.shape[1])
+        similarities, indices = _top_k(queries @ self.embeddings.T, k)
+        return _pad(similarities, indices, k)
+
+
+class SklearnIndex:
+    """The original NearestNeighbors(metric='cosine', algorithm='brute') search."""
+
+    name = "sklearn"
+
+    def __init__(self, embeddings):
+        from sklearn.neighbors import NearestNeighbors
+        self.size = len(embeddings)
+        self.index = NearestNeighbors(n_neighbors=1, metric='cosine', algorithm='brute')
+        self.index.fit(embeddings)
+
+    def __len__(self):
+        return self.size
+
+    def search(self, queries, k=1):
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(np.atleast_2d(queries)), -1)
+        distances, indices = self.index.kneighbors(queries, n_neighbors=min(k, self.size))
+        return _pad((1.0 - distances).astype(np.float32), indices.astype(np.int64), k)
+
+
+class IVFIndex:
+    """
+    Inverted-file index with a spherical k-means coarse quantizer.
+
+    Args:
+        nlist: Number of lists (default ~sqrt(N))
+        nprobe: Lists searched per query; higher = better recall, slower
+        train_size: Rows sampled to train the quantizer
+        iterations: k-means iterations
+    """
+
+    name = "ivf"
+
+    def __init__(self, embeddings, nlist=None, nprobe=8, train_size=50000, iterations=10, seed=0):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        n = len(embeddings)
+        self.nlist = max(1, min(n, int(nlist or np.sqrt(n))))
+        self.nprobe = max(1, min(int(nprobe), self.nlist))
+
+        rng = np.random.default_rng(seed)
+        sample = embeddings[rng.choice(n, size=min(n, train_size), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=self.nlist)
+            empty = counts == 0
+            # Re-seed empty lists with random rows so every list stays in use
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+        self.centroids = centroids.astype(np.float32)
+
+        # Store rows grouped by list so each probe is one contiguous slice
+        assignment = np.argmax(embeddings @ self.centroids.T, axis=1)
+        self.order = np.argsort(assignment, kind="stable")
+        self.embeddings = embeddings[self.order]
+        counts = np.bincount(assignment, minlength=self.nlist)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, queries, k=1):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.embeddings.shape[1])
+        _, probes = _top_k(queries @ self.centroids.T, self.nprobe)
+        out_sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_idx = np.full((len(queries), k), -1, dtype=np.int64)
+        for q, lists in enumerate(probes):
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            if len(rows) == 0:
+                continue
+            sims, local = _top_k((self.embeddings[rows] @ queries[q])[None, :], k)
+            out_sims[q, :sims.shape[1]] = sims[0]
+            out_idx[q, :sims.shape[1]] = self.order[rows[local[0]]]
+        return out_sims, out_idx
+
+
+class LSHIndex:
+    """
+    Random-hyperplane LSH: each table hashes a vector to the sign pattern of
+    n_bits projections; candidates from all tables are re-ranked exactly.
+
+    Args:
+        n_tables: Hash tables; more = better recall, more candidates
+        n_bits: Bits per hash (<= 63); more = smaller buckets, lower recall
+    """
+
+    name = "lsh"
+
+    def __init__(self, embeddings, n_tables=8, n_bits=12, seed=0):
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if not 1 <= n_bits <= 63:
+            raise ValueError("n_bits must be between 1 and 63")
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, self.embeddings.shape[1], n_bits)).astype(np.float32)
+        self.weights = (1 << np.arange(n_bits, dtype=np.int64))
+        self.tables = []
+        for codes in self._codes(self.embeddings):
+            order = np.argsort(codes, kind="stable")
+            keys, starts = np.unique(codes[order], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            self.tables.append({key: order[s:e] for key, s, e in zip(keys.tolist(), starts, ends)})
+
+    def _codes(self, vectors):
+        """(n_tables, N) bucket keys."""
+        bits = np.einsum("nd,tdb->tnb", vectors, self.planes) > 0
+        return bits.astype(np.int64) @ self.weights
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, queries, k=1):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.embeddings.shape[1])
+        codes = self._codes(queries)
+        out_sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_idx = np.full((len(queries), k), -1, dtype=np.int64)
+        empty = np.empty(0, dtype=np.int64)
+        for q in range(len(queries)):
+            buckets = [table.get(int(codes[t, q]), empty) for t, table in enumerate(self.tables)]
+            rows = np.unique(np.concatenate(buckets))
+            if len(rows) == 0:
+                continue
+            sims, local = _top_k((self.embeddings[rows] @ queries[q])[None, :], k)
+            out_sims[q, :sims.shape[1]] = sims[0]
+            out_idx[q, :sims.shape[1]] = rows[local[0]]
+        return out_sims, out_idx
+
+
+class HNSWIndex:
+    """
+    HNSW graph index (requires `pip install hnswlib`).
+
+    Args:
+        M: Graph degree
+        ef_construction: Build-time candidate list size
+        ef: Search-time candidate list size; higher = better recall, slower
+    """
+
+    name = "hnsw"
+
+    def __init__(self, embeddings, M=16, ef_construction=200, ef=64, num_threads=-1):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("The hnsw backend needs hnswlib: pip install hnswlib")
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.size = len(embeddings)
+        self.index = hnswlib.Index(space="ip", dim=embeddings.shape[1])
+        self.index.init_index(max_elements=max(1, self.size), M=M, ef_construction=ef_construction)
+        self.index.add_items(embeddings, np.arange(self.size), num_threads=num_threads)
+        self.index.set_ef(max(ef, 1))
+
+    def __len__(self):
+        return self.size
+
+    def search(self, queries, k=1):
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(np.atleast_2d(queries)), -1)
+        k_found = min(k, self.size)
+        self.index.set_ef(max(self.index.ef, k_found))
+        labels, distances = self.index.knn_query(queries, k=k_found)
+        # hnswlib's "ip" space returns 1 - dot product
+        return _pad((1.0 - distances).astype(np.float32), labels.astype(np.int64), k)
+
+
+BACKENDS = {
+    "brute": BruteForceIndex,
+    "sklearn": SklearnIndex,
+    "ivf": IVFIndex,
+    "lsh": LSHIndex,
+    "hnsw": HNSWIndex,
+}
+
+
+def create_index(embeddings, backend=None, params=None, min_size=ANN_MIN_SIZE):
+    """
+    Build an index over L2-normalised embeddings. Collections smaller than
+    min_size always get exact search: approximate indexes only pay off on
+    large galleries.
+    """
+    backend = backend or ANN_BACKEND
+    params = ANN_PARAMS if params is None else params
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown ANN backend '{backend}', expected one of {sorted(BACKENDS)}")
+    if len(embeddings) < min_size and backend != "sklearn":
+        return BruteForceIndex(embeddings)
+    return BACKENDS[backend](embeddings, **params)
+
+
+# ------------------- Recall measurement -------------------
+
+def make_queries(embeddings, count=1000, noise=0.35, seed=0):
+    """
+    Synthetic probe faces: gallery rows with gaussian noise added and
+    re-normalised, roughly the spread of a new capture of an enrolled person.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), size=min(count, len(embeddings)), replace=False)
+    queries = embeddings[rows] + rng.standard_normal((len(rows), embeddings.shape[1])).astype(np.float32) * (
+        noise / np.sqrt(embeddings.shape[1]))
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def evaluate_recall(embeddings, queries, backend, params=None, threshold=None):
+    """
+    Compare one backend against exact search.
+
+    Returns:
+        dict with recall_at_1 (same top-1 row as brute force), decision_agreement
+        (same above/below threshold outcome, if a threshold is given), build
+        time and per-query latency for both
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    exact = BruteForceIndex(embeddings)
+
+    start = time.perf_counter()
+    index = create_index(embeddings, backend, params or {}, min_size=0)
+    build_seconds = time.perf_counter() - start
+
+    exact_sims, exact_idx = _timed_single_queries(exact, queries)
+    ann_sims, ann_idx = _timed_single_queries(index, queries)
+
+    report = {
+        "backend": backend,
+        "params": params or {},
+        "gallery_size": len(embeddings),
+        "queries": len(queries),
+        "build_s": build_seconds,
+        "recall_at_1": float(np.mean(ann_idx[0] == exact_idx[0])),
+        "exact_ms_per_query": exact_sims[1] * 1000.0,
+        "ann_ms_per_query": ann_sims[1] * 1000.0,
+    }
+    if threshold is not None:
+        report["decision_agreement"] = float(np.mean((ann_sims[0] >= threshold) == (exact_sims[0] >= threshold)))
+    return report
+
+
+def _timed_single_queries(index, queries):
+    """Query one face at a time (as the camera loop does); returns ((sims, ms), (idx, _))."""
+    sims = np.empty(len(queries), dtype=np.float32)
+    idx = np.empty(len(queries), dtype=np.int64)
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        s, j = index.search(query[None, :], k=1)
+        sims[i], idx[i] = s[0, 0], j[0, 0]
+    per_query = (time.perf_counter() - start) / max(1, len(queries))
+    return (sims, per_query), (idx, per_query)
+
+
+def _parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+if __name__ == "__main__":
+    from gallery import Gallery
+
+    parser = argparse.ArgumentParser(description="Measure ANN recall@1 against brute force on a gallery")
+    parser.add_argument("gallery", help="Binary gallery directory (see gallery.py)")
+    parser.add_argument("--backend", default="ivf", choices=sorted(BACKENDS))
+    parser.add_argument("--param", action="append", default=[],
+                        help="name=value; repeat the same name to sweep several values")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.35)
+    parser.add_argument("--threshold", type=float, default=0.65)
+    args = parser.parse_args()
+
+    gallery_embeddings = Gallery.load(args.gallery).as_float32()
+    probe = make_queries(gallery_embeddings, args.queries, args.noise)
+
+    # Group --param values by name; sweep the values of the last swept name
+    grid = {}
+    for item in args.param:
+        key, value = item.split("=", 1)
+        grid.setdefault(key, []).append(_parse_value(value))
+    fixed = {key: values[0] for key, values in grid.items() if len(values) == 1}
+    swept = [(key, values) for key, values in grid.items() if len(values) > 1]
+    settings = [fixed]
+    if swept:
+        key, values = swept[-1]
+        settings = [dict(fixed, **{key: value}) for value in values]
+
+    print(f"[ANN] gallery={len(gallery_embeddings)} queries={len(probe)} backend={args.backend}")
+    for setting in settings:
+        r = evaluate_recall(gallery_embeddings, probe, args.backend, setting, threshold=args.threshold)
+        print(f"  {setting or 'defaults'}: recall@1={r['recall_at_1']:.4f} "
+              f"agree@{args.threshold}={r['decision_agreement']:.4f} "
+              f"ann={r['ann_ms_per_query']:.3f}ms exact={r['exact_ms_per_query']:.3f}ms build={r['build_s']:.2f}s")
@@ -0,0 +1,204 @@
+"""
+Multi-scale, multi-model anti-spoof ensemble.
+
+Silent-Face averages the softmax of several MiniFASNet variants, each run on
+the face box expanded by the scale in its file name (2.7_80x80_MiniFASNetV2,
+4_0_0_80x80_MiniFASNetV1SE, ...). AntiSpoofEnsemble loads every .pth in the
+model directory through the shared predict registry and scores all faces of
+a frame with all chosen members in one scheduled pass:
+
+    - crops are built once per distinct (scale, input size), so members that
+      share one also share its tensor and its copy to the device
+    - the members then run back to back under a single no_grad and their
+      softmax outputs are averaged
+    - every forward is timed; members are taken in priority order (the
+      primary model first) while their summed expected time for this many
+      faces fits LATENCY_BUDGET_MS. The first member always runs, so a tight
+      budget degrades to the single-model check rather than to none.
+
+Models named org_... (whole image upstream) get the plain face box, since a
+frame here can hold several faces.
+
+    python antiSpoofEnsemble.py [model_dir]     # calibrate and print per-model timing
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from predict import NUM_CLASSES, crop_jobs, split_rows
+
+# ------------------- Configuration -------------------
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Silent-Face-Anti-Spoofing",
+                         "resources", "anti_spoof_models")
+LATENCY_BUDGET_MS = 20.0    # Expected anti-spoof time per frame; None runs every member
+CALIBRATION_FACES = 8       # Second batch size timed by calibrate() (the first is 1)
+TIMING_DECAY = 0.1          # Weight of the newest measurement in the moving average
+# -----------------------------------------------------
+
+
+class EnsembleMember:
+    """
+    One model of the ensemble and its measured cost.
+
+    The expected forward time for n faces is (fixed_s + per_face_s * n) *
+    drift: calibrate() fits the affine part from two batch sizes, and drift
+    follows every later run as a moving average of measured / expected.
+    """
+
+    def __init__(self, loaded):
+        self.loaded = loaded
+        self.fixed_s = None
+        self.per_face_s = 0.0
+        self.drift = 1.0
+        self.runs = 0
+        self.skipped = 0
+        self.total_s = 0.0
+        self.last_s = None
+
+    @property
+    def name(self):
+        return self.loaded.name
+
+    @property
+    def crop_key(self):
+        return self.loaded.scale, self.loaded.w_input, self.loaded.h_input
+
+    def expected_seconds(self, faces):
+        if self.fixed_s is None:
+            return 0.0  # Never timed: run it once to find out
+        return (self.fixed_s + self.per_face_s * faces) * self.drift
+
+    def record(self, seconds, faces):
+        self.runs += 1
+        self.total_s += seconds
+        self.last_s = seconds
+        if self.fixed_s is None:
+            self.fixed_s = seconds
+            return
+        ratio = seconds / max(self.expected_seconds(faces) / self.drift, 1e-9)
+        self.drift = (1.0 - TIMING_DECAY) * self.drift + TIMING_DECAY * ratio
+
+
+class AntiSpoofEnsemble:
+    """
+    Average of several MiniFASNets, each on its own scale of crop.
+
+    Args:
+        predictor: predict.AntiSpoofPredict providing the device and model registry
+        model_dir: Folder of Silent-Face .pth files; all of them are members
+        primary: Weight file to run first (kept under any budget); defaults to
+            the first file by name
+        budget_ms: LATENCY_BUDGET_MS override (None runs every member)
+    """
+
+    def __init__(self, predictor, model_dir=MODEL_DIR, primary=None, budget_ms=LATENCY_BUDGET_MS):
+        self.predictor = predictor
+        self.budget_ms = budget_ms
+        paths = sorted(os.path.join(model_dir, name) for name in os.listdir(model_dir) if name.endswith(".pth"))
+        if primary is not None:
+            primary = os.path.abspath(primary)
+            paths = [primary] + [path for path in paths if os.path.abspath(path) != primary]
+        if not paths:
+            raise ValueError(f"No anti-spoof models (.pth) in {model_dir}")
+        self.members = [EnsembleMember(loaded) for loaded in predictor.registry.preload(paths)]
+        self.last_members = []
+
+    def select(self, faces):
+        """Members to run for this many faces under the latency budget (at least the first)."""
+        if self.budget_ms is None:
+            return list(self.members)
+        budget_s = self.budget_ms / 1000.0
+        chosen, spent = [], 0.0
+        for member in self.members:
+            cost = member.expected_seconds(faces)
+            if chosen and spent + cost > budget_s:
+                member.skipped += 1
+                continue
+            chosen.append(member)
+            spent += cost
+        return chosen
+
+    def predict_batch(self, frame, boxes, members=None):
+        """
+        Averaged softmax scores for every face box of one BGR frame.
+
+        Returns:
+            (N, classes) array; rows of empty crops are all zeros
+        """
+        return self.predict_many([(frame, boxes)], members)[0]
+
+    def predict_many(self, jobs, members=None):
+        """predict_batch for several (BGR frame, boxes) pairs, every member running once over all their faces."""
+        faces = sum(len(boxes) for _, boxes in jobs)
+        members = self.select(faces) if members is None else members
+        self.last_members = [member.name for member in members]
+
+        # One crop tensor (and one device copy) per distinct scale and input size
+        inputs = {}
+        valid, counts = np.zeros(0, dtype=bool), [len(boxes) for _, boxes in jobs]
+        for member in members:
+            if member.crop_key not in inputs:
+                batch, valid, counts = crop_jobs(jobs, member.loaded.w_input, member.loaded.h_input,
+                                                 member.loaded.scale)
+                inputs[member.crop_key] = torch.from_numpy(batch[valid]).to(self.predictor.device)
+        scores = np.zeros((faces, NUM_CLASSES), dtype=np.float32)
+        if not valid.any():
+            return split_rows(scores, counts)
+
+        total = None
+        with torch.no_grad():
+            for member in members:
+                started = time.perf_counter()
+                result = F.softmax(member.loaded.model.forward(inputs[member.crop_key]), dim=1)
+                # Reading back one value waits for the device, so the time is the member's own
+                result[0, 0].item()
+                member.record(time.perf_counter() - started, int(valid.sum()))
+                total = result if total is None else total + result
+        scores[valid] = (total / len(members)).cpu().numpy()
+        return split_rows(scores, counts)
+
+    def calibrate(self, frame_size=(480, 640)):
+        """Time every member's forward on 1 and CALIBRATION_FACES dummy faces to seed the budget estimates."""
+        frame = np.zeros((frame_size[0], frame_size[1], 3), dtype=np.uint8)
+        step = max(1, frame_size[1] // (CALIBRATION_FACES + 1))
+        many = [(i * step, 0, i * step + 80, 80) for i in range(CALIBRATION_FACES)]
+        for member in self.members:
+            # First call pays for kernel selection; discard it
+            self.predict_batch(frame, many[:1], [member])
+            times = {}
+            for boxes in (many[:1], many):
+                self.predict_batch(frame, boxes, [member])
+                times[len(boxes)] = member.last_s
+            member.per_face_s = max(0.0, (times[len(many)] - times[1]) / max(len(many) - 1, 1))
+            member.fixed_s = max(times[1] - member.per_face_s, 0.0)
+            member.drift = 1.0
+            member.runs = member.skipped = 0
+            member.total_s = 0.0
+        return self
+
+    def report(self):
+        """One line per member: crop, calibrated cost, runs and skips."""
+        lines = [f"[ANTISPOOF] {'model':<32} scale  fixed_ms  face_ms  runs  skipped  avg_ms"]
+        for member in self.members:
+            fixed_ms = "-" if member.fixed_s is None else f"{member.fixed_s * 1000.0:.2f}"
+            avg_ms = member.total_s / member.runs * 1000.0 if member.runs else 0.0
+            scale = "org" if member.loaded.scale is None else f"{member.loaded.scale:g}"
+            lines.append(f"[ANTISPOOF] {member.name:<32} {scale:>5}  {fixed_ms:>8}  "
+                         f"{member.per_face_s * 1000.0:7.2f}  {member.runs:4d}  {member.skipped:7d}  {avg_ms:6.2f}")
+        budget = "none" if self.budget_ms is None else f"{self.budget_ms:g} ms"
+        lines.append(f"[ANTISPOOF] budget {budget}, last frame used {len(self.last_members)} of {len(self.members)}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from predict import AntiSpoofPredict
+
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else MODEL_DIR
+    ensemble = AntiSpoofEnsemble(AntiSpoofPredict(0), model_dir).calibrate()
+    ensemble.predict_batch(np.zeros((480, 640, 3), dtype=np.uint8), [(100, 100, 220, 240)])
+    print(ensemble.report())
@@ -0,0 +1,240 @@
+"""
+Inference-optimised MiniFASNet for CPU.
+
+    python antiSpoofQuantize.py <model.pth> <crop_folder> [--mode static|dynamic]
+
+    1. fuse_model folds every BatchNorm into the convolution or linear layer
+       in front of it (Conv_block, Linear_block, SEModule and the embedding
+       head), so eval-mode inference skips the separate normalisation pass
+    2. post-training int8 quantization of the fused model. "static" (the
+       default) quantizes the whole network with FX graph mode, with
+       activation ranges observed on the face crops in <crop_folder>;
+       "dynamic" only quantizes the linear layers' weights and needs no
+       calibration, but leaves the convolutions (nearly all the work) in float
+    3. the softmax of the int8 model must stay within SOFTMAX_TOLERANCE of
+       the float model (largest per-class difference) on held-out crops, and
+       the labels must agree on at least MIN_AGREEMENT of them
+    4. float, fused and int8 latency per crop are timed at batch 1 and BATCH
+    5. the int8 model is saved as TorchScript next to the weights
+       (2.7_80x80_MiniFASNetV2.pth -> 2.7_80x80_MiniFASNetV2.int8.pt), which
+       predict.AntiSpoofModel loads instead of the .pth on CPU
+
+Nothing is written when the tolerance check fails. The crops should be what
+the gate feeds the model: face boxes expanded by the model's scale (see
+predict.expand_boxes), real and spoof, of any size.
+"""
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.nn import BatchNorm1d, Identity, Linear
+
+from MiniFASNet import Conv_block, Linear_block, SEModule
+from predict import AntiSpoofModel, optimized_path
+
+# ------------------- Configuration -------------------
+QUANT_BACKEND = "x86"           # torch.ao quantized engine; "qnnpack" on ARM boxes
+CALIBRATION_IMAGES = 256        # Crops used at most (calibration and check together)
+VALIDATION_EVERY = 5            # Every n-th crop is held out for the tolerance check
+SOFTMAX_TOLERANCE = 0.05        # Largest allowed |int8 - float| softmax difference
+MIN_AGREEMENT = 0.98            # Share of held-out crops whose label must not change
+BATCH = 8                       # Second batch size timed (the first is 1)
+TIMING_REPEATS = 50
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# -----------------------------------------------------
+
+
+def _bn_scale_shift(bn):
+    scale = bn.weight.detach() / torch.sqrt(bn.running_var + bn.eps)
+    return scale, bn.bias.detach() - bn.running_mean * scale
+
+
+def fold_conv_bn(conv, bn):
+    """conv followed by eval-mode bn as one convolution with a bias."""
+    fused = copy.deepcopy(conv)
+    scale, shift = _bn_scale_shift(bn)
+    fused.weight = torch.nn.Parameter(conv.weight.detach() * scale.reshape(-1, 1, 1, 1))
+    bias = shift if conv.bias is None else conv.bias.detach() * scale + shift
+    fused.bias = torch.nn.Parameter(bias)
+    return fused
+
+
+def fold_linear_bn(linear, bn):
+    """linear followed by eval-mode BatchNorm1d as one linear layer with a bias."""
+    fused = Linear(linear.in_features, linear.out_features, bias=True)
+    scale, shift = _bn_scale_shift(bn)
+    fused.weight = torch.nn.Parameter(linear.weight.detach() * scale.reshape(-1, 1))
+    fused.bias = torch.nn.Parameter(shift if linear.bias is None else linear.bias.detach() * scale + shift)
+    return fused
+
+
+def fuse_model(model):
+    """
+    Eval-mode copy of a MiniFASNet with every BatchNorm folded into the layer
+    before it. The BatchNorms become Identity, so the forwards are unchanged.
+    """
+    model = copy.deepcopy(model).eval()
+    with torch.no_grad():
+        for module in list(model.modules()):
+            if isinstance(module, (Conv_block, Linear_block)):
+                module.conv, module.bn = fold_conv_bn(module.conv, module.bn), Identity()
+            elif isinstance(module, SEModule):
+                module.fc1, module.bn1 = fold_conv_bn(module.fc1, module.bn1), Identity()
+                module.fc2, module.bn2 = fold_conv_bn(module.fc2, module.bn2), Identity()
+        # Embedding head: linear -> BatchNorm1d (without the linear at 512 wide, nothing to fold into)
+        if model.embedding_size != 512 and isinstance(model.bn, BatchNorm1d):
+            model.linear, model.bn = fold_linear_bn(model.linear, model.bn), Identity()
+    return model
+
+
+def load_crops(folder, width, height, limit=CALIBRATION_IMAGES):
+    """(N, 3, height, width) float32 RGB batch of the images in folder, scaled like predict.crop_batch."""
+    names = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+    crops = []
+    for name in names:
+        image = cv2.imread(os.path.join(folder, name))
+        if image is None:
+            print(f"[WARNING] Could not read {name}, skipping")
+            continue
+        crops.append(cv2.resize(image, (width, height)))
+    if not crops:
+        raise ValueError(f"No readable crops in {folder}")
+    batch = np.stack(crops)[..., ::-1].transpose(0, 3, 1, 2)
+    return torch.from_numpy(np.ascontiguousarray(batch, dtype=np.float32))
+
+
+def split_crops(crops):
+    """(calibration, held-out) crops; both are everything when there are too few to split."""
+    held_out = torch.zeros(len(crops), dtype=torch.bool)
+    held_out[VALIDATION_EVERY - 1::VALIDATION_EVERY] = True
+    if held_out.all() or not held_out.any():
+        print(f"[WARNING] Only {len(crops)} crop(s); checking on the calibration crops themselves")
+        return crops, crops
+    return crops[~held_out], crops[held_out]
+
+
+def quantize_static(model, calibration, batch_size=32):
+    """FX graph mode int8 model of a float model, calibrated on the given crops."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = QUANT_BACKEND
+    prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(QUANT_BACKEND),
+                          example_inputs=(calibration[:1],))
+    with torch.no_grad():
+        for start in range(0, len(calibration), batch_size):
+            prepared(calibration[start:start + batch_size])
+    return convert_fx(prepared)
+
+
+def quantize_dynamic(model):
+    """int8 weights for the linear layers only; activations stay float."""
+    torch.backends.quantized.engine = QUANT_BACKEND
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model).eval(), {Linear}, dtype=torch.qint8)
+
+
+def softmax(model, inputs):
+    with torch.no_grad():
+        return F.softmax(model(inputs), dim=1)
+
+
+def compare(reference, candidate, inputs):
+    """(largest softmax difference, share of inputs whose argmax agrees)."""
+    expected, actual = softmax(reference, inputs), softmax(candidate, inputs)
+    max_diff = float((expected - actual).abs().max())
+    agreement = float((expected.argmax(dim=1) == actual.argmax(dim=1)).float().mean())
+    return max_diff, agreement
+
+
+def latency_ms(model, inputs, repeats=TIMING_REPEATS):
+    """Median milliseconds per crop of a forward over inputs."""
+    times = []
+    with torch.no_grad():
+        for _ in range(3):
+            model(inputs)
+        for _ in range(repeats):
+            started = time.perf_counter()
+            model(inputs)
+            times.append(time.perf_counter() - started)
+    return float(np.median(times)) * 1000.0 / len(inputs)
+
+
+def optimize(model_path, crop_folder, mode="static", tolerance=SOFTMAX_TOLERANCE, output=None):
+    """
+    Fuse, quantize, check and time one MiniFASNet; save it if it passes.
+
+    Returns:
+        dict with the check results ("max_diff", "agreement", "passed"),
+        latencies ("<variant>_ms" at batch 1, "<variant>_ms_batch" at BATCH)
+        and "output" (None if nothing was written)
+    """
+    loaded = AntiSpoofModel(model_path, torch.device("cpu"), optimized=False)
+    float_model = loaded.model.eval()
+    fused = fuse_model(float_model)
+    crops = load_crops(crop_folder, loaded.w_input, loaded.h_input)
+    calibration, held_out = split_crops(crops)
+    print(f"[INFO] {loaded.name}: {len(calibration)} calibration and {len(held_out)} held-out crop(s)")
+
+    fused_diff, _ = compare(float_model, fused, held_out)
+    print(f"[INFO] BatchNorm folding changes the softmax by at most {fused_diff:.2e}")
+
+    started = time.perf_counter()
+    quantized = quantize_static(fused, calibration) if mode == "static" else quantize_dynamic(fused)
+    print(f"[INFO] {mode} int8 quantization took {time.perf_counter() - started:.1f}s")
+
+    max_diff, agreement = compare(float_model, quantized, held_out)
+    passed = max_diff <= tolerance and agreement >= MIN_AGREEMENT
+    result = {"max_diff": max_diff, "agreement": agreement, "passed": passed, "output": None}
+
+    one = crops[:1]
+    many = crops[:BATCH] if len(crops) >= BATCH else crops[:1].repeat(BATCH, 1, 1, 1)
+    for variant, model in (("float", float_model), ("fused", fused), ("int8", quantized)):
+        result[f"{variant}_ms"] = latency_ms(model, one)
+        result[f"{variant}_ms_batch"] = latency_ms(model, many)
+
+    if passed:
+        output = output or optimized_path(model_path)
+        with torch.no_grad():
+            traced = torch.jit.trace(quantized, many[:2])
+        traced.save(output)
+        result["output"] = output
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold BatchNorm and int8-quantize a MiniFASNet for CPU")
+    parser.add_argument("model", help="Silent-Face .pth weights")
+    parser.add_argument("crops", help="Folder of face crops for calibration and the tolerance check")
+    parser.add_argument("--mode", choices=("static", "dynamic"), default="static")
+    parser.add_argument("--tolerance", type=float, default=SOFTMAX_TOLERANCE,
+                        help="Largest allowed softmax difference to the float model")
+    parser.add_argument("--output", help="TorchScript file to write (default <model>.int8.pt)")
+    parser.add_argument("--threads", type=int, help="torch CPU threads while timing")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    try:
+        stats = optimize(args.model, args.crops, args.mode, args.tolerance, args.output)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    print(f"[LATENCY] ms per crop      batch 1   batch {BATCH}")
+    for variant in ("float", "fused", "int8"):
+        print(f"[LATENCY] {variant:<16} {stats[variant + '_ms']:8.3f}  {stats[variant + '_ms_batch']:8.3f}")
+    print(f"[LATENCY] int8 speed-up    {stats['float_ms'] / stats['int8_ms']:7.2f}x  "
+          f"{stats['float_ms_batch'] / stats['int8_ms_batch']:7.2f}x")
+    check = (f"softmax within {stats['max_diff']:.4f} of float (tolerance {args.tolerance}), "
+             f"labels agree on {stats['agreement'] * 100:.1f}%")
+    if not stats["passed"]:
+        print(f"[ERROR] int8 model rejected: {check}")
+        sys.exit(1)
+    print(f"[SUCCESS] {check}; wrote {stats['output']}")
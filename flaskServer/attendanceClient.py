@@ -0,0 +1,310 @@
+"""
+Background attendance client.
+
+Recognition never waits on the backend: attendance events are put on a queue
+and a sender thread posts them over one persistent requests.Session with
+timeouts and exponential-backoff retries. Events that arrive within a short
+window are coalesced into a single POST to the backend's batch route.
+
+A name counts as marked only after the backend confirms it; the on_confirmed
+callback is how the caller finds out.
+
+With an attendanceSpool.AttendanceSpool the events are written to disk first
+and the sender drains the spool instead of the in-memory queue. Delivery is
+then retried for as long as it takes; nothing is given up on unless the
+backend rejects it outright.
+"""
+
+import queue
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ------------------- Configuration -------------------
+REQUEST_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+MAX_RETRIES = 5               # Attempts per batch before giving up on it
+BACKOFF_BASE = 0.5            # First retry delay in seconds, doubled per attempt
+BACKOFF_MAX = 30.0            # Cap on a single retry delay
+BATCH_WINDOW = 0.25           # Seconds to wait for more events before sending
+MAX_BATCH_SIZE = 20           # Events per batched POST
+FAILURE_COOLDOWN = 10         # Seconds before a failed name may be submitted again
+FLUSH_INTERVAL = 5.0          # Seconds between spool checks when nothing new arrives
+# -----------------------------------------------------
+
+
+class RetryableError(Exception):
+    """The backend could not be reached or answered with a 5xx."""
+
+
+class AttendanceClient:
+    """
+    Queue attendance events and post them from a background thread.
+
+    Args:
+        api_url: Single-event route, e.g. http://localhost:3000/mark-attendance
+        batch_url: Batch route (defaults to api_url + "/batch"); if the backend
+            does not have it the client falls back to one POST per event
+        on_confirmed: on_confirmed(event) called from the sender thread once the
+            backend accepted an event
+        on_failed: on_failed(event, reason) called when an event is given up on
+        spool: Optional AttendanceSpool that makes queued events durable
+    """
+
+    def __init__(self, api_url, batch_url=None, on_confirmed=None, on_failed=None,
+                 timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, batch_window=BATCH_WINDOW, max_batch_size=MAX_BATCH_SIZE,
+                 failure_cooldown=FAILURE_COOLDOWN, spool=None, flush_interval=FLUSH_INTERVAL):
+        self.api_url = api_url
+        self.batch_url = batch_url or api_url.rstrip("/") + "/batch"
+        self.on_confirmed = on_confirmed
+        self.on_failed = on_failed
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.failure_cooldown = failure_cooldown
+        self.spool = spool
+        self.flush_interval = flush_interval
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self._batch_supported = True
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._cooldown_until = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+        # Set before the worker can start below: it updates them straight away
+        self.sent = 0
+        self.confirmed = 0
+        self.failed = 0
+        self.retries = 0
+
+        if spool is not None:
+            # Events left over from an earlier run are still on their way
+            self._pending.update(spool.pending_names())
+            if self._pending:
+                self._ensure_started()
+
+    # ------------------- Public API -------------------
+
+    def submit(self, name, payload):
+        """
+        Queue an attendance event for name. Returns False (and queues nothing)
+        if an event for name is already in flight or it failed recently.
+        """
+        with self._lock:
+            if name in self._pending:
+                return False
+            if time.monotonic() < self._cooldown_until.get(name, 0.0):
+                return False
+            self._pending.add(name)
+        self._ensure_started()
+        if self.spool is not None:
+            self.spool.append(name, payload)
+            self._wake.set()
+        else:
+            self._queue.put(dict(payload, name=name))
+        return True
+
+    def is_pending(self, name):
+        with self._lock:
+            return name in self._pending
+
+    def close(self, timeout=5.0):
+        """
+        Stop the sender after it has tried to send what is already queued.
+        Spooled events that could not be sent stay on disk for the next run.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._wake.set()
+            self._thread.join(timeout)
+        self._stop.set()
+        self.session.close()
+
+    def report(self):
+        report = {
+            "queued": self._queue.qsize(),
+            "pending": len(self._pending),
+            "sent": self.sent,
+            "confirmed": self.confirmed,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+        if self.spool is not None:
+            report["spool"] = self.spool.stats()
+        return report
+
+    # ------------------- Sender thread -------------------
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="attendance-sender", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if event is None:
+                self._queue.put(None)  # Let the outer loop see the stop marker
+                break
+            batch.append(event)
+        return batch
+
+    def _run(self):
+        if self.spool is not None:
+            self._run_spooled()
+            return
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch is None:
+                break
+            self._send_with_retries(batch)
+
+    def _run_spooled(self):
+        failures = 0
+        closing = False
+        while not self._stop.is_set():
+            if not closing:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                closing = not self._queue.empty()  # close() puts its stop marker here
+                # Give events arriving together a chance to share a POST
+                if not closing and self._stop.wait(self.batch_window):
+                    break
+
+            # Drain the spool in bulk until it is empty or the backend is down
+            while not self._stop.is_set():
+                batch = self.spool.take_batch(self.max_batch_size)
+                if not batch:
+                    failures = 0
+                    break
+                started = time.perf_counter()
+                count = len(batch)
+                try:
+                    self._post(batch)
+                except RetryableError as e:
+                    self.spool.record_flush(count - len(batch), time.perf_counter() - started)
+                    self.spool.note_attempt([event["event_id"] for event in batch], str(e))
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** failures))
+                    delay *= random.uniform(0.8, 1.2)
+                    failures += 1
+                    self.retries += 1
+                    print(f"⚠️ Attendance backend unavailable ({e}), "
+                          f"{self.spool.stats()['depth']} event(s) spooled, retrying in {delay:.1f}s")
+                    if closing or self._stop.wait(delay):
+                        return
+                    continue
+                self.spool.record_flush(count, time.perf_counter() - started)
+                failures = 0
+
+            if closing:
+                return
+
+    def _send_with_retries(self, batch):
+        for attempt in range(self.max_retries):
+            try:
+                self._post(batch)
+                return
+            except RetryableError as e:
+                # Events the backend already answered were removed from batch
+                if attempt == self.max_retries - 1:
+                    break
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                delay *= random.uniform(0.8, 1.2)
+                self.retries += 1
+                print(f"⚠️ Attendance backend unavailable ({e}), retrying in {delay:.1f}s")
+                if self._stop.wait(delay):
+                    break
+
+        for event in batch:
+            self._finish(event, False, "backend unavailable")
+        batch.clear()
+
+    def _post(self, batch):
+        """
+        Send the events in batch, finishing and removing each one the backend
+        answered. Raises RetryableError for connection problems and 5xx
+        answers, leaving the unanswered events (and, for the batch route,
+        those answered with a per-event 5xx) in batch.
+        """
+        self.sent += 1
+        if len(batch) > 1 and self._batch_supported:
+            response = self._request(self.batch_url, {"events": batch})
+            if response.status_code == 404:
+                # Older backend without the batch route
+                self._batch_supported = False
+            elif response.status_code >= 500:
+                raise RetryableError(f"HTTP {response.status_code}")
+            elif response.status_code != 200:
+                for event in batch:
+                    self._finish(event, False, f"HTTP {response.status_code}")
+                batch.clear()
+                return
+            else:
+                results = response.json().get("results", [])
+                retry = []
+                for i, event in enumerate(batch):
+                    result = results[i] if i < len(results) else {}
+                    status = result.get("status")
+                    if not isinstance(status, int) or status >= 500:
+                        # Server error on this event (the backend released its event_id): send it again
+                        retry.append(event)
+                        continue
+                    self._finish(event, status == 200, result.get("error") or f"HTTP {status}")
+                batch[:] = retry
+                if batch:
+                    raise RetryableError(f"{len(batch)} event(s) failed on the server")
+                return
+
+        while batch:
+            response = self._request(self.api_url, batch[0])
+            if response.status_code >= 500:
+                raise RetryableError(f"HTTP {response.status_code}")
+            self._finish(batch.pop(0), response.status_code == 200, f"HTTP {response.status_code}")
+
+    def _request(self, url, body):
+        try:
+            return self.session.post(url, json=body, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(type(e).__name__)
+
+    def _finish(self, event, ok, reason):
+        name = event["name"]
+        if self.spool is not None:
+            self.spool.mark(event["event_id"], ok, None if ok else reason)
+        with self._lock:
+            self._pending.discard(name)
+            if not ok:
+                self._cooldown_until[name] = time.monotonic() + self.failure_cooldown
+        if ok:
+            self.confirmed += 1
+            if self.on_confirmed is not None:
+                self.on_confirmed(event)
+        else:
+            self.failed += 1
+            if self.on_failed is not None:
+                self.on_failed(event, reason)
@@ -0,0 +1,165 @@
+"""
+Durable offline spool for attendance events.
+
+Every recognition event (with its PPE payload) is written to a local SQLite
+database in WAL mode before anything is sent, so an unreachable backend or a
+crash never loses it. The attendance client flushes the spool in bulk once the
+backend answers again.
+
+Each event carries a UUID event_id that is sent with it; the backend ignores
+an event_id it has already recorded, so replaying a batch whose answer was
+lost (crash between send and commit) does not record it twice. Locally, at
+most one unsent event per person per day is kept.
+
+Check how far behind the spool is while the recognizer runs:
+    python attendanceSpool.py [spool.db]
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# ------------------- Configuration -------------------
+SPOOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "attendance_spool.db")
+SENT_RETENTION_DAYS = 7  # Keep sent events this long for auditing / replay checks
+# -----------------------------------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT UNIQUE NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending' CHECK (state IN ('pending', 'sent', 'rejected')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    sent_at REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS events_pending_key ON events (dedupe_key) WHERE state = 'pending';
+CREATE INDEX IF NOT EXISTS events_state ON events (state, id);
+"""
+
+
+class AttendanceSpool:
+    """
+    SQLite-backed queue of attendance events.
+
+    Safe to share between threads; the recognizer writes and the attendance
+    client's sender thread reads and marks events.
+    """
+
+    def __init__(self, path=SPOOL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self.purge()
+
+        # Flush throughput, measured over the time spent actually sending
+        self.flushed_total = 0
+        self.flush_seconds = 0.0
+        self.last_flush_rate = 0.0
+
+    def append(self, name, payload):
+        """
+        Store one event. Returns (event_id, inserted); if an unsent event for
+        the same person and day already exists that one's id is returned with
+        inserted=False.
+        """
+        # Keyed on the day the person was seen, so backfilled events don't collide with today's
+        day = str(payload.get("recognized_at") or "")[:10] or datetime.now().date().isoformat()
+        dedupe_key = f"{name}|{day}"
+        event_id = uuid.uuid4().hex
+        body = json.dumps(dict(payload, name=name, event_id=event_id))
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO events (event_id, dedupe_key, name, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (event_id, dedupe_key, name, body, time.time()))
+            if cursor.rowcount == 1:
+                return event_id, True
+            row = self._conn.execute(
+                "SELECT event_id FROM events WHERE dedupe_key = ? AND state = 'pending'",
+                (dedupe_key,)).fetchone()
+        return (row[0] if row else None), False
+
+    def take_batch(self, limit):
+        """Oldest pending events as payload dicts (they stay pending until marked)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM events WHERE state = 'pending' ORDER BY id LIMIT ?",
+                (limit,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def pending_names(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT name FROM events WHERE state = 'pending'").fetchall()
+        return {row[0] for row in rows}
+
+    def mark(self, event_id, ok, error=None):
+        """Record the backend's answer: sent, or rejected (4xx, will not be retried)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE events SET state = ?, attempts = attempts + 1, last_error = ?, sent_at = ? "
+                "WHERE event_id = ?",
+                ("sent" if ok else "rejected", error, time.time(), event_id))
+
+    def note_attempt(self, event_ids, error):
+        """Count a failed delivery attempt for events that stay pending."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE events SET attempts = attempts + 1, last_error = ? WHERE event_id = ?",
+                [(error, event_id) for event_id in event_ids])
+
+    def record_flush(self, count, seconds):
+        self.flushed_total += count
+        self.flush_seconds += seconds
+        if seconds > 0:
+            self.last_flush_rate = count / seconds
+
+    def purge(self, retention_days=SENT_RETENTION_DAYS):
+        cutoff = time.time() - retention_days * 86400
+        with self._lock:
+            self._conn.execute("DELETE FROM events WHERE state != 'pending' AND sent_at < ?", (cutoff,))
+
+    def stats(self):
+        with self._lock:
+            depth, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM events WHERE state = 'pending'").fetchone()
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM events GROUP BY state").fetchall())
+        return {
+            "depth": depth,
+            "oldest_pending_age_s": time.time() - oldest if oldest else 0.0,
+            "sent": counts.get("sent", 0),
+            "rejected": counts.get("rejected", 0),
+            "flushed_this_run": self.flushed_total,
+            "flush_rate_eps": self.flushed_total / self.flush_seconds if self.flush_seconds else 0.0,
+            "last_flush_rate_eps": self.last_flush_rate,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    spool_path = sys.argv[1] if len(sys.argv) > 1 else SPOOL_PATH
+    if not os.path.exists(spool_path):
+        print(f"[ERROR] Spool not found: {spool_path}")
+        sys.exit(1)
+    spool = AttendanceSpool(spool_path)
+    stats = spool.stats()
+    print(f"[SPOOL] {spool_path}")
+    print(f"  pending events : {stats['depth']}")
+    print(f"  oldest pending : {stats['oldest_pending_age_s']:.0f}s ago")
+    print(f"  sent / rejected: {stats['sent']} / {stats['rejected']}")
+    spool.close()
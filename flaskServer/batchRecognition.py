@@ -0,0 +1,322 @@
+"""
+Offline batch recognition for recorded footage and image folders.
+
+Runs the same detection, embedding, matching, anti-spoof and PPE models as the
+live camera loop, without a display, over video files, image files or folders
+of images. Frames are decoded on a reader thread while the models work on the
+previous batch; each batch goes through MTCNN, ResNet and YOLO in one call
+per model.
+
+    python batchRecognition.py cctv/gate_0800.mp4 -o gate.jsonl --every 5
+    python batchRecognition.py snapshots/ -o audit.csv --no-spoof
+
+JSONL output has one record per processed frame (faces and PPE status); CSV
+has one row per face. Use --submit with --start-time to backfill attendance
+from a recording (each real, recognised person is sent once, stamped with the
+time they were seen).
+"""
+
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+import cv2
+
+import faceRecognition as fr
+from ppeDetection import summarize_ppe
+
+# ------------------- Configuration -------------------
+BATCH_SIZE = 16            # Frames per model call
+FRAME_STEP = 1             # Process every Nth video frame
+READ_AHEAD_BATCHES = 2     # Decoded batches buffered ahead of inference
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".mpg", ".mpeg", ".ts")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+# -----------------------------------------------------
+
+PPE_ITEMS = ("helmet", "gloves", "boots", "jacket")
+CSV_FIELDS = ["source", "frame", "timestamp_s", "name", "confidence", "is_real",
+              "x1", "y1", "x2", "y2", "ppe_compliant"] + list(PPE_ITEMS)
+
+
+class FrameItem:
+    """One decoded frame and where it came from."""
+
+    __slots__ = ("source", "frame_index", "timestamp_s", "frame")
+
+    def __init__(self, source, frame_index, timestamp_s, frame):
+        self.source = source
+        self.frame_index = frame_index
+        self.timestamp_s = timestamp_s
+        self.frame = frame
+
+
+def expand_inputs(paths):
+    """Video and image files for a list of files and directories (directories sorted)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(VIDEO_EXTENSIONS + IMAGE_EXTENSIONS):
+                    files.append(os.path.join(path, name))
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            print(f"[WARNING] Input not found: {path}")
+    return files
+
+
+def iter_frames(paths, frame_step=FRAME_STEP):
+    """Yield a FrameItem for every image and every frame_step-th video frame."""
+    for path in expand_inputs(paths):
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            frame = cv2.imread(path)
+            if frame is None:
+                print(f"[WARNING] Could not read image: {path}")
+                continue
+            yield FrameItem(path, 0, None, frame)
+            continue
+
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"[WARNING] Could not open video: {path}")
+            continue
+        frame_index = 0
+        while True:
+            # grab() skips decoding the frames we don't process
+            if frame_index % frame_step:
+                if not cap.grab():
+                    break
+                frame_index += 1
+                continue
+            ok, frame = cap.read()
+            if not ok:
+                break
+            yield FrameItem(path, frame_index, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame)
+            frame_index += 1
+        cap.release()
+
+
+def iter_batches(items, batch_size=BATCH_SIZE):
+    """Group consecutive frames of the same size (MTCNN batches need one size)."""
+    batch = []
+    for item in items:
+        if batch and (len(batch) == batch_size or item.frame.shape != batch[0].frame.shape):
+            yield batch
+            batch = []
+        batch.append(item)
+    if batch:
+        yield batch
+
+
+def read_ahead(batches, depth=READ_AHEAD_BATCHES):
+    """Decode on a background thread so the models never wait on the video decoder."""
+    buffer = queue.Queue(maxsize=depth)
+    done = object()
+
+    def reader():
+        try:
+            for batch in batches:
+                buffer.put(batch)
+        finally:
+            buffer.put(done)
+
+    threading.Thread(target=reader, name="batch-reader", daemon=True).start()
+    while True:
+        batch = buffer.get()
+        if batch is done:
+            return
+        yield batch
+
+
+def process_batch(items, check_spoof=True, check_ppe=True):
+    """
+    Run the models on a batch of same-sized frames.
+
+    Returns:
+        list: one record per frame with source, frame, timestamp_s, faces
+        (name, confidence, box, is_real) and the frame's PPE status
+    """
+    rgb_frames = [cv2.cvtColor(item.frame, cv2.COLOR_BGR2RGB) for item in items]
+    boxes_per_frame = fr.engine.detect_faces_batch(rgb_frames)
+
+    # Every face of the batch goes through ResNet and the matcher together
+    crops, owners = [], []
+    for f, (rgb, boxes) in enumerate(zip(rgb_frames, boxes_per_frame)):
+        frame_crops, kept = fr.engine.crop_faces(rgb, boxes)
+        crops.extend(frame_crops)
+        owners.extend((f, i) for i in kept)
+    embeddings = fr.engine.embed_crops(crops)
+    matches = fr.engine.match_embeddings(embeddings) if len(embeddings) else []
+
+    if check_ppe:
+        ppe = fr.engine.check_ppe_batch([item.frame for item in items])
+    else:
+        ppe = [(None, None, {}) for _ in items]
+
+    records = []
+    for item, (_, ppe_compliant, ppe_compliance_dict) in zip(items, ppe):
+        ppe_items, ppe_confidence = summarize_ppe(ppe_compliance_dict)
+        records.append({
+            "source": item.source,
+            "frame": item.frame_index,
+            "timestamp_s": item.timestamp_s,
+            "faces": [],
+            "ppe_compliant": ppe_compliant,
+            "ppe_items": ppe_items,
+            "ppe_confidence": ppe_confidence,
+        })
+
+    # One anti-spoof forward per frame, over the faces that got an embedding
+    real = {}
+    if check_spoof:
+        faces_of = {}
+        for f, i in owners:
+            faces_of.setdefault(f, []).append(i)
+        for f, indices in faces_of.items():
+            flags = fr.engine.are_real_faces(items[f].frame, [boxes_per_frame[f][i] for i in indices])
+            real.update(((f, i), flag) for i, flag in zip(indices, flags))
+
+    for (f, i), (name, confidence) in zip(owners, matches):
+        box = boxes_per_frame[f][i]
+        is_real = real.get((f, i))
+        records[f]["faces"].append({
+            "name": name,
+            "confidence": round(float(confidence), 4),
+            "box": [round(float(v), 1) for v in box],
+            "is_real": None if is_real is None else bool(is_real),
+        })
+    return records
+
+
+class ResultWriter:
+    """Write frame records as JSONL (one per frame) or CSV (one row per face), by file extension."""
+
+    def __init__(self, path):
+        self.path = path
+        self.csv = path.lower().endswith(".csv")
+        self._file = open(path, "w", newline="" if self.csv else None, encoding="utf-8")
+        if self.csv:
+            self._writer = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+            self._writer.writeheader()
+
+    def write(self, record):
+        if not self.csv:
+            self._file.write(json.dumps(record) + "\n")
+            return
+        for face in record["faces"]:
+            row = {
+                "source": record["source"],
+                "frame": record["frame"],
+                "timestamp_s": record["timestamp_s"],
+                "name": face["name"],
+                "confidence": face["confidence"],
+                "is_real": face["is_real"],
+                "ppe_compliant": record["ppe_compliant"],
+            }
+            row.update(zip(("x1", "y1", "x2", "y2"), face["box"]))
+            row.update((item, record["ppe_items"].get(item)) for item in PPE_ITEMS)
+            self._writer.writerow(row)
+
+    def close(self):
+        self._file.close()
+
+
+def seen_at(record, start_time):
+    """Wall-clock time of a record: start_time + video offset, else the image file's mtime."""
+    if record["timestamp_s"] is not None:
+        return start_time + timedelta(seconds=record["timestamp_s"]) if start_time else None
+    return datetime.fromtimestamp(os.path.getmtime(record["source"]))
+
+
+def run(paths, output, batch_size=BATCH_SIZE, frame_step=FRAME_STEP, check_spoof=True, check_ppe=True,
+        submit=False, start_time=None):
+    """
+    Process every input and write the results to output.
+
+    Returns:
+        dict with frames, faces, seconds, frames_per_s, faces_per_s and submitted
+    """
+    writer = ResultWriter(output)
+    frames = faces = submitted = 0
+    submitted_names = set()
+    started = time.perf_counter()
+    try:
+        for batch in read_ahead(iter_batches(iter_frames(paths, frame_step), batch_size)):
+            for record in process_batch(batch, check_spoof, check_ppe):
+                writer.write(record)
+                frames += 1
+                faces += len(record["faces"])
+                if not submit:
+                    continue
+                for face in record["faces"]:
+                    name = face["name"]
+                    if name == "Unknown" or face["is_real"] is False or name in submitted_names:
+                        continue
+                    recognized_at = seen_at(record, start_time)
+                    if recognized_at is None:
+                        continue
+                    # PPE not checked (--no-ppe) counts as compliant, as a failed check does live
+                    ppe_compliant = record["ppe_compliant"] is not False
+                    if fr.mark_attendance(name, recognized_at, 0.0, ppe_compliant=ppe_compliant,
+                                          ppe_items=record["ppe_items"], ppe_confidence=record["ppe_confidence"]):
+                        submitted_names.add(name)
+                        submitted += 1
+            elapsed = time.perf_counter() - started
+            print(f"[BATCH] {frames} frames, {faces} faces, {frames / elapsed:.1f} frames/s", end="\r")
+    finally:
+        writer.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "frames": frames,
+        "faces": faces,
+        "seconds": seconds,
+        "frames_per_s": frames / seconds if seconds else 0.0,
+        "faces_per_s": faces / seconds if seconds else 0.0,
+        "submitted": submitted,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run recognition, anti-spoof and PPE over recorded footage")
+    parser.add_argument("inputs", nargs="+", help="Video files, image files or directories")
+    parser.add_argument("-o", "--output", required=True, help="Results file (.jsonl or .csv)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--every", type=int, default=FRAME_STEP, help="Process every Nth video frame")
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = torch default)")
+    parser.add_argument("--no-spoof", action="store_true", help="Skip anti-spoofing")
+    parser.add_argument("--no-ppe", action="store_true", help="Skip PPE detection")
+    parser.add_argument("--submit", action="store_true", help="Backfill attendance for recognised people")
+    parser.add_argument("--start-time", help="Wall-clock start of the videos (ISO 8601), needed with --submit")
+    args = parser.parse_args()
+
+    if args.threads:
+        fr.engine.torch.set_num_threads(args.threads)
+    # Load up front so the throughput figures don't include model loading
+    components = ["mtcnn", "resnet", "gallery"]
+    if not args.no_spoof:
+        components.append("anti_spoof")
+    if not args.no_ppe:
+        components.append("ppe")
+    fr.engine.load(components)
+    print(fr.engine.startup_report())
+    video_start = datetime.fromisoformat(args.start_time) if args.start_time else None
+    if args.submit and video_start is None:
+        print("[WARNING] No --start-time given; only image files (stamped with their mtime) will be submitted")
+
+    stats = run(args.inputs, args.output, args.batch_size, max(1, args.every),
+                check_spoof=not args.no_spoof, check_ppe=not args.no_ppe,
+                submit=args.submit, start_time=video_start)
+    print()
+    print(f"[BATCH] {stats['frames']} frames, {stats['faces']} faces in {stats['seconds']:.1f}s: "
+          f"{stats['frames_per_s']:.2f} frames/s, {stats['faces_per_s']:.2f} faces/s -> {args.output}")
+    if args.submit:
+        print(f"[BATCH] Submitted attendance for {stats['submitted']} person(s)")
+        attendance_client = fr.get_attendance_client()
+        attendance_client.close()
+        print(f"[ATTENDANCE] {attendance_client.report()}")
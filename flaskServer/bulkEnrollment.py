@@ -0,0 +1,382 @@
+"""
+Bulk enrollment for onboarding a whole site.
+
+Takes a root of person folders (the backend/uploads layout) and writes the
+binary gallery the recognizer loads. Images are decoded on a thread pool one
+chunk ahead of the models; MTCNN runs on batches of same-sized photos and every
+first-face crop of a chunk goes through ResNet together, instead of
+generate_embeddings' one decode, one detect and one forward per image.
+
+Every finished person is checkpointed, so an interrupted run picks up where it
+stopped. A person is done again if their photos change (names, sizes or
+mtimes). Photos already in the embedding cache (embeddingCache.py) for the
+current model are neither decoded nor embedded again. Faces go through the
+same quality gate as generate_embeddings (faceQuality) before the ResNet
+pass, and each template's quality is stored in the gallery.
+
+    python bulkEnrollment.py ../backend/uploads ./gallery --workers 8
+    python bulkEnrollment.py ../backend/uploads ./gallery --int8 --csv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from embeddingCache import EmbeddingCache, file_hash, model_version
+from faceQuality import QUALITY_GATE, assess_faces, config_signature
+from gallery import STORAGE_DTYPES, Gallery, l2_normalize, write_quality_csv
+from recognitionEngine import RecognitionEngine
+
+# ------------------- Configuration -------------------
+DECODE_WORKERS = 8          # Threads decoding images (cv2 releases the GIL)
+IMAGES_PER_CHUNK = 64       # Images decoded and embedded per step (whole people per chunk)
+DETECT_BATCH_SIZE = 8       # Same-sized photos per MTCNN call
+EMBED_BATCH_SIZE = 64       # Face crops per ResNet forward
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')  # Same as createEmbeddings.py
+CHECKPOINT_DIR = "checkpoint"  # Inside the gallery directory unless --checkpoint is given
+# -----------------------------------------------------
+
+PROGRESS_FILE = "progress.jsonl"
+META_FILE = "meta.json"
+
+
+def folder_signature(paths):
+    """Changes whenever a photo is added, removed or rewritten."""
+    entries = []
+    for path in paths:
+        stat = os.stat(path)
+        entries.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha1(json.dumps(entries).encode("utf-8")).hexdigest()
+
+
+class EnrollmentCheckpoint:
+    """
+    Per-person results of a bulk run.
+
+    <path>/progress.jsonl has one line per finished person (name, photo
+    signature, counts, template qualities, embeddings file); <path>/<n>.npy
+    holds their embeddings. The .npy is in place before its line is appended, and a torn
+    last line from a crash is dropped on load.
+    """
+
+    def __init__(self, path, root):
+        self.path = path
+        self.done = {}
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, META_FILE)
+        root = os.path.realpath(root)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("root") != root:
+                raise ValueError(f"Checkpoint {path} belongs to {meta.get('root')}; use --restart to discard it")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"root": root}, f)
+
+        progress_path = os.path.join(path, PROGRESS_FILE)
+        lines = []
+        if os.path.exists(progress_path):
+            with open(progress_path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        valid = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            self.done[record["name"]] = record
+            valid.append(line)
+        if len(valid) != len(lines):
+            # Rewrite without the torn line so new records don't land after it
+            with open(progress_path, "w", encoding="utf-8") as f:
+                f.write("".join(line + "\n" for line in valid))
+        self._file = open(progress_path, "a", encoding="utf-8")
+        self._next_file = len(valid)
+
+    def is_done(self, name, signature):
+        record = self.done.get(name)
+        return record is not None and record["signature"] == signature
+
+    def record(self, name, signature, images, embeddings, qualities):
+        file_name = None
+        if len(embeddings):
+            file_name = f"{self._next_file:06d}.npy"
+            final_path = os.path.join(self.path, file_name)
+            with open(final_path + ".tmp", "wb") as f:
+                np.save(f, np.asarray(embeddings, dtype=np.float32))
+            os.replace(final_path + ".tmp", final_path)
+        self._next_file += 1
+
+        record = {"name": name, "signature": signature, "images": images, "embeddings": len(embeddings),
+                  "quality": [round(float(q), 4) for q in qualities], "file": file_name}
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done[name] = record
+
+    def templates(self, name):
+        """(embeddings (K, 512), qualities (K,)) recorded for a person."""
+        record = self.done[name]
+        if not record["file"]:
+            return np.empty((0, 512), dtype=np.float32), np.empty(0, dtype=np.float32)
+        return np.load(os.path.join(self.path, record["file"])), np.asarray(record["quality"], dtype=np.float32)
+
+    def close(self):
+        self._file.close()
+
+
+def list_people(root):
+    """(name, sorted image paths) for every person folder under root that has photos."""
+    people = []
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        if not os.path.isdir(folder):
+            continue
+        files = sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+        if files:
+            people.append((name, [os.path.join(folder, f) for f in files]))
+    return people
+
+
+def chunk_people(people, images_per_chunk=IMAGES_PER_CHUNK):
+    """Group whole people into chunks of about images_per_chunk images."""
+    chunk, count = [], 0
+    for person in people:
+        chunk.append(person)
+        count += len(person[1])
+        if count >= images_per_chunk:
+            yield chunk
+            chunk, count = [], 0
+    if chunk:
+        yield chunk
+
+
+def read_image(path, cache=None):
+    """
+    Returns:
+        tuple: (content hash, cache hit, cached embedding or None, cached
+        quality or None, RGB image or None); cache hits are not decoded
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    content_hash = file_hash(data)
+    if cache is not None:
+        hit, embedding, quality = cache.get(content_hash)
+        if hit:
+            return content_hash, True, embedding, quality, None
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return content_hash, False, None, None, None
+    return content_hash, False, None, None, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def embed_images(engine, images, detect_batch_size=DETECT_BATCH_SIZE, embed_batch_size=EMBED_BATCH_SIZE):
+    """
+    Quality-gated embedding of the first detected face of every RGB image, as
+    generate_embeddings computes it.
+
+    Returns:
+        list: one (L2-normalised (512,) array or None, quality or None) pair
+        per image; the embedding is None where the image was unreadable, had
+        no face or failed the quality gate
+    """
+    # MTCNN batches need one image size
+    detections = [None] * len(images)
+    by_shape = {}
+    for i, image in enumerate(images):
+        if image is not None:
+            by_shape.setdefault(image.shape, []).append(i)
+    for indices in by_shape.values():
+        for start in range(0, len(indices), detect_batch_size):
+            part = indices[start:start + detect_batch_size]
+            for i, detection in zip(part, engine.detect_faces_detailed_batch([images[i] for i in part])):
+                detections[i] = detection
+
+    results = [(None, None)] * len(images)
+    crops, owners = [], []
+    for i, detection in enumerate(detections):
+        if detection is None or len(detection[0]) == 0:
+            continue
+        boxes, probs, landmarks = detection
+        report = assess_faces(images[i], boxes[:1], probs[:1], landmarks[:1])
+        quality = float(report["quality"][0])
+        results[i] = (None, quality)
+        if QUALITY_GATE == "reject" and not report["accepted"][0]:
+            continue
+        faces, _ = engine.crop_faces(images[i], boxes[:1])
+        if faces:
+            crops.extend(faces)
+            owners.append(i)
+
+    for start in range(0, len(crops), embed_batch_size):
+        embeddings = engine.embed_crops(crops[start:start + embed_batch_size])
+        for i, embedding in zip(owners[start:start + embed_batch_size], embeddings):
+            results[i] = (embedding, results[i][1])
+    return results
+
+
+def write_csv(folder, embeddings, qualities):
+    """embeddings.csv and quality.csv as createEmbeddings.py writes them, for the CSV fallback and the backend."""
+    write_quality_csv(folder, qualities)
+    np.savetxt(os.path.join(folder, "embeddings.csv"), embeddings, delimiter=",", fmt="%.9g")
+
+
+def run(root, gallery_dir, engine=None, workers=DECODE_WORKERS, images_per_chunk=IMAGES_PER_CHUNK,
+        detect_batch_size=DETECT_BATCH_SIZE, embed_batch_size=EMBED_BATCH_SIZE, dtype="float32",
+        checkpoint_dir=None, csv=False, keep_checkpoint=False, use_cache=True):
+    """
+    Enroll every person folder under root into the gallery at gallery_dir.
+
+    Returns:
+        dict with people, images, embeddings, rejected (images failing the
+        quality gate), resumed, failed (names without a usable face), seconds
+        and images_per_s
+    """
+    checkpoint_dir = checkpoint_dir or os.path.join(gallery_dir, CHECKPOINT_DIR)
+    checkpoint = EnrollmentCheckpoint(checkpoint_dir, root)
+    people = list_people(root)
+    signatures = {name: folder_signature(paths) for name, paths in people}
+    todo = [(name, paths) for name, paths in people if not checkpoint.is_done(name, signatures[name])]
+    resumed = len(people) - len(todo)
+    total_images = sum(len(paths) for _, paths in todo)
+    print(f"[INFO] {len(people)} person(s) under {root}: {resumed} already done, "
+          f"{len(todo)} to enroll ({total_images} images)")
+
+    if engine is None:
+        engine = RecognitionEngine()
+    cache = None
+    if todo:
+        engine.load(("mtcnn", "resnet"))
+        if use_cache:
+            cache = EmbeddingCache(version=model_version(engine.mtcnn, engine.resnet, extra=config_signature()))
+
+    started = time.perf_counter()
+    images_done = 0
+    rejected = 0
+    chunks = list(chunk_people(todo, images_per_chunk))
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            def submit(chunk):
+                return [pool.submit(read_image, path, cache) for _, paths in chunk for path in paths]
+
+            # Decode the next chunk while the models work on this one
+            upcoming = submit(chunks[0]) if chunks else []
+            for n, chunk in enumerate(chunks):
+                futures = upcoming
+                upcoming = submit(chunks[n + 1]) if n + 1 < len(chunks) else []
+                items = [future.result() for future in futures]
+                templates = [(embedding, quality) for _, _, embedding, quality, _ in items]
+                misses = [i for i, item in enumerate(items) if not item[1]]
+                computed = embed_images(engine, [items[i][4] for i in misses], detect_batch_size, embed_batch_size)
+                for i, template in zip(misses, computed):
+                    templates[i] = template
+                rejected += sum(1 for embedding, quality in templates if embedding is None and quality is not None)
+                if cache is not None:
+                    # Unreadable files are not cached; a readable photo without a (good) face is
+                    cache.put_many((items[i][0], embedding, quality) for i, (embedding, quality) in zip(misses, computed)
+                                   if items[i][4] is not None)
+
+                start = 0
+                for name, paths in chunk:
+                    kept = [(e, 1.0 if q is None else q) for e, q in templates[start:start + len(paths)]
+                            if e is not None]
+                    start += len(paths)
+                    rows = [e for e, _ in kept]
+                    qualities = [q for _, q in kept]
+                    checkpoint.record(name, signatures[name], len(paths), rows, qualities)
+                    if csv and rows:
+                        write_csv(os.path.dirname(paths[0]), rows, qualities)
+
+                images_done += len(items)
+                elapsed = time.perf_counter() - started
+                print(f"[ENROLL] {images_done}/{total_images} images, "
+                      f"{images_done / elapsed:.1f} images/s", end="\r")
+        if chunks:
+            print()
+    finally:
+        checkpoint.close()
+        if cache is not None:
+            print(f"[INFO] Embedding {cache.report()}")
+            cache.close()
+
+    # The gallery is built from the checkpoint, so resumed people cost nothing
+    blocks, qualities, labels, names, failed = [], [], [], [], []
+    for name, _ in people:
+        block, quality = checkpoint.templates(name)
+        if len(block) == 0:
+            failed.append(name)
+            continue
+        labels.append(np.full(len(block), len(names), dtype=np.int32))
+        names.append(name)
+        blocks.append(block)
+        qualities.append(quality)
+    if blocks:
+        gallery = Gallery(l2_normalize(np.concatenate(blocks)), np.concatenate(labels), names,
+                          quality=np.concatenate(qualities))
+    else:
+        gallery = Gallery(np.empty((0, 512), dtype=np.float32), [], [])
+    gallery.save(gallery_dir, dtype=dtype)
+    if not keep_checkpoint:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    seconds = time.perf_counter() - started
+    return {
+        "people": len(names),
+        "images": images_done,
+        "embeddings": len(gallery),
+        "rejected": rejected,
+        "resumed": resumed,
+        "failed": failed,
+        "seconds": seconds,
+        "images_per_s": images_done / seconds if seconds else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enroll a root of person folders into the binary gallery")
+    parser.add_argument("root", help="Folder with one sub-folder of photos per person")
+    parser.add_argument("gallery", help="Gallery directory to write")
+    parser.add_argument("--workers", type=int, default=DECODE_WORKERS, help="Image decode threads")
+    parser.add_argument("--chunk", type=int, default=IMAGES_PER_CHUNK, help="Images per step")
+    parser.add_argument("--detect-batch", type=int, default=DETECT_BATCH_SIZE)
+    parser.add_argument("--embed-batch", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--checkpoint", help=f"Checkpoint directory (default <gallery>/{CHECKPOINT_DIR})")
+    parser.add_argument("--restart", action="store_true", help="Discard the checkpoint and start over")
+    parser.add_argument("--keep-checkpoint", action="store_true", help="Keep the checkpoint after success")
+    parser.add_argument("--csv", action="store_true", help="Also write each person's embeddings.csv")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the embedding cache")
+    storage = parser.add_mutually_exclusive_group()
+    storage.add_argument("--float16", action="store_const", dest="dtype", const="float16")
+    storage.add_argument("--int8", action="store_const", dest="dtype", const="int8")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or os.path.join(args.gallery, CHECKPOINT_DIR)
+    if args.restart:
+        shutil.rmtree(checkpoint_path, ignore_errors=True)
+    try:
+        stats = run(args.root, args.gallery, workers=args.workers, images_per_chunk=args.chunk,
+                    detect_batch_size=args.detect_batch, embed_batch_size=args.embed_batch,
+                    dtype=args.dtype or STORAGE_DTYPES[0], checkpoint_dir=checkpoint_path, csv=args.csv,
+                    keep_checkpoint=args.keep_checkpoint, use_cache=not args.no_cache)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"\n[INFO] Interrupted; run the same command again to resume from {checkpoint_path}")
+        sys.exit(130)
+
+    print(f"[SUCCESS] {stats['embeddings']} templates for {stats['people']} person(s) written to {args.gallery} "
+          f"({stats['images']} images in {stats['seconds']:.1f}s, {stats['images_per_s']:.1f} images/s, "
+          f"{stats['resumed']} resumed, {stats['rejected']} rejected by the quality gate)")
+    if stats["failed"]:
+        print(f"[WARNING] No usable face for {len(stats['failed'])} person(s): {', '.join(stats['failed'][:20])}")
@@ -1,4 +1,6 @@
 import os
+import threading
+import time
 import cv2
 import numpy as np
 import pandas as pd
@@ -7,62 +9,179 @@ import torch
 from facenet_pytorch import InceptionResnetV1, MTCNN
 from sklearn.preprocessing import normalize
 
-# Initialize models (same as faceRecognition.py)
+from embeddingCache import EmbeddingCache, file_hash, model_version
+from faceQuality import QUALITY_GATE, assess_faces, config_signature
+from gallery import write_quality_csv
+from onnxBackend import OrtModule, embedding_onnx_path, stage_backend
+
+# Models (same as faceRecognition.py) are loaded on first use, so the enrollment
+# worker can import this module and keep one warm copy for every registration
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
-mtcnn = MTCNN(keep_all=True, device=device)
-resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
+mtcnn = None
+resnet = None
+_models_lock = threading.Lock()
+
+def load_models():
+    global mtcnn, resnet
+    with _models_lock:
+        if resnet is None:
+            mtcnn = MTCNN(keep_all=True, device=device)
+            if stage_backend("embedding") == "onnx":
+                resnet = OrtModule(embedding_onnx_path())
+            else:
+                resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
+    return mtcnn, resnet
+
+_cache = None
+
+def get_cache():
+    """The shared embedding cache, keyed to the loaded model weights."""
+    global _cache
+    load_models()
+    with _models_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(version=model_version(mtcnn, resnet, extra=config_signature()))
+    return _cache
+
+def embed_image(rgb_image):
+    """
+    Quality-gated embedding of the first face of an RGB image.
+
+    Returns:
+        tuple: (L2-normalised embedding or None, quality or None, reason when
+        there is no embedding or the face was flagged as low quality)
+    """
+    with torch.no_grad():
+        boxes, probs, landmarks = mtcnn.detect(rgb_image, landmarks=True)
+        if boxes is None or len(boxes) == 0:
+            return None, None, "No face detected"
+
+        # Use the first detected face, scored before it goes through ResNet
+        box = boxes[0]
+        report = assess_faces(rgb_image, boxes[:1], probs[:1], landmarks[:1])
+        quality = float(report["quality"][0])
+        reason = None
+        if not report["accepted"][0]:
+            reason = f"Low quality {quality:.2f} ({', '.join(report['reasons'][0])})"
+            if QUALITY_GATE == "reject":
+                return None, quality, reason
+
+        x1, y1, x2, y2 = map(int, box)
+        face = rgb_image[y1:y2, x1:x2]
+
+        if face.size == 0:
+            return None, quality, "Empty face crop"
+
+        # Resize to 160x160 (same as faceRecognition.py)
+        face = cv2.resize(face, (160, 160))
+        face = np.transpose(face, (2, 0, 1)).astype(np.float32) / 255.0
+        face_tensor = torch.tensor(face).unsqueeze(0).to(device)
+
+        # Generate embedding
+        encoding = resnet(face_tensor).cpu().detach().numpy().flatten()
+    return normalize([encoding])[0].astype(np.float32), quality, reason
+
+def generate_embeddings(person_folder, use_cache=True):
+    """
+    Embed the first face of every image in person_folder and write
+    embeddings.csv, plus each template's quality to quality.csv, there.
+    Faces failing the quality gate (faceQuality) are skipped or flagged before
+    they are embedded. Images whose bytes are already in the embedding cache
+    for the current model are not decoded or embedded again.
+
+    Returns:
+        dict with images, embeddings, skipped, cached (cache hits), qualities,
+        csv_path (None if nothing was written) and per-stage seconds (load,
+        read, decode, embed, write)
+    """
+    timings = {"load": 0.0, "read": 0.0, "decode": 0.0, "embed": 0.0, "write": 0.0}
+    start = time.perf_counter()
+    load_models()
+    cache = get_cache() if use_cache else None
+    timings["load"] = time.perf_counter() - start
 
-def generate_embeddings(person_folder):
     embeddings = []
+    qualities = []
     image_names = []
+    images = 0
+    cached = 0
+    new_entries = []
 
-    for file_name in os.listdir(person_folder):
+    for file_name in sorted(os.listdir(person_folder)):
         file_path = os.path.join(person_folder, file_name)
-        if file_name.lower().endswith(('.png', '.jpg', '.jpeg')):
-            image = cv2.imread(file_path)
-            if image is None:
-                print(f"[WARNING] Could not read image: {file_name}")
-                continue
-            
-            # Convert BGR to RGB
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Detect face using MTCNN
-            with torch.no_grad():
-                boxes, _ = mtcnn.detect(rgb_image)
-                if boxes is None or len(boxes) == 0:
-                    print(f"[WARNING] No face detected in: {file_name}")
-                    continue
-                
-                # Use the first detected face
-                box = boxes[0]
-                x1, y1, x2, y2 = map(int, box)
-                face = rgb_image[y1:y2, x1:x2]
-                
-                if face.size == 0:
-                    print(f"[WARNING] Empty face crop in: {file_name}")
+        if not file_name.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        images += 1
+
+        step = time.perf_counter()
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        content_hash = file_hash(data)
+        timings["read"] += time.perf_counter() - step
+
+        if cache is not None:
+            hit, embedding, quality = cache.get(content_hash)
+            if hit:
+                cached += 1
+                if embedding is None:
+                    print(f"[WARNING] No usable face in: {file_name} (cached)")
                     continue
-                
-                # Resize to 160x160 (same as faceRecognition.py)
-                face = cv2.resize(face, (160, 160))
-                face = np.transpose(face, (2, 0, 1)).astype(np.float32) / 255.0
-                face_tensor = torch.tensor(face).unsqueeze(0).to(device)
-                
-                # Generate embedding
-                encoding = resnet(face_tensor).cpu().detach().numpy().flatten()
-                embedding = normalize([encoding])[0]
                 embeddings.append(embedding)
+                qualities.append(1.0 if quality is None else quality)
                 image_names.append(file_name)
-                print(f"[SUCCESS] Generated embedding for: {file_name}")
+                print(f"[SUCCESS] Cached embedding for: {file_name}")
+                continue
 
+        step = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        timings["decode"] += time.perf_counter() - step
+        if image is None:
+            print(f"[WARNING] Could not read image: {file_name}")
+            continue
+
+        # Convert BGR to RGB
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+        step = time.perf_counter()
+        embedding, quality, reason = embed_image(rgb_image)
+        timings["embed"] += time.perf_counter() - step
+        new_entries.append((content_hash, embedding, quality))
+        if embedding is None:
+            print(f"[WARNING] {reason} in: {file_name}")
+            continue
+        if reason:
+            print(f"[WARNING] {reason} in: {file_name} (kept, flagged)")
+        embeddings.append(embedding)
+        qualities.append(quality)
+        image_names.append(file_name)
+        print(f"[SUCCESS] Generated embedding for: {file_name} (quality {quality:.2f})")
+
+    if cache is not None:
+        cache.put_many(new_entries)
+
+    csv_path = None
     if embeddings:
+        step = time.perf_counter()
+        # Qualities first: the gallery watcher reloads a person when embeddings.csv changes
+        write_quality_csv(person_folder, qualities)
         df = pd.DataFrame(embeddings)
         csv_path = os.path.join(person_folder, 'embeddings.csv')
         df.to_csv(csv_path, index=False, header=False)
-        print(f"[SUCCESS] Embeddings saved to {csv_path} ({len(embeddings)} embeddings)")
+        timings["write"] = time.perf_counter() - step
+        print(f"[SUCCESS] Embeddings saved to {csv_path} ({len(embeddings)} embeddings, {cached} from cache)")
     else:
         print("[ERROR] No embeddings were generated.")
 
+    return {
+        "images": images,
+        "embeddings": len(embeddings),
+        "skipped": images - len(embeddings),
+        "cached": cached,
+        "qualities": [round(float(q), 3) for q in qualities],
+        "csv_path": csv_path,
+        "timings": timings,
+    }
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("[ERROR] Folder path not provided.")
@@ -70,4 +189,4 @@ if __name__ == "__main__":
     
     folder_path = sys.argv[1]
     print(f"[INFO] Generating embeddings for: {folder_path}")
-    generate_embeddings(folder_path)
\ No newline at end of file
+    generate_embeddings(folder_path, use_cache="--no-cache" not in sys.argv[2:])
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Per-image embedding cache for enrollment.
+
+Maps (SHA-256 of the image file's bytes, model version) to the embedding
+generate_embeddings computed for it and its quality score (faceQuality), or
+to "no usable face". Re-enrolling a folder only detects and embeds new or
+changed photos; unchanged ones are read back from a local SQLite database.
+
+The model version is a fingerprint of the loaded MTCNN and ResNet weights,
+PREPROCESS_VERSION and the quality gate settings, so new weights or a new gate
+invalidate the cache on their own; bump PREPROCESS_VERSION when cropping or
+normalisation changes. Rows are keyed by version and rows of other versions
+are kept, since the recognition worker, bulk enrollment and the torch / ONNX
+backends may each run a different one against the same file. Every open
+records when its version was last used; prune() (or the command below) drops
+versions nobody has used for CACHE_MAX_AGE_DAYS.
+
+    python embeddingCache.py [embedding_cache.db]                 # entry counts per version
+    python embeddingCache.py [embedding_cache.db] --prune [DAYS]  # drop versions unused that long
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+# ------------------- Configuration -------------------
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.db")
+PREPROCESS_VERSION = 1  # First face, 160x160 resize, /255, L2-normalised
+CACHE_MAX_AGE_DAYS = 30  # prune() drops versions not used for this long
+# -----------------------------------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    content_hash TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    embedding BLOB,
+    quality REAL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (content_hash, model_version)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    model_version TEXT PRIMARY KEY,
+    last_used REAL NOT NULL
+);
+"""
+
+
+def file_hash(data):
+    """Cache key of an image file's bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def model_version(*models, extra=""):
+    """Fingerprint of the weights of the given torch modules, PREPROCESS_VERSION and extra."""
+    digest = hashlib.sha1(f"preprocess-{PREPROCESS_VERSION}|{extra}".encode("utf-8"))
+    for model in models:
+        if hasattr(model, "fingerprint"):
+            # onnxBackend.OrtModule: hash of the graph file
+            digest.update(model.fingerprint().encode("utf-8"))
+            continue
+        for name, tensor in model.state_dict().items():
+            digest.update(name.encode("utf-8"))
+            digest.update(tensor.detach().cpu().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed (content hash, model version) -> embedding map.
+
+    Safe to share between threads. A cached None embedding means the image was
+    read but had no usable face (quality is None too if none was detected);
+    unreadable files are never cached.
+    """
+
+    def __init__(self, path=CACHE_PATH, version=""):
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+        if "quality" not in columns:
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN quality REAL")
+        # Other versions' rows stay: another process may still be using them (see prune)
+        self._conn.execute("INSERT OR REPLACE INTO versions (model_version, last_used) VALUES (?, ?)",
+                           (version, time.time()))
+
+    def get(self, content_hash):
+        """(hit, embedding or None, quality or None)."""
+        return self.get_many([content_hash])[content_hash]
+
+    def get_many(self, content_hashes):
+        """{content_hash: (hit, embedding or None, quality or None)} for the given hashes."""
+        content_hashes = list(content_hashes)
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(content_hashes), 500):
+                part = content_hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT content_hash, embedding, quality FROM embeddings WHERE model_version = ? "
+                    f"AND content_hash IN ({','.join('?' * len(part))})",
+                    [self.version] + part).fetchall()
+                for content_hash, blob, quality in rows:
+                    embedding = np.frombuffer(blob, dtype=np.float32).copy() if blob is not None else None
+                    found[content_hash] = (embedding, quality)
+            self.hits += len(found)
+            self.misses += len(set(content_hashes)) - len(found)
+        return {content_hash: (content_hash in found,) + found.get(content_hash, (None, None))
+                for content_hash in content_hashes}
+
+    def put(self, content_hash, embedding, quality=None):
+        self.put_many([(content_hash, embedding, quality)])
+
+    def put_many(self, entries):
+        """Store (content_hash, embedding or None, quality or None) triples in one transaction."""
+        now = time.time()
+        rows = [(content_hash, self.version,
+                 None if embedding is None else np.asarray(embedding, dtype=np.float32).tobytes(),
+                 None if quality is None else float(quality), now)
+                for content_hash, embedding, quality in entries]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (content_hash, model_version, embedding, quality, created_at) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+
+    def prune(self, max_age_days=CACHE_MAX_AGE_DAYS):
+        """Drop the rows of every other version not used for max_age_days. Returns {version: rows dropped}."""
+        with self._lock:
+            return prune_versions(self._conn, max_age_days, keep=(self.version,))
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100.0 if total else 0.0
+        return f"cache {self.hits} hit(s), {self.misses} miss(es) ({rate:.0f}% hits)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def prune_versions(conn, max_age_days=CACHE_MAX_AGE_DAYS, keep=()):
+    """
+    Delete the rows of model versions last used more than max_age_days ago,
+    except those in keep. Versions cached before use was recorded count as
+    used when their newest row was written.
+
+    Returns:
+        dict: {version: rows dropped}
+    """
+    cutoff = time.time() - max_age_days * 86400.0
+    stale = conn.execute(
+        "SELECT e.model_version FROM embeddings e LEFT JOIN versions v ON v.model_version = e.model_version "
+        "GROUP BY e.model_version HAVING COALESCE(MAX(v.last_used), MAX(e.created_at)) < ?",
+        (cutoff,)).fetchall()
+    dropped = {}
+    conn.execute("BEGIN")
+    for (version,) in stale:
+        if version in keep:
+            continue
+        dropped[version] = conn.execute("DELETE FROM embeddings WHERE model_version = ?", (version,)).rowcount
+        conn.execute("DELETE FROM versions WHERE model_version = ?", (version,))
+    conn.execute("COMMIT")
+    return dropped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or prune the enrollment embedding cache")
+    parser.add_argument("path", nargs="?", default=CACHE_PATH)
+    parser.add_argument("--prune", type=float, nargs="?", const=CACHE_MAX_AGE_DAYS, metavar="DAYS",
+                        help=f"Drop versions not used for DAYS days (default {CACHE_MAX_AGE_DAYS})")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"[INFO] No embedding cache at {args.path}")
+        sys.exit(0)
+    conn = sqlite3.connect(args.path, isolation_level=None, timeout=10)
+    conn.executescript(SCHEMA)
+    if args.prune is not None:
+        for version, count in prune_versions(conn, args.prune).items():
+            print(f"[CACHE] Dropped model {version}: {count} image(s)")
+    for version, count, faces, last_used in conn.execute(
+            "SELECT e.model_version, COUNT(*), COUNT(e.embedding), "
+            "COALESCE(MAX(v.last_used), MAX(e.created_at)) FROM embeddings e "
+            "LEFT JOIN versions v ON v.model_version = e.model_version GROUP BY e.model_version"):
+        used = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used))
+        print(f"[CACHE] model {version}: {count} image(s), {faces} with a face, last used {used}")
+    conn.close()
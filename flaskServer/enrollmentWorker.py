@@ -0,0 +1,263 @@
+"""
+Persistent enrollment worker.
+
+Keeps MTCNN and InceptionResnetV1 loaded so a registration only pays for
+embedding its photos, not for Python startup, the torch import and the weight
+load that `python createEmbeddings.py <folder>` costs on every call. Jobs are
+queued and run by generate_embeddings on ENROLL_WORKERS threads that share the
+one copy of the models; the running recognizer picks up the new
+embeddings.csv through the gallery watcher as before.
+
+Endpoints (default http://127.0.0.1:8002):
+    POST /jobs           {"folder": "<uploads/<name>>", "wait": false} -> job
+    GET  /jobs/<job_id>  status, result and timing of one job
+    GET  /health         models loaded, queue depth, job counts
+
+    python enrollmentWorker.py
+    curl -d '{"folder": "../backend/uploads/alice"}' localhost:8002/jobs
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import createEmbeddings
+
+# ------------------- Configuration -------------------
+ENROLL_HOST = "127.0.0.1"           # Local only; the backend runs on the same box
+ENROLL_PORT = 8002
+ENROLL_WORKERS = 1                  # Threads running generate_embeddings (models are shared)
+UPLOADS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend", "uploads")
+MAX_WAIT_SECONDS = 120.0            # Longest a {"wait": true} request blocks
+JOB_HISTORY = 1000                  # Finished jobs kept for GET /jobs/<id>
+# -----------------------------------------------------
+
+
+class EnrollmentJob:
+    """One queued registration and its timing."""
+
+    def __init__(self, job_id, folder):
+        self.job_id = job_id
+        self.folder = folder
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        queued_s = (self.started_at or time.time()) - self.submitted_at
+        run_s = (self.finished_at or time.time()) - self.started_at if self.started_at else None
+        return {
+            "job_id": self.job_id,
+            "folder": self.folder,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "queued_s": round(queued_s, 3),
+            "run_s": None if run_s is None else round(run_s, 3),
+        }
+
+
+class EnrollmentWorker:
+    """
+    Job queue in front of createEmbeddings.generate_embeddings.
+
+    Args:
+        uploads_folder: Only folders inside it are accepted
+        workers: Threads running jobs; they share one copy of the models
+    """
+
+    def __init__(self, uploads_folder=UPLOADS_FOLDER, workers=ENROLL_WORKERS):
+        self.uploads_folder = os.path.realpath(uploads_folder)
+        self.workers = max(1, int(workers))
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._pending = {}              # folder -> queued job, so double submits share one run
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._threads = []
+        self.completed = 0
+        self.failed = 0
+        self.run_seconds = 0.0
+
+    def load(self):
+        """Load and warm the models once, before the first registration arrives."""
+        started = time.perf_counter()
+        mtcnn, resnet = createEmbeddings.load_models()
+        # Fingerprints the weights for the embedding cache now rather than in the first job
+        createEmbeddings.get_cache()
+        with createEmbeddings.torch.no_grad():
+            mtcnn.detect(np.zeros((160, 160, 3), dtype=np.uint8))
+            resnet(createEmbeddings.torch.zeros(1, 3, 160, 160, device=createEmbeddings.device))
+        print(f"[INFO] Enrollment models ready on {createEmbeddings.device} in {time.perf_counter() - started:.1f}s")
+
+    def resolve_folder(self, folder):
+        """Absolute folder inside uploads_folder, or ValueError."""
+        if not folder or not isinstance(folder, str):
+            raise ValueError("'folder' is required")
+        if not os.path.isabs(folder):
+            folder = os.path.join(self.uploads_folder, folder)
+        folder = os.path.realpath(folder)
+        if os.path.commonpath([folder, self.uploads_folder]) != self.uploads_folder:
+            raise ValueError("'folder' must be inside the uploads folder")
+        if not os.path.isdir(folder):
+            raise ValueError(f"No such folder: {folder}")
+        return folder
+
+    def submit(self, folder):
+        folder = self.resolve_folder(folder)
+        with self._lock:
+            job = self._pending.get(folder)
+            if job is not None:
+                return job
+            job = EnrollmentJob(f"{next(self._ids):06d}", folder)
+            self._jobs[job.job_id] = job
+            self._pending[folder] = job
+            while len(self._jobs) > JOB_HISTORY:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.done.is_set():
+                    break
+                self._jobs.popitem(last=False)
+        self._queue.put(job)
+        print(f"[ENROLL] Job {job.job_id} queued for {os.path.basename(folder)} ({self._queue.qsize()} waiting)")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                # Photos added after this point need a new run
+                self._pending.pop(job.folder, None)
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = createEmbeddings.generate_embeddings(job.folder)
+                job.status = "done" if job.result["embeddings"] else "failed"
+                if not job.result["embeddings"]:
+                    job.error = "No usable faces in the uploaded photos (see the quality gate)"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+            job.finished_at = time.time()
+
+            with self._lock:
+                if job.status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.run_seconds += job.finished_at - job.started_at
+            timing = job.to_dict()
+            print(f"[ENROLL] Job {job.job_id} {job.status}: "
+                  f"{(job.result or {}).get('embeddings', 0)} embeddings, "
+                  f"queued {timing['queued_s']:.2f}s, ran {timing['run_s']:.2f}s")
+            job.done.set()
+
+    def health(self):
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "models_loaded": createEmbeddings.resnet is not None,
+                "device": str(createEmbeddings.device),
+                "queued": self._queue.qsize(),
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_run_s": round(self.run_seconds / finished, 3) if finished else None,
+            }
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._run, name=f"enroll-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5.0)
+
+
+def serve(worker, host=ENROLL_HOST, port=ENROLL_PORT):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass  # Job progress is printed by the worker
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == "/health":
+                self._send(200, worker.health())
+            elif path.startswith("/jobs/"):
+                job = worker.get(path[len("/jobs/"):])
+                if job is None:
+                    self._send(404, {"error": "Unknown job"})
+                else:
+                    self._send(200, job.to_dict())
+            else:
+                self._send(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if self.path.split("?", 1)[0].rstrip("/") != "/jobs":
+                self._send(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                job = worker.submit(body.get("folder"))
+            except (ValueError, AttributeError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            if body.get("wait"):
+                job.done.wait(MAX_WAIT_SECONDS)
+                self._send(200 if job.done.is_set() else 202, job.to_dict())
+            else:
+                self._send(202, job.to_dict())
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    print(f"[INFO] Enrollment worker listening on http://{host}:{port}/")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[INFO] Stopping enrollment worker")
+    finally:
+        httpd.server_close()
+        worker.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the enrollment models warm and embed new registrations")
+    parser.add_argument("--host", default=ENROLL_HOST)
+    parser.add_argument("--port", type=int, default=ENROLL_PORT)
+    parser.add_argument("--workers", type=int, default=ENROLL_WORKERS)
+    parser.add_argument("--uploads", default=UPLOADS_FOLDER, help="Registration photo root")
+    args = parser.parse_args()
+
+    worker = EnrollmentWorker(args.uploads, args.workers)
+    worker.load()
+    worker.start()
+    serve(worker, args.host, args.port)
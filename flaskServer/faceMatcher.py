@@ -0,0 +1,376 @@
+"""
+Batched face matcher.
+
+Scores every face in a frame against the whole gallery with one matrix
+multiply, (F, 512) x (512, N), and aggregates template scores per person
+instead of taking the single nearest template:
+
+    max         best template of each person (same answer as nearest neighbour)
+    mean_top_m  mean of each person's m best templates; one lucky template
+                matters less
+    centroid    similarity to each person's mean template; one product of
+                (F, 512) x (512, P), cheapest for people with many templates
+
+With per-template quality weights (faceQuality scores stored in the gallery),
+mean_top_m becomes a quality-weighted mean of the m best templates and
+centroid a quality-weighted mean template, so a blurry or off-pose template
+counts for less. max is unaffected: it is the nearest template either way.
+
+The scoring matrix can be held as float32, float16 or int8 with a per-row
+scale (2 KB, 1 KB or 516 bytes per 512-d template). When it is narrower than
+the gallery rows it was made from, the best `rerank` people per face are
+re-scored from those rows, so the score compared with THRESHOLD is that of
+the stored gallery (exact for a float32 gallery). A gallery already stored
+as float16 or int8 (gallery.py convert) is scored as stored: the matrix is
+its rows, never a widened copy, and there is nothing finer to re-rank against.
+
+Meant for small and medium galleries; very large ones should go through an
+approximate index (annIndex) instead.
+
+Compare latency with the per-face NearestNeighbors.kneighbors path, and the
+memory / accuracy of each precision against float32:
+    python faceMatcher.py ./gallery --faces 1 --faces 4 --faces 16
+    python faceMatcher.py ./gallery --precision-report
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from gallery import l2_normalize, quantize_int8
+
+# ------------------- Configuration -------------------
+MATCH_AGGREGATION = "max"   # "max", "mean_top_m" or "centroid"
+MATCH_TOP_M = 3             # Templates averaged per person for mean_top_m
+MATCH_PRECISION = "float32" # Scoring matrix: "float32", "float16" or "int8" (never wider than the gallery)
+MATCH_RERANK = 10           # People per face re-scored from the gallery rows when the matrix is narrower
+CHUNK_ROWS = 16384          # Rows converted to float32 at a time when scoring quantized rows
+# -----------------------------------------------------
+
+AGGREGATIONS = ("max", "mean_top_m", "centroid")
+PRECISIONS = ("float32", "float16", "int8")  # Widest first
+
+
+def storage_precision(rows, scales=None):
+    """PRECISIONS entry of gallery rows: int8 codes come with per-row scales."""
+    if scales is not None:
+        return "int8"
+    return "float16" if rows.dtype == np.float16 else "float32"
+
+
+def widen(rows, scales=None):
+    """float32 copy of a block of gallery rows (int8 codes are multiplied by their scales)."""
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows if scales is None else rows * scales[:, None]
+
+
+class ScoringMatrix:
+    """
+    Rows held as float32, float16 or int8 + per-row scale, scored against
+    float32 queries. Quantized rows are widened to float32 CHUNK_ROWS at a
+    time, so the full float32 matrix never exists in memory. Rows already
+    stored at the requested precision or narrower are referenced, not
+    copied, so a memmapped gallery stays mapped and is never widened.
+
+    Args:
+        rows: (N, D) source rows (float32, float16 or int8 codes, may be a memmap)
+        precision: Requested precision; the effective one (self.precision) is
+            never wider than the rows
+        scales: (N,) per-row scales when rows are int8 codes
+    """
+
+    def __init__(self, rows, precision="float32", scales=None, chunk_rows=CHUNK_ROWS):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+        stored = storage_precision(rows, scales)
+        self.chunk_rows = chunk_rows
+        count, dim = rows.shape
+
+        if PRECISIONS.index(precision) <= PRECISIONS.index(stored):
+            # Rows as they are: widening them would only add a larger copy of the same values
+            self.precision = stored
+            self.matrix = np.ascontiguousarray(rows, dtype=np.float32) if stored == "float32" else rows
+            self.scales = scales
+            return
+        self.precision = precision
+        self.scales = None
+        self.matrix = np.empty((count, dim), dtype=np.int8 if precision == "int8" else np.float16)
+        if precision == "int8":
+            self.scales = np.empty(count, dtype=np.float32)
+        for start in range(0, count, chunk_rows):
+            stop = min(count, start + chunk_rows)
+            block = widen(rows[start:stop])
+            if precision == "int8":
+                self.matrix[start:stop], self.scales[start:stop] = quantize_int8(block)
+            else:
+                self.matrix[start:stop] = block
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def dot(self, queries):
+        """(Q, N) float32 dot products."""
+        if self.precision == "float32":
+            return queries @ self.matrix.T
+        out = np.empty((len(queries), len(self.matrix)), dtype=np.float32)
+        for start in range(0, len(self.matrix), self.chunk_rows):
+            stop = min(len(self.matrix), start + self.chunk_rows)
+            out[:, start:stop] = queries @ self.matrix[start:stop].astype(np.float32).T
+            if self.scales is not None:
+                out[:, start:stop] *= self.scales[start:stop]
+        return out
+
+
+class BatchMatcher:
+    """
+    Per-person top-k matching for a batch of L2-normalised embeddings.
+
+    Args:
+        embeddings: (N, 512) L2-normalised templates, float32, float16 or int8
+            codes (kept by reference for re-ranking)
+        labels: (N,) person index of each template
+        names: Person names indexed by label
+        aggregation: One of AGGREGATIONS
+        top_m: Templates averaged per person for "mean_top_m"
+        precision: One of PRECISIONS, the storage of the scoring matrix (no
+            wider than the embeddings; see ScoringMatrix)
+        rerank: People per face re-scored from the embeddings when the scoring
+            matrix is narrower than them (0 keeps the approximate scores)
+        weights: Optional (N,) template quality weights for mean_top_m and centroid
+        scales: (N,) per-row scales when embeddings holds int8 codes
+    """
+
+    def __init__(self, embeddings, labels, names, aggregation=MATCH_AGGREGATION, top_m=MATCH_TOP_M,
+                 precision=MATCH_PRECISION, rerank=MATCH_RERANK, weights=None, scales=None):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation '{aggregation}', expected one of {AGGREGATIONS}")
+        self.aggregation = aggregation
+        self.top_m = max(1, int(top_m))
+        self.precision = precision
+        self.rerank = int(rerank)
+        self.names = names
+        self.source = embeddings
+        self.source_scales = scales
+        self.weights = None if weights is None or aggregation == "max" else np.asarray(weights, dtype=np.float32)
+
+        labels = np.asarray(labels, dtype=np.int32)
+        # Templates grouped by person so each person is one contiguous column range. The
+        # matrix keeps the gallery's row order; score columns are gathered into this order
+        # instead (only when labels are not already grouped), so the rows are never copied.
+        self.order = np.argsort(labels, kind="stable")
+        self.gather = None if np.all(labels[:-1] <= labels[1:]) else self.order
+        sorted_labels = labels[self.order]
+        self.person_labels, self.starts, self.template_counts = np.unique(
+            sorted_labels, return_index=True, return_counts=True)
+        if len(self.person_labels) == 0:
+            return
+
+        if aggregation == "centroid":
+            person_of_row = np.searchsorted(self.person_labels, labels)
+            sums = np.zeros((len(self.person_labels), embeddings.shape[1]), dtype=np.float32)
+            for start in range(0, len(labels), CHUNK_ROWS):
+                rows = widen(embeddings[start:start + CHUNK_ROWS],
+                             None if scales is None else scales[start:start + CHUNK_ROWS])
+                if self.weights is not None:
+                    rows = rows * self.weights[start:start + CHUNK_ROWS, None]
+                np.add.at(sums, person_of_row[start:start + CHUNK_ROWS], rows)
+            self.scoring = ScoringMatrix(l2_normalize(sums), precision)
+        else:
+            self.scoring = ScoringMatrix(embeddings, precision, scales)
+        self.precision = self.scoring.precision
+        # Re-ranking only helps when the embeddings hold more precision than the scoring matrix
+        if PRECISIONS.index(self.precision) <= PRECISIONS.index(storage_precision(embeddings, scales)):
+            self.rerank = 0
+
+        if aggregation == "mean_top_m":
+            # (P, T) template columns per person, padded with the dummy column N
+            width = int(self.template_counts.max())
+            offsets = np.arange(width)
+            self.slots = np.where(offsets < self.template_counts[:, None],
+                                  self.starts[:, None] + offsets, len(self.order))
+            self.counts = np.minimum(self.template_counts, self.top_m).astype(np.float32)
+            if self.weights is not None:
+                # Weight of each slot; the padding column weighs nothing
+                self.slot_weights = np.append(self.weights[self.order], np.float32(0.0))[self.slots]
+
+    def __len__(self):
+        return len(self.person_labels)
+
+    @property
+    def nbytes(self):
+        """Bytes of the scoring matrix (the embeddings themselves when it references them)."""
+        return self.scoring.nbytes if len(self) else 0
+
+    def score(self, queries):
+        """(F, P) aggregated similarity of every face to every person (approximate if quantized)."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(np.atleast_2d(queries)), -1)
+        scores = self.scoring.dot(queries)
+        if self.aggregation == "centroid":
+            return scores
+        if self.gather is not None:
+            scores = scores[:, self.gather]
+        if self.aggregation == "max":
+            return np.maximum.reduceat(scores, self.starts, axis=1)
+
+        # mean_top_m: gather each person's template scores, -inf in the padding
+        padded = np.hstack([scores, np.full((len(scores), 1), -np.inf, dtype=np.float32)])
+        per_person = padded[:, self.slots]
+        if self.weights is not None:
+            weights = np.broadcast_to(self.slot_weights, per_person.shape)
+            if per_person.shape[2] > self.top_m:
+                top = np.argpartition(-per_person, self.top_m - 1, axis=2)[:, :, :self.top_m]
+                per_person = np.take_along_axis(per_person, top, axis=2)
+                weights = np.take_along_axis(weights, top, axis=2)
+            per_person = np.where(np.isfinite(per_person), per_person, 0.0)
+            return (per_person * weights).sum(axis=2) / np.maximum(weights.sum(axis=2), 1e-6)
+        if per_person.shape[2] > self.top_m:
+            per_person = -np.partition(-per_person, self.top_m - 1, axis=2)[:, :, :self.top_m]
+        per_person = np.where(np.isfinite(per_person), per_person, 0.0)
+        return per_person.sum(axis=2) / self.counts
+
+    def exact_score(self, query, person):
+        """Aggregated score of one face against one person (by column) from the embeddings as stored."""
+        start = self.starts[person]
+        columns = self.order[start:start + self.template_counts[person]]
+        rows = widen(self.source[columns], None if self.source_scales is None else self.source_scales[columns])
+        weights = self.weights[columns] if self.weights is not None else np.ones(len(rows), dtype=np.float32)
+        if self.aggregation == "centroid":
+            centroid = (rows * weights[:, None]).sum(axis=0)
+            return float(centroid @ query / max(np.linalg.norm(centroid), 1e-12))
+        similarities = rows @ query
+        if self.aggregation == "max":
+            return float(similarities.max())
+        best = np.argsort(-similarities)[:self.top_m]
+        return float((similarities[best] * weights[best]).sum() / max(weights[best].sum(), 1e-6))
+
+    def match(self, queries, k=1):
+        """
+        Top-k people for each face.
+
+        Returns:
+            list: one list per face of (name, score) pairs, best first
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(np.atleast_2d(queries)), -1)
+        if len(self) == 0:
+            return [[] for _ in range(len(queries))]
+        scores = self.score(queries)
+        shortlist = min(max(k, self.rerank), scores.shape[1])
+        top = np.argpartition(-scores, shortlist - 1, axis=1)[:, :shortlist]
+
+        results = []
+        for query, row, columns in zip(queries, scores, top):
+            if self.rerank:
+                candidates = [(self.exact_score(query, c), c) for c in columns]
+            else:
+                candidates = [(float(row[c]), c) for c in columns]
+            candidates.sort(key=lambda item: -item[0])
+            results.append([(self.names[self.person_labels[c]], score) for score, c in candidates[:k]])
+        return results
+
+
+# ------------------- Latency comparison -------------------
+
+def compare_latency(embeddings, labels, names, face_counts=(1, 4, 16), repeats=50, seed=0):
+    """
+    ms per frame of the per-face kneighbors path against BatchMatcher for
+    each aggregation, for frames with the given numbers of faces.
+    """
+    from sklearn.neighbors import NearestNeighbors
+
+    index = NearestNeighbors(n_neighbors=1, metric='cosine', algorithm='brute')
+    index.fit(embeddings)
+    matchers = {aggregation: BatchMatcher(embeddings, labels, names, aggregation) for aggregation in AGGREGATIONS}
+    rng = np.random.default_rng(seed)
+
+    rows = []
+    for faces in face_counts:
+        queries = embeddings[rng.choice(len(embeddings), size=faces)]
+        timings = {}
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for query in queries:
+                index.kneighbors(query.reshape(1, -1))
+        timings["kneighbors"] = (time.perf_counter() - start) / repeats * 1000.0
+
+        for aggregation, matcher in matchers.items():
+            start = time.perf_counter()
+            for _ in range(repeats):
+                matcher.match(queries, k=1)
+            timings[aggregation] = (time.perf_counter() - start) / repeats * 1000.0
+        rows.append((faces, timings))
+    return rows
+
+
+def compare_precision(embeddings, labels, names, queries, aggregation=MATCH_AGGREGATION,
+                      rerank=MATCH_RERANK, threshold=0.65):
+    """
+    Memory and accuracy of each precision against the float32 matcher.
+
+    Returns:
+        list of dicts: precision, rerank, scoring_mb, bytes_per_row,
+        top1_agreement and decision_agreement (same identity / same
+        above-threshold outcome as float32), max_score_error (before
+        re-ranking) and ms_per_face
+    """
+    baseline = BatchMatcher(embeddings, labels, names, aggregation, precision="float32")
+    base_scores = baseline.score(queries)
+    base_top = baseline.match(queries, k=1)
+
+    rows = []
+    for precision in PRECISIONS:
+        for passes in ((0,) if precision == "float32" else (0, rerank)):
+            matcher = BatchMatcher(embeddings, labels, names, aggregation, precision=precision, rerank=passes)
+            start = time.perf_counter()
+            top = matcher.match(queries, k=1)
+            elapsed = time.perf_counter() - start
+            same = [a[0][0] == b[0][0] for a, b in zip(top, base_top)]
+            decision = [(a[0][1] >= threshold) == (b[0][1] >= threshold) for a, b in zip(top, base_top)]
+            rows.append({
+                "precision": precision,
+                "rerank": passes,
+                "scoring_mb": matcher.nbytes / 1e6,
+                "bytes_per_row": matcher.nbytes / max(1, len(matcher.scoring)),
+                "top1_agreement": float(np.mean(same)),
+                "decision_agreement": float(np.mean(decision)),
+                "max_score_error": float(np.abs(matcher.score(queries) - base_scores).max()),
+                "ms_per_face": elapsed / max(1, len(queries)) * 1000.0,
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    from gallery import Gallery
+
+    parser = argparse.ArgumentParser(description="Per-frame matching latency and precision reports")
+    parser.add_argument("gallery", help="Binary gallery directory (see gallery.py)")
+    parser.add_argument("--faces", type=int, action="append", help="Faces per frame (repeatable)")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--precision-report", action="store_true",
+                        help="Compare float16 / int8 scoring with float32 instead of timing kneighbors")
+    parser.add_argument("--aggregation", default=MATCH_AGGREGATION, choices=AGGREGATIONS)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    gallery = Gallery.load(args.gallery)
+    print(f"[MATCH] gallery={len(gallery)} templates, {len(gallery.names)} people")
+    if args.precision_report:
+        from annIndex import make_queries
+
+        gallery_embeddings = gallery.as_float32()
+        probe = make_queries(gallery_embeddings, args.queries)
+        for r in compare_precision(gallery_embeddings, gallery.labels, gallery.names, probe, args.aggregation):
+            print(f"  {r['precision']:>7} rerank={r['rerank']:<3} {r['scoring_mb']:8.2f} MB "
+                  f"({r['bytes_per_row']:.0f} B/row)  top1={r['top1_agreement']:.4f} "
+                  f"decision={r['decision_agreement']:.4f}  max_err={r['max_score_error']:.5f}  "
+                  f"{r['ms_per_face']:.3f} ms/face")
+    else:
+        print("  ms per frame:")
+        for faces, timings in compare_latency(gallery.as_float32(), gallery.labels, gallery.names,
+                                              args.faces or (1, 4, 16), args.repeats):
+            print(f"  {faces:>3} face(s): " + "  ".join(f"{name}={ms:.3f}" for name, ms in timings.items()))
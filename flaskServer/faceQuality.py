@@ -0,0 +1,158 @@
+"""
+Enrollment quality gate.
+
+Scores detected faces before they are embedded, from what MTCNN already gives
+us plus a small grey crop of each face:
+
+    size        shorter side of the face box, in pixels
+    sharpness   variance of the Laplacian of the face resized to SAMPLE_SIZE
+    brightness  mean grey level of the face
+    prob        MTCNN detection probability
+    pose        yaw, roll and pitch estimated from the five landmarks
+
+Every metric is mapped to [0, 1] between its reject and its good value, and
+the template quality is their weighted mean. A face is rejected when any
+metric is at or past its reject value or the quality is below MIN_QUALITY.
+All faces of an image are scored together with array operations; only the
+crop resize runs per face.
+
+The quality is stored with each template (quality.csv next to
+embeddings.csv, quality.npy in the binary gallery) and weights the
+mean_top_m and centroid aggregations of faceMatcher.
+"""
+
+import hashlib
+import json
+
+import cv2
+import numpy as np
+
+# ------------------- Configuration -------------------
+QUALITY_GATE = "reject"     # "reject" drops low-quality photos; "flag" keeps them with their low score
+MIN_QUALITY = 0.5           # Templates scoring below this are rejected (or flagged)
+SAMPLE_SIZE = 64            # Faces are resized to this square before the blur / brightness measures
+# (reject, good) per metric; scores ramp linearly in between
+FACE_SIZE = (40.0, 112.0)           # Pixels, shorter side of the box
+SHARPNESS = (25.0, 120.0)           # Laplacian variance on the SAMPLE_SIZE grey crop
+DARK = (35.0, 80.0)                 # Mean grey level, too dark below
+BRIGHT = (225.0, 180.0)             # Mean grey level, too bright above
+DETECTION_PROB = (0.90, 0.99)
+YAW = (0.45, 0.15)                  # |nose offset from the eye midline| / eye distance
+ROLL = (30.0, 10.0)                 # Degrees of eye-line tilt
+PITCH = (0.35, 0.15)                # |nose height between eyes and mouth - 0.5|
+QUALITY_WEIGHTS = {"size": 1.0, "sharpness": 1.0, "brightness": 0.5, "prob": 1.0, "pose": 1.0}
+# -----------------------------------------------------
+
+def _ramp(values, reject, good):
+    """0 at reject, 1 at good, linear in between (works for either direction)."""
+    return np.clip((values - reject) / (good - reject), 0.0, 1.0)
+
+
+def gray_samples(image, boxes, size=SAMPLE_SIZE):
+    """(N, size, size) float32 grey crops of the face boxes of an RGB image (zeros for empty crops)."""
+    samples = np.zeros((len(boxes), size, size, 3), dtype=np.uint8)
+    height, width = image.shape[:2]
+    for i, box in enumerate(boxes):
+        x1, y1, x2, y2 = (int(v) for v in box)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if x2 > x1 and y2 > y1:
+            samples[i] = cv2.resize(image[y1:y2, x1:x2], (size, size), interpolation=cv2.INTER_AREA)
+    return samples.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def laplacian_variance(gray):
+    """Variance of the 4-neighbour Laplacian of each (N, H, W) image."""
+    lap = (gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] + gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:]
+           - 4.0 * gray[:, 1:-1, 1:-1])
+    return lap.var(axis=(1, 2))
+
+
+def pose_scores(landmarks):
+    """
+    Yaw, roll and pitch estimates from (N, 5, 2) MTCNN landmarks (left eye,
+    right eye, nose, left and right mouth corner).
+
+    Returns:
+        tuple: (yaw ratio, roll degrees, pitch ratio) arrays
+    """
+    left_eye, right_eye, nose = landmarks[:, 0], landmarks[:, 1], landmarks[:, 2]
+    mouth = (landmarks[:, 3] + landmarks[:, 4]) / 2.0
+    eye_mid = (left_eye + right_eye) / 2.0
+    eye_vector = right_eye - left_eye
+    eye_distance = np.maximum(np.linalg.norm(eye_vector, axis=1), 1e-6)
+
+    # Nose offset along the eye line: 0 when facing the camera, about +-0.5 in profile
+    yaw = np.abs(((nose - eye_mid) * eye_vector).sum(axis=1)) / eye_distance ** 2
+    roll = np.degrees(np.abs(np.arctan2(eye_vector[:, 1], eye_vector[:, 0])))
+    # Nose about halfway between the eyes and the mouth when level
+    face_height = np.maximum(mouth[:, 1] - eye_mid[:, 1], 1e-6)
+    pitch = np.abs((nose[:, 1] - eye_mid[:, 1]) / face_height - 0.5)
+    return yaw, roll, pitch
+
+
+def assess_faces(image, boxes, probs=None, landmarks=None):
+    """
+    Quality of the given faces of one RGB image.
+
+    Args:
+        image: RGB image the boxes refer to
+        boxes: (N, 4) face boxes
+        probs: (N,) MTCNN probabilities, or None to skip that metric
+        landmarks: (N, 5, 2) MTCNN landmarks, or None to skip the pose metric
+
+    Returns:
+        dict with (N,) arrays quality, accepted and one per metric (the raw
+        measures plus "<metric>_score"), and reasons: one list of failed
+        metric names per face
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    count = len(boxes)
+    result = {}
+
+    sizes = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+    gray = gray_samples(image, boxes)
+    sharpness = laplacian_variance(gray)
+    brightness = gray.mean(axis=(1, 2))
+    result.update(size=sizes, sharpness=sharpness, brightness=brightness)
+
+    scores = {
+        "size": _ramp(sizes, *FACE_SIZE),
+        "sharpness": _ramp(sharpness, *SHARPNESS),
+        "brightness": np.minimum(_ramp(brightness, *DARK), _ramp(brightness, *BRIGHT)),
+    }
+    if probs is not None:
+        probs = np.asarray(probs, dtype=np.float32).reshape(count)
+        result["prob"] = probs
+        scores["prob"] = _ramp(probs, *DETECTION_PROB)
+    if landmarks is not None:
+        yaw, roll, pitch = pose_scores(np.asarray(landmarks, dtype=np.float32).reshape(count, 5, 2))
+        result.update(yaw=yaw, roll=roll, pitch=pitch)
+        scores["pose"] = np.minimum.reduce([_ramp(yaw, *YAW), _ramp(roll, *ROLL), _ramp(pitch, *PITCH)])
+
+    weights = np.array([QUALITY_WEIGHTS[name] for name in scores], dtype=np.float32)
+    stacked = np.stack(list(scores.values()), axis=1)
+    quality = (stacked * weights).sum(axis=1) / weights.sum()
+    failed = stacked <= 0.0
+
+    names = list(scores)
+    reasons = [[names[j] for j in np.flatnonzero(row)] for row in failed]
+    for i in range(count):
+        if not reasons[i] and quality[i] < MIN_QUALITY:
+            reasons[i] = ["low quality"]
+    for name, score in scores.items():
+        result[f"{name}_score"] = score
+    result["quality"] = quality.astype(np.float32)
+    result["accepted"] = np.array([not r for r in reasons], dtype=bool)
+    result["reasons"] = reasons
+    return result
+
+
+def config_signature():
+    """Changes with any gate setting, so cached gate decisions are invalidated with it."""
+    config = {
+        "gate": QUALITY_GATE, "min": MIN_QUALITY, "sample": SAMPLE_SIZE, "size": FACE_SIZE,
+        "sharpness": SHARPNESS, "dark": DARK, "bright": BRIGHT, "prob": DETECTION_PROB,
+        "yaw": YAW, "roll": ROLL, "pitch": PITCH, "weights": QUALITY_WEIGHTS,
+    }
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:8]
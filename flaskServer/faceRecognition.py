@@ -232,257 +232,291 @@
 
 
 
-import os
+import sys
+import functools
+import threading
 import cv2
-import numpy as np
-import torch
-import requests
-import pandas as pd
-from PIL import Image
 from datetime import datetime
-from facenet_pytorch import InceptionResnetV1, MTCNN
-from sklearn.preprocessing import normalize
-from sklearn.neighbors import NearestNeighbors
-from predict import AntiSpoofPredict
-from utility import parse_model_name
-from ppeDetection import load_ppe_model, detect_ppe_items, check_ppe_compliance, get_ppe_status_string
+from ppeDetection import get_ppe_status_string, summarize_ppe
+from pipeline import CameraPipeline, format_stats
+from motionGate import MotionGate, format_gate_report
+from faceTracker import FaceTracker
+from attendanceClient import AttendanceClient
+from attendanceSpool import AttendanceSpool
+from previewServer import PreviewServer
+from recognitionEngine import RecognitionEngine
 # ------------------- Configuration -------------------
-UPLOADS_FOLDER = '../backend/uploads'
 API_URL = "http://localhost:3000/mark-attendance"
-THRESHOLD = 0.65  # Cosine similarity threshold (lowered from 0.75 for better recognition)
-CACHE_TIMEOUT = 10  # seconds before re-marking same person
+CACHE_TIMEOUT = 10  # seconds before retrying a person whose attendance failed to post
+CAMERA_SOURCE = 0  # cv2.VideoCapture source: device index, video file or RTSP URL
+INFERENCE_WORKERS = 1  # Threads running the models; capture and display run on their own
+MOTION_GATING = True  # Only run the heavy models at an idle rate while the scene is static
+FACE_TRACKING = True  # Reuse identity / spoof / PPE results per tracked face between refreshes
+HEADLESS = False  # No cv2 window (also: --headless); annotated frames are served on demand by previewServer
+WARMUP = True  # One dummy pass through every model before the camera starts
+# Gallery paths, THRESHOLD and model options live in recognitionEngine.py
 # -----------------------------------------------------
 
-# Initialize models
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-mtcnn = MTCNN(keep_all=True, device=device)
-resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
-model_dir = './resources/anti_spoof_models'  # Adjust if needed
-anti_spoof = AntiSpoofPredict(device_id=0)
-
-# Initialize PPE detection model
-print("[INFO] Initializing PPE detection model...")
-ppe_model = load_ppe_model()
-if ppe_model is not None:
-    print("[INFO] PPE detection model loaded successfully")
-else:
-    print("[WARNING] PPE detection model not available. PPE checks will be skipped.")
-
-
-
-# ------------------- Preload embeddings -------------------
-all_embeddings = []
-all_names = []
-
-for person_folder in os.listdir(UPLOADS_FOLDER):
-    full_path = os.path.join(UPLOADS_FOLDER, person_folder)
-    csv_path = os.path.join(full_path, 'embeddings.csv')
-    if not os.path.exists(csv_path):
-        continue
-
-    df = pd.read_csv(csv_path, header=None)
-    for _, row in df.iterrows():
-        known_embedding = row.values.astype(float)
-        known_embedding = normalize([known_embedding])[0]
-        all_embeddings.append(known_embedding)
-        all_names.append(person_folder)
-
-# Build similarity search index using scikit-learn (replaces FAISS for better Windows compatibility)
-if all_embeddings:
-    all_embeddings = np.array(all_embeddings).astype('float32')
-    # Use NearestNeighbors with cosine metric for similarity search
-    # n_neighbors=1 to get the best match
-    index = NearestNeighbors(n_neighbors=1, metric='cosine', algorithm='brute')
-    index.fit(all_embeddings)
-    print(f"[INFO] Loaded {len(all_embeddings)} embeddings from {len(set(all_names))} person(s)")
-    print(f"[INFO] Person names: {', '.join(set(all_names))}")
-else:
-    index = None
-    print("[WARNING] No embeddings found! Face recognition will not work.")
-
-# ------------------- Functions -------------------
-
-def detect_and_encode(image):
-    with torch.no_grad():
-        boxes, _ = mtcnn.detect(image)
-        if boxes is not None:
-            embeddings = []
-            for box in boxes:
-                x1, y1, x2, y2 = map(int, box)
-                face = image[y1:y2, x1:x2]
-                if face.size == 0:
-                    print("[DEBUG] Empty face crop detected")
-                    continue
-                face = cv2.resize(face, (160, 160))
-                face = np.transpose(face, (2, 0, 1)).astype(np.float32) / 255.0
-                face_tensor = torch.tensor(face).unsqueeze(0).to(device)
-                encoding = resnet(face_tensor).cpu().detach().numpy().flatten()
-                embedding = normalize([encoding])[0]
-                embeddings.append((embedding, box))
-            return embeddings
-        else:
-            print("[DEBUG] No faces detected in frame")
-    return []
-
-def match_embedding(input_embedding):
-    if index is None:
-        return "Unknown", 0.0
-    input_embedding = np.array(input_embedding).astype('float32').reshape(1, -1)
-    
-    # scikit-learn NearestNeighbors returns distances, convert to similarity
-    # For cosine metric: similarity = 1 - distance (since cosine distance = 1 - cosine similarity)
-    distances, indices = index.kneighbors(input_embedding, n_neighbors=1)
-    cosine_distance = distances[0][0]
-    best_similarity = 1.0 - cosine_distance  # Convert distance to similarity
-    best_name = all_names[indices[0][0]]
-    
-    # Debug: print similarity scores
-    if best_similarity < THRESHOLD:
-        print(f"[DEBUG] Best match: {best_name} with similarity {best_similarity:.4f} (threshold: {THRESHOLD})")
-    
-    if best_similarity >= THRESHOLD:
-        return best_name, best_similarity
-    return "Unknown", best_similarity
-
-def mark_attendance(name, recognition_time, time_taken_seconds, ppe_compliant=False, ppe_items=None, ppe_confidence=0.0):
-    try:
-        # timestamp = recognition_time.isoformat()
-        payload = {
-            "name": name,
-            # "time": timestamp,
-            "recognition_time_seconds": time_taken_seconds,
-            "ppe_compliant": ppe_compliant,
-            "ppe_items": ppe_items or {},
-            "ppe_confidence": ppe_confidence
-        }
-        response = requests.post(API_URL, json=payload)
-        if response.status_code == 200:
-            ppe_status = "✅ PPE Compliant" if ppe_compliant else "⚠️ PPE Non-Compliant"
-            print(f"✅ Marked attendance for {name} ({time_taken_seconds:.2f}s) - {ppe_status}")
-            return True
-        else:
-            print(f"⚠️ Failed to mark attendance for {name}: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Error sending request for {name}: {e}")
-    return False
-
-def is_real_face(frame, box, anti_spoof):
-    x1, y1, x2, y2 = map(int, box)
-    face_img = frame[y1:y2, x1:x2]
-    if face_img.size == 0:
-        return False
-
-    # Resize the face image to 80x80
-    face_img_resized = cv2.resize(face_img, (80, 80))  # Resize to 80x80
+# Models and gallery load on first use (or engine.load()), not on import
+engine = RecognitionEngine()
 
-    # Convert NumPy array to PIL image
-    face_img_rgb = cv2.cvtColor(face_img_resized, cv2.COLOR_BGR2RGB)
-    pil_image = Image.fromarray(face_img_rgb)
-
-    # Build a portable path to the anti-spoofing model relative to this file
-    model_path = os.path.join(
-        os.path.dirname(__file__),
-        "Silent-Face-Anti-Spoofing",
-        "resources",
-        "anti_spoof_models",
-        "2.7_80x80_MiniFASNetV2.pth",
-    )
-    prediction = anti_spoof.predict(pil_image, model_path)
-
-    # prediction: [label, confidence]
-    label = np.argmax(prediction)  # 1 = real, 0 = spoof
-    return label == 1  # 1 = real, 0 = spoof
-
-
-
-# ------------------- Main -------------------
+# ------------------- Attendance -------------------
 
-cap = cv2.VideoCapture(0)
 # Track already marked people forever during this session
 marked_once = set()
 
+_attendance_client = None
+_attendance_lock = threading.Lock()
+
+
+def get_attendance_client():
+    """
+    The attendance client, created on first use. It posts attendance off the
+    frame loop; events survive backend outages and restarts in the spool, and
+    names the backend rejected may be retried after CACHE_TIMEOUT.
+    """
+    global _attendance_client
+    with _attendance_lock:
+        if _attendance_client is None:
+            _attendance_client = AttendanceClient(API_URL, on_confirmed=on_attendance_confirmed,
+                                                  on_failed=on_attendance_failed,
+                                                  failure_cooldown=CACHE_TIMEOUT,
+                                                  spool=AttendanceSpool())
+    return _attendance_client
 
-print("🎥 Starting camera. Press 'q' to quit.")
-
-while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret:
-        break
-    start_time = datetime.now()  
+def mark_attendance(name, recognition_time, time_taken_seconds, ppe_compliant=False, ppe_items=None, ppe_confidence=0.0):
+    """
+    Spool an attendance event for the background client. Returns True if it
+    was queued; the name is added to marked_once only once the backend confirms.
+    """
+    payload = {
+        "name": name,
+        # Local time with UTC offset; spooled events may be delivered much later
+        "recognized_at": recognition_time.astimezone().isoformat(),
+        "recognition_time_seconds": time_taken_seconds,
+        "ppe_compliant": ppe_compliant,
+        "ppe_items": ppe_items or {},
+        "ppe_confidence": ppe_confidence
+    }
+    return get_attendance_client().submit(name, payload)
+
+def on_attendance_confirmed(event):
+    marked_once.add(event["name"])
+    ppe_status = "✅ PPE Compliant" if event["ppe_compliant"] else "⚠️ PPE Non-Compliant"
+    print(f"✅ Marked attendance for {event['name']} ({event['recognition_time_seconds']:.2f}s) - {ppe_status}")
+
+def on_attendance_failed(event, reason):
+    print(f"⚠️ Failed to mark attendance for {event['name']}: {reason}")
+
+# ------------------- Frame stages -------------------
+
+def process_frame(frame, tracker=None):
+    """
+    Run the heavy models on one BGR frame: detection, embedding, matching,
+    anti-spoofing and PPE. Does no drawing and no I/O so it can run on an
+    inference worker thread.
+
+    With a faceTracker.FaceTracker, MTCNN still runs every frame but the
+    embedding, match, anti-spoof and PPE results are reused from the face's
+    track until it is new or its cache is stale.
+
+    Returns:
+        dict with "faces" (list of dicts with name, confidence, box, track_id,
+        is_real, recognized_at, time_taken_seconds, ppe_compliant,
+        ppe_compliance_dict), "ppe_detections", "ppe_compliant",
+        "ppe_compliance_dict" and "start_time"
+    """
+    start_time = datetime.now()
     rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    embeddings_with_boxes = detect_and_encode(rgb_frame)
-
-    now = datetime.now()
-
-    # Run PPE detection on the full frame (once per frame, not per face)
-    ppe_detections = None
-    ppe_compliant = False
-    ppe_compliance_dict = {}
-    ppe_missing = []
-    
-    if ppe_model is not None:
-        try:
-            ppe_detections = detect_ppe_items(frame, model=ppe_model)
-            ppe_compliant, ppe_missing, ppe_compliance_dict = check_ppe_compliance(ppe_detections)
-        except Exception as e:
-            print(f"[PPE ERROR] Detection failed: {e}")
-            ppe_compliant = True  # Default to compliant if detection fails (don't block attendance)
-
-    for embedding, box in embeddings_with_boxes:
-        name, confidence = match_embedding(embedding)
-        x1, y1, x2, y2 = map(int, box)
-
-        # 👉 Add this spoof detection step
-        if not is_real_face(frame, box,anti_spoof):
+    boxes = engine.detect_faces(rgb_frame)
+
+    tracks = None
+    pending = list(range(len(boxes)))
+    if tracker is not None:
+        with tracker.lock:
+            tracks = tracker.update(boxes)
+            pending = tracker.stale(tracks)
+            run_ppe = bool(pending) or tracker.ppe_due()
+    else:
+        run_ppe = True
+
+    # PPE runs on the full frame (once per frame, not per face)
+    if run_ppe:
+        ppe_detections, ppe_compliant, ppe_compliance_dict = engine.check_ppe(frame)
+        if tracker is not None:
+            tracker.store_ppe((ppe_detections, ppe_compliant, ppe_compliance_dict))
+    else:
+        ppe_detections, ppe_compliant, ppe_compliance_dict = tracker.ppe
+
+    fresh = {}
+    if pending:
+        embeddings, kept = engine.encode_faces(rgb_frame, [boxes[i] for i in pending])
+        matches = engine.match_embeddings(embeddings) if len(embeddings) else []
+        # One anti-spoof forward for every face that got an embedding
+        real = engine.are_real_faces(frame, [boxes[pending[k]] for k in kept])
+        for (name, confidence), k, is_real in zip(matches, kept, real):
+            i = pending[k]
+            recognized_at = datetime.now()
+            fresh[i] = {
+                "name": name,
+                "confidence": confidence,
+                "is_real": is_real,
+                "recognized_at": recognized_at,
+                "time_taken_seconds": (recognized_at - start_time).total_seconds(),
+                "ppe_compliant": ppe_compliant,
+                "ppe_compliance_dict": ppe_compliance_dict,
+            }
+
+    faces = []
+    for i, box in enumerate(boxes):
+        track = tracks[i] if tracks is not None else None
+        if i in fresh:
+            face = fresh[i]
+            if track is not None:
+                track.store(face)
+        elif track is not None and track.face is not None:
+            face = track.face
+        else:
+            continue  # Empty crop and nothing cached for it
+        faces.append(dict(face, box=box, track_id=track.track_id if track is not None else None))
+
+    return {
+        "faces": faces,
+        "ppe_detections": ppe_detections,
+        "ppe_compliant": ppe_compliant,
+        "ppe_compliance_dict": ppe_compliance_dict,
+        "start_time": start_time,
+    }
+
+
+def handle_attendance(result):
+    """Mark attendance for every real, recognised face in a processed frame."""
+    for face in result["faces"]:
+        name = face["name"]
+        if not face["is_real"] or name == "Unknown" or name in marked_once:
+            continue
+
+        ppe_items_dict, ppe_avg_confidence = summarize_ppe(face["ppe_compliance_dict"])
+
+        # Mark attendance with PPE status (no-op while an event for name is in flight)
+        # Note: Currently allowing attendance even if PPE non-compliant (can be changed)
+        mark_attendance(name, face["recognized_at"], face["time_taken_seconds"],
+                        ppe_compliant=face["ppe_compliant"],
+                        ppe_items=ppe_items_dict,
+                        ppe_confidence=ppe_avg_confidence)
+
+
+def annotate_frame(frame, result):
+    """Draw face boxes, names and PPE status onto the frame in place."""
+    ppe_compliant = result["ppe_compliant"]
+    ppe_model = engine.ppe_model
+
+    for face in result["faces"]:
+        x1, y1, x2, y2 = map(int, face["box"])
+        name = face["name"]
+        if not face["is_real"]:
             name = "Spoof Detected"
             color = (0, 165, 255)  # Orange box for spoof
         else:
             color = (0, 255, 0) if name != 'Unknown' else (0, 0, 255)
 
-            if name != "Unknown" and name not in marked_once:
-                recognition_end_time = datetime.now()
-                time_taken_seconds = (recognition_end_time - start_time).total_seconds()
-
-                # Prepare PPE data for API
-                ppe_items_dict = {}
-                ppe_avg_confidence = 0.0
-                if ppe_compliance_dict:
-                    for item, data in ppe_compliance_dict.items():
-                        ppe_items_dict[item] = data["detected"]
-                    confidences = [data["confidence"] for data in ppe_compliance_dict.values() if data["detected"]]
-                    ppe_avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
-
-                # Mark attendance with PPE status
-                # Note: Currently allowing attendance even if PPE non-compliant (can be changed)
-                if mark_attendance(name, recognition_end_time, time_taken_seconds, 
-                                 ppe_compliant=ppe_compliant, 
-                                 ppe_items=ppe_items_dict,
-                                 ppe_confidence=ppe_avg_confidence):
-                    marked_once.add(name)
-
         # Draw box
         cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-        
+
         # Prepare text with PPE status
-        text = f"{name} ({confidence:.2f})"
+        text = f"{name} ({face['confidence']:.2f})"
         if ppe_model is not None and name != "Unknown" and name != "Spoof Detected":
-            ppe_status = "✓PPE" if ppe_compliant else "✗PPE"
+            ppe_status = "✓PPE" if face["ppe_compliant"] else "✗PPE"
             text += f" [{ppe_status}]"
-        
+
         cv2.putText(frame, text, (x1, y1 - 10),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-    
+
     # Display PPE status on frame
-    if ppe_model is not None and ppe_detections:
-        ppe_status_text = get_ppe_status_string(ppe_detections, ppe_compliance_dict)
+    if ppe_model is not None and result["ppe_detections"]:
+        ppe_status_text = get_ppe_status_string(result["ppe_detections"], result["ppe_compliance_dict"])
         status_color = (0, 255, 0) if ppe_compliant else (0, 0, 255)
         cv2.putText(frame, f"PPE: {ppe_status_text}", (10, 30),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, status_color, 2)
+    return frame
+
+
+def render_frame(frame, result, packet):
+    """Draw the overlays and pipeline latency onto the frame in place and return it."""
+    if result is not None:
+        annotate_frame(frame, result)
+    else:
+        # Heavy stages were skipped by the motion gate
+        cv2.putText(frame, "idle", (frame.shape[1] - 50, frame.shape[0] - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+    cv2.putText(frame, f"{packet.latency * 1000:.0f} ms", (10, frame.shape[0] - 10),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    return frame
+
+
+def show_frame(frame, result, packet):
+    """Output stage: attendance, overlays and display. Returns False when 'q' is pressed."""
+    if result is not None:
+        handle_attendance(result)
+    if packet.stale:
+        # A newer frame is already on screen; only its attendance mattered
+        return True
+    render_frame(frame, result, packet)
 
     cv2.imshow("Face Recognition Attendance", frame)
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+    return not (cv2.waitKey(1) & 0xFF == ord('q'))
 
-cap.release()
-cv2.destroyAllWindows()
-print("📸 Camera stopped.")
\ No newline at end of file
+
+def serve_frame(preview, frame, result, packet, camera="camera"):
+    """Headless output stage: attendance, then hand the frame to the preview (drawn only if watched)."""
+    if result is not None:
+        handle_attendance(result)
+    if preview is not None and not packet.stale:
+        preview.publish(camera, frame, result, packet)
+    return True
+
+
+# ------------------- Main -------------------
+
+if __name__ == "__main__":
+    engine.load()
+    if WARMUP:
+        engine.warmup()
+    print(engine.startup_report())
+    get_attendance_client()  # Resumes delivery of events spooled by an earlier run
+
+    headless = HEADLESS or "--headless" in sys.argv[1:]
+    preview = None
+    if headless:
+        print("🎥 Starting camera (headless). Press Ctrl+C to quit.")
+        preview = PreviewServer(render_frame)
+        preview.start()
+        output = functools.partial(serve_frame, preview)
+    else:
+        print("🎥 Starting camera. Press 'q' to quit.")
+        output = show_frame
+    engine.gallery_watcher.start()
+
+    motion_gate = MotionGate() if MOTION_GATING else None
+    tracker = FaceTracker() if FACE_TRACKING else None
+    camera = CameraPipeline(CAMERA_SOURCE, functools.partial(process_frame, tracker=tracker), output,
+                            num_workers=INFERENCE_WORKERS, motion_gate=motion_gate)
+    try:
+        stats = camera.run()
+    except KeyboardInterrupt:
+        stats = camera.report()
+
+    if preview is not None:
+        preview.stop()
+    else:
+        cv2.destroyAllWindows()
+    print(f"[PIPELINE] {format_stats(stats)}")
+    if motion_gate is not None:
+        print(f"[MOTION] {format_gate_report(motion_gate.report())}")
+    if tracker is not None:
+        print(f"[TRACKER] {tracker.report()}")
+    engine.gallery_watcher.stop()
+    attendance_client = get_attendance_client()
+    attendance_client.close()
+    print(f"[ATTENDANCE] {attendance_client.report()}")
+    print("📸 Camera stopped.")
@@ -0,0 +1,159 @@
+"""
+Lightweight IoU face tracker.
+
+MTCNN still runs on every processed frame, but its boxes are associated with
+the boxes from the previous frame so each face keeps a track ID. The identity,
+similarity, spoof verdict and PPE status worked out for a track are cached on
+it, and the expensive models (ResNet embedding, gallery match, MiniFASNet,
+YOLO) only run again for new tracks or once a track's cache is K frames old.
+"""
+
+import itertools
+import threading
+
+import numpy as np
+
+# ------------------- Configuration -------------------
+TRACK_IOU_THRESHOLD = 0.3       # Min IoU to continue a track with a new box
+TRACK_MAX_MISSED = 5            # Frames a track survives without a matching box
+TRACK_REFRESH_INTERVAL = 15     # Re-run the heavy models on a known track every K frames
+TRACK_UNKNOWN_REFRESH_INTERVAL = 3  # ...and sooner while it is still Unknown / spoof
+# -----------------------------------------------------
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU between (N, 4) and (M, 4) arrays of x1, y1, x2, y2 boxes."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-6)
+
+
+class Track:
+    """One tracked face and the cached results of the heavy models for it."""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.missed = 0
+        self.frames_since_refresh = 0
+        # Cached recognition results, filled in by the caller after a refresh
+        self.face = None
+
+    def needs_refresh(self, refresh_interval, unknown_refresh_interval):
+        if self.face is None:
+            return True
+        interval = refresh_interval
+        if not self.face.get("is_real") or self.face.get("name") == "Unknown":
+            interval = unknown_refresh_interval
+        return self.frames_since_refresh >= interval
+
+    def store(self, face):
+        self.face = face
+        self.frames_since_refresh = 0
+
+
+class FaceTracker:
+    """
+    Greedy IoU association of detection boxes to existing tracks.
+
+    Not tied to any model: update() takes the boxes of one frame and returns
+    the matching Track for each of them, in the same order. One tracker per
+    camera.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_missed=TRACK_MAX_MISSED,
+                 refresh_interval=TRACK_REFRESH_INTERVAL,
+                 unknown_refresh_interval=TRACK_UNKNOWN_REFRESH_INTERVAL):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.refresh_interval = refresh_interval
+        self.unknown_refresh_interval = unknown_refresh_interval
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.lock = threading.Lock()
+        # Latest frame-level PPE result, shared by every track in the frame
+        self.ppe = None
+        self.frames_since_ppe = 0
+        self.refreshes = 0
+        self.cache_hits = 0
+
+    def update(self, boxes):
+        """
+        Associate this frame's boxes with tracks.
+
+        Returns:
+            list of Track, one per box; new faces get a fresh track
+        """
+        boxes = [np.asarray(box, dtype=np.float32) for box in boxes]
+        assigned = [None] * len(boxes)
+
+        if self.tracks and boxes:
+            iou = box_iou([t.box for t in self.tracks], boxes)
+            # Greedy: best overlapping pair first
+            pairs = np.dstack(np.unravel_index(np.argsort(-iou, axis=None), iou.shape))[0]
+            used_tracks = set()
+            for t_idx, b_idx in pairs:
+                if iou[t_idx, b_idx] < self.iou_threshold:
+                    break
+                if t_idx in used_tracks or assigned[b_idx] is not None:
+                    continue
+                used_tracks.add(t_idx)
+                assigned[b_idx] = self.tracks[t_idx]
+
+        matched = set(id(t) for t in assigned if t is not None)
+        survivors = []
+        for track in self.tracks:
+            if id(track) in matched:
+                survivors.append(track)
+                continue
+            track.missed += 1
+            if track.missed <= self.max_missed:
+                survivors.append(track)
+
+        for b_idx, box in enumerate(boxes):
+            track = assigned[b_idx]
+            if track is None:
+                track = Track(next(self._ids), box)
+                survivors.append(track)
+                assigned[b_idx] = track
+            else:
+                track.box = box
+                track.missed = 0
+                track.frames_since_refresh += 1
+
+        self.tracks = survivors
+        return assigned
+
+    def stale(self, tracks):
+        """Indices of the given tracks whose cached results must be recomputed."""
+        stale = [i for i, track in enumerate(tracks)
+                 if track.needs_refresh(self.refresh_interval, self.unknown_refresh_interval)]
+        self.refreshes += len(stale)
+        self.cache_hits += len(tracks) - len(stale)
+        return stale
+
+    def ppe_due(self):
+        """True when the cached frame-level PPE result is K frames old (or missing)."""
+        self.frames_since_ppe += 1
+        return self.ppe is None or self.frames_since_ppe >= self.refresh_interval
+
+    def store_ppe(self, ppe):
+        self.ppe = ppe
+        self.frames_since_ppe = 0
+
+    def report(self):
+        total = self.refreshes + self.cache_hits
+        return {
+            "active_tracks": len(self.tracks),
+            "refreshes": self.refreshes,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": self.cache_hits / total if total else 0.0,
+        }
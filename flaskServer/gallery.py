@@ -0,0 +1,258 @@
+"""
+Binary face gallery.
+
+Replaces walking backend/uploads/*/embeddings.csv at startup. A gallery is a
+directory holding:
+    embeddings.npy  (N, 512) float32, float16 or int8, rows already L2-normalised
+    scales.npy      (N,) float32 per-row scales, int8 galleries only
+    quality.npy     (N,) float32 template quality (faceQuality), if known
+    labels.npy      (N,) int32, row -> index into the identity table
+    ids.json        identity table and format metadata
+
+embeddings.npy is opened with np.load(mmap_mode='r'), so loading is near
+instant regardless of gallery size and every process on the box shares the
+same page-cache copy of the matrix.
+
+Convert the CSV layout written by createEmbeddings.generate_embeddings:
+    python gallery.py convert ../backend/uploads ./gallery [--float16 | --int8]
+
+int8 rows are stored symmetrically quantized with one scale per row
+(row ~= codes * scale), a quarter of the float32 size; float16 is half.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+GALLERY_FORMAT_VERSION = 1
+EMBEDDING_DIM = 512
+EMBEDDINGS_FILE = "embeddings.npy"
+LABELS_FILE = "labels.npy"
+SCALES_FILE = "scales.npy"
+QUALITY_FILE = "quality.npy"
+QUALITY_CSV = "quality.csv"  # Per-person sidecar of embeddings.csv, one value per row
+STORAGE_DTYPES = ("float32", "float16", "int8")
+IDS_FILE = "ids.json"
+
+
+def l2_normalize(matrix):
+    """Row-wise L2 normalisation of an (N, D) array, returned as float32."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(matrix):
+    """
+    Symmetric per-row int8 quantization.
+
+    Returns:
+        tuple: (int8 codes (N, D), float32 scales (N,)) with row ~= codes * scale
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.empty(0, dtype=np.float32)
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def dequantize_int8(codes, scales):
+    return codes.astype(np.float32) * scales[:, None]
+
+
+class Gallery:
+    """
+    Enrolled face templates: a contiguous (N, 512) matrix plus an ID table.
+
+    Attributes:
+        embeddings: (N, 512) array, float32, float16 or int8 codes (possibly a
+            read-only memmap)
+        labels: (N,) int32 array of indices into names
+        names: list of identity names (person folder names)
+        scales: (N,) float32 row scales when embeddings holds int8 codes, else None
+        quality: (N,) float32 template quality in [0, 1], or None if unknown
+    """
+
+    def __init__(self, embeddings, labels, names, scales=None, quality=None):
+        self.embeddings = embeddings
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.names = list(names)
+        self.scales = scales
+        self.quality = None if quality is None else np.asarray(quality, dtype=np.float32)
+        if len(self.embeddings) != len(self.labels):
+            raise ValueError("Gallery embeddings and labels have different lengths")
+        if self.quality is not None and len(self.quality) != len(self.labels):
+            raise ValueError("Gallery quality and labels have different lengths")
+
+    def __len__(self):
+        return len(self.labels)
+
+    def row_names(self):
+        """Identity name for every row (the old all_names list)."""
+        return [self.names[label] for label in self.labels]
+
+    def as_float32(self):
+        """
+        The matrix as float32 (no copy if it already is). A float16 or int8
+        gallery is widened into a new full-size array, so this is for tools;
+        the recognizer (liveGallery) scores the stored rows as they are.
+        """
+        if self.scales is not None:
+            return dequantize_int8(self.embeddings, self.scales)
+        return np.ascontiguousarray(self.embeddings, dtype=np.float32)
+
+    # ------------------- Loading -------------------
+
+    @classmethod
+    def load(cls, gallery_dir, mmap=True):
+        """Open a gallery directory written by save()."""
+        with open(os.path.join(gallery_dir, IDS_FILE), "r") as f:
+            meta = json.load(f)
+        if meta.get("version") != GALLERY_FORMAT_VERSION:
+            raise ValueError(f"Unsupported gallery format version: {meta.get('version')}")
+
+        mmap_mode = "r" if mmap else None
+        embeddings = np.load(os.path.join(gallery_dir, EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+        labels = np.load(os.path.join(gallery_dir, LABELS_FILE))
+        if embeddings.ndim != 2 or embeddings.shape[1] != meta["dim"]:
+            raise ValueError(f"Gallery matrix has shape {embeddings.shape}, expected (N, {meta['dim']})")
+        scales = None
+        if meta.get("dtype") == "int8":
+            scales = np.load(os.path.join(gallery_dir, SCALES_FILE))
+        quality = None
+        if meta.get("quality"):
+            quality = np.load(os.path.join(gallery_dir, QUALITY_FILE))
+        return cls(embeddings, labels, meta["names"], scales, quality)
+
+    @classmethod
+    def from_csv_folder(cls, uploads_folder):
+        """
+        Build a gallery from the per-person embeddings.csv layout (one folder
+        per person, one 512-value row per template, quality.csv alongside).
+        """
+        blocks = []
+        labels = []
+        qualities = []
+        names = []
+        for person_folder in sorted(os.listdir(uploads_folder)):
+            csv_path = os.path.join(uploads_folder, person_folder, "embeddings.csv")
+            if not os.path.exists(csv_path):
+                continue
+            block = read_embeddings_csv(csv_path)
+            if len(block) == 0:
+                continue
+            labels.append(np.full(len(block), len(names), dtype=np.int32))
+            qualities.append(read_quality_csv(os.path.join(uploads_folder, person_folder), len(block)))
+            names.append(person_folder)
+            blocks.append(block)
+
+        if not blocks:
+            return cls(np.empty((0, EMBEDDING_DIM), dtype=np.float32), [], [])
+        quality = None
+        if any(q is not None for q in qualities):
+            # People enrolled before the quality gate count as full quality
+            quality = np.concatenate([np.ones(len(b), dtype=np.float32) if q is None else q
+                                      for b, q in zip(blocks, qualities)])
+        return cls(l2_normalize(np.concatenate(blocks)), np.concatenate(labels), names, quality=quality)
+
+    # ------------------- Saving -------------------
+
+    def save(self, gallery_dir, dtype="float32"):
+        """
+        Write the gallery. Files are written under temporary names and moved
+        into place, ids.json last, so a reader never opens a half-written one.
+        """
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported gallery dtype: {dtype}")
+        os.makedirs(gallery_dir, exist_ok=True)
+
+        scales = None
+        if dtype == "int8":
+            embeddings, scales = quantize_int8(self.as_float32())
+        else:
+            embeddings = np.ascontiguousarray(self.as_float32(), dtype=dtype)
+        meta = {
+            "version": GALLERY_FORMAT_VERSION,
+            "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else EMBEDDING_DIM,
+            "dtype": dtype,
+            "normalized": True,
+            "count": len(self),
+            "quality": self.quality is not None,
+            "names": self.names,
+        }
+
+        def write(file_name, writer):
+            final_path = os.path.join(gallery_dir, file_name)
+            tmp_path = final_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                writer(f)
+            os.replace(tmp_path, final_path)
+
+        write(EMBEDDINGS_FILE, lambda f: np.save(f, embeddings))
+        write(LABELS_FILE, lambda f: np.save(f, self.labels))
+        if scales is not None:
+            write(SCALES_FILE, lambda f: np.save(f, scales))
+        elif os.path.exists(os.path.join(gallery_dir, SCALES_FILE)):
+            os.remove(os.path.join(gallery_dir, SCALES_FILE))
+        if self.quality is not None:
+            write(QUALITY_FILE, lambda f: np.save(f, self.quality))
+        elif os.path.exists(os.path.join(gallery_dir, QUALITY_FILE)):
+            os.remove(os.path.join(gallery_dir, QUALITY_FILE))
+        write(IDS_FILE, lambda f: f.write(json.dumps(meta, indent=2).encode("utf-8")))
+
+
+def read_embeddings_csv(csv_path):
+    """Read one embeddings.csv into a float32 (K, 512) array (no per-row Python loop)."""
+    # Only CSV galleries need pandas; a binary gallery starts without importing it
+    import pandas as pd
+
+    try:
+        return pd.read_csv(csv_path, header=None, dtype=np.float32).to_numpy()
+    except pd.errors.EmptyDataError:
+        return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+
+
+def read_quality_csv(person_folder, count):
+    """A person's (count,) template qualities, or None if they have no matching quality.csv."""
+    path = os.path.join(person_folder, QUALITY_CSV)
+    try:
+        quality = np.loadtxt(path, dtype=np.float32, ndmin=1)
+    except (OSError, ValueError):
+        return None
+    # A stale file from an earlier enrollment doesn't describe these rows
+    return quality if len(quality) == count else None
+
+
+def write_quality_csv(person_folder, qualities):
+    np.savetxt(os.path.join(person_folder, QUALITY_CSV), np.asarray(qualities, dtype=np.float32), fmt="%.4f")
+
+
+def load_gallery(gallery_dir, uploads_folder):
+    """Open the binary gallery if there is one, else fall back to the CSV layout."""
+    if gallery_dir and os.path.exists(os.path.join(gallery_dir, IDS_FILE)):
+        print(f"[INFO] Loading binary gallery from {gallery_dir}")
+        return Gallery.load(gallery_dir)
+    print(f"[INFO] No binary gallery found, reading CSV embeddings from {uploads_folder}")
+    return Gallery.from_csv_folder(uploads_folder)
+
+
+def convert_csv_gallery(uploads_folder, gallery_dir, dtype="float32"):
+    gallery = Gallery.from_csv_folder(uploads_folder)
+    gallery.save(gallery_dir, dtype=dtype)
+    print(f"[SUCCESS] Wrote {len(gallery)} templates for {len(gallery.names)} person(s) "
+          f"to {gallery_dir} ({dtype})")
+    return gallery
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[1] != "convert":
+        print("Usage: python gallery.py convert <uploads_folder> <gallery_dir> [--float16 | --int8]")
+        sys.exit(1)
+    storage_dtype = "float32"
+    if "--float16" in sys.argv[4:]:
+        storage_dtype = "float16"
+    elif "--int8" in sys.argv[4:]:
+        storage_dtype = "int8"
+    convert_csv_gallery(sys.argv[2], sys.argv[3], dtype=storage_dtype)
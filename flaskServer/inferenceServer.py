@@ -0,0 +1,346 @@
+"""
+Local HTTP inference service.
+
+One warm RecognitionEngine shared by thin camera clients and the backend:
+
+    POST /detect      face boxes
+    POST /embed       L2-normalised 512-d embeddings (of the given boxes, or of
+                      every detected face)
+    POST /recognize   boxes, names, similarities and (optionally) anti-spoof
+    POST /antispoof   real / spoof per box
+    POST /ppe         PPE compliance of the whole image
+    GET  /health      models loaded, batcher statistics
+
+The body is either the raw image (Content-Type image/jpeg or image/png, boxes
+as a JSON query parameter) or JSON {"image": <base64>, "boxes": [[x1, y1, x2, y2], ...]}.
+
+Concurrent requests are merged by a MicroBatcher per model: a request waits
+at most MAX_BATCH_WAIT_MS for others to join, then the whole batch goes
+through MTCNN / ResNet / MiniFASNet / YOLO in one call.
+
+    python inferenceServer.py            # or: uvicorn inferenceServer:app --port 8001
+    curl --data-binary @face.jpg -H "Content-Type: image/jpeg" localhost:8001/recognize
+"""
+
+import asyncio
+import base64
+import json
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+from ppeDetection import summarize_ppe
+from recognitionEngine import RecognitionEngine
+
+# ------------------- Configuration -------------------
+INFERENCE_HOST = "127.0.0.1"
+INFERENCE_PORT = 8001
+MAX_BATCH_SIZE = 16         # Requests merged into one model call
+MAX_BATCH_WAIT_MS = 5       # How long the first request of a batch waits for more
+WARMUP = True
+# -----------------------------------------------------
+
+
+class MicroBatcher:
+    """
+    Merge concurrent calls into batched calls of batch_fn.
+
+    batch_fn(items) -> results runs on the batcher's own thread with up to
+    max_batch_size items and must return one result per item. submit()
+    returns a concurrent.futures.Future.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._items = []
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.max_seen = 0
+
+    def submit(self, item):
+        future = Future()
+        with self._cond:
+            self._items.append((item, future))
+            self._cond.notify()
+        return future
+
+    async def run(self, item):
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._items and not self._stop:
+                self._cond.wait()
+            if self._stop:
+                return None
+            # The first request waits up to max_wait for company
+            deadline = time.monotonic() + self.max_wait
+            while len(self._items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._items[:self.max_batch_size]
+            del self._items[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.busy_seconds += time.perf_counter() - started
+            self.batches += 1
+            self.items += len(batch)
+            self.max_seen = max(self.max_seen, len(batch))
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": self.items / self.batches if self.batches else 0.0,
+            "max_batch": self.max_seen,
+            "avg_batch_ms": self.busy_seconds / self.batches * 1000.0 if self.batches else 0.0,
+            "queued": len(self._items),
+        }
+
+    def close(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout=2.0)
+
+
+# ------------------- Batched model calls -------------------
+
+engine = RecognitionEngine()
+
+
+def detect_batch(images):
+    """RGB images of any sizes -> boxes per image; MTCNN runs once per distinct size."""
+    results = [None] * len(images)
+    by_shape = {}
+    for i, image in enumerate(images):
+        by_shape.setdefault(image.shape, []).append(i)
+    for indices in by_shape.values():
+        for i, boxes in zip(indices, engine.detect_faces_batch([images[i] for i in indices])):
+            results[i] = boxes
+    return results
+
+
+def embed_batch(crop_lists):
+    """Lists of 160x160 RGB crops -> one embedding array per list, from one ResNet pass."""
+    flat = [crop for crops in crop_lists for crop in crops]
+    embeddings = engine.embed_crops(flat)
+    results, start = [], 0
+    for crops in crop_lists:
+        results.append(embeddings[start:start + len(crops)])
+        start += len(crops)
+    return results
+
+
+def antispoof_batch(jobs):
+    """(BGR image, boxes) pairs -> list of is_real per box, every face of every request in one forward."""
+    return engine.are_real_faces_many(jobs)
+
+
+def ppe_batch(images):
+    return engine.check_ppe_batch(images)
+
+
+batchers = {}
+
+
+def get_batchers():
+    if not batchers:
+        batchers.update({
+            "detect": MicroBatcher("detect", detect_batch),
+            "embed": MicroBatcher("embed", embed_batch),
+            "antispoof": MicroBatcher("antispoof", antispoof_batch),
+            "ppe": MicroBatcher("ppe", ppe_batch),
+        })
+    return batchers
+
+
+# ------------------- Request parsing -------------------
+
+def decode_image(data):
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+    return image
+
+
+async def read_request(request):
+    """(BGR image, RGB image, boxes or None) from a raw-image or JSON request."""
+    boxes = None
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        if not isinstance(body, dict):
+            raise HTTPException(status_code=400, detail="JSON body must be an object")
+        try:
+            data = base64.b64decode(body["image"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="JSON body needs a base64 'image'")
+        boxes = body.get("boxes")
+    else:
+        data = await request.body()
+        if "boxes" in request.query_params:
+            try:
+                boxes = json.loads(request.query_params["boxes"])
+            except ValueError:
+                raise HTTPException(status_code=400, detail="'boxes' must be a JSON list")
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty image")
+
+    if boxes is not None:
+        boxes = parse_boxes(boxes)
+    bgr = await run_in_threadpool(decode_image, data)
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    return bgr, rgb, boxes
+
+
+def parse_boxes(boxes):
+    """[[x1, y1, x2, y2], ...] as floats, or a 400."""
+    try:
+        parsed = [[float(v) for v in box] for box in boxes]
+    except (TypeError, ValueError):
+        parsed = None
+    if parsed is None or any(len(box) != 4 or not all(np.isfinite(box)) for box in parsed):
+        raise HTTPException(status_code=400, detail="'boxes' must be a list of [x1, y1, x2, y2] numbers")
+    return parsed
+
+
+def box_list(boxes):
+    return [[round(float(v), 1) for v in box] for box in boxes]
+
+
+# ------------------- App -------------------
+
+app = FastAPI(title="Face recognition inference service")
+
+
+@app.on_event("startup")
+def startup():
+    engine.load()
+    if WARMUP:
+        engine.warmup()
+    print(engine.startup_report())
+    get_batchers()
+    engine.gallery_watcher.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    engine.gallery_watcher.stop()
+    for batcher in batchers.values():
+        batcher.close()
+
+
+@app.get("/health")
+def health():
+    return {
+        "loaded": [name for name in ("mtcnn", "resnet", "anti_spoof", "ppe", "gallery") if engine.is_loaded(name)],
+        "gallery_size": len(engine.live_gallery.snapshot()),
+        "batchers": {name: batcher.stats() for name, batcher in get_batchers().items()},
+    }
+
+
+@app.post("/detect")
+async def detect(request: Request):
+    _, rgb, _ = await read_request(request)
+    boxes = await get_batchers()["detect"].run(rgb)
+    return {"boxes": box_list(boxes)}
+
+
+async def _embed(rgb, boxes):
+    if boxes is None:
+        boxes = await get_batchers()["detect"].run(rgb)
+    crops, kept = await run_in_threadpool(engine.crop_faces, rgb, boxes)
+    embeddings = await get_batchers()["embed"].run(crops) if crops else np.empty((0, 512), dtype=np.float32)
+    return [boxes[i] for i in kept], embeddings
+
+
+@app.post("/embed")
+async def embed(request: Request):
+    _, rgb, boxes = await read_request(request)
+    boxes, embeddings = await _embed(rgb, boxes)
+    return {"boxes": box_list(boxes), "embeddings": embeddings.round(6).tolist()}
+
+
+@app.post("/recognize")
+async def recognize(request: Request, antispoof: bool = True, ppe: bool = False):
+    bgr, rgb, boxes = await read_request(request)
+    boxes, embeddings = await _embed(rgb, boxes)
+    matches = await run_in_threadpool(engine.match_embeddings, embeddings) if len(embeddings) else []
+
+    # Anti-spoof and PPE batch independently of each other
+    pending = {}
+    if antispoof and boxes:
+        pending["antispoof"] = get_batchers()["antispoof"].run((bgr, boxes))
+    if ppe:
+        pending["ppe"] = get_batchers()["ppe"].run(bgr)
+    done = dict(zip(pending, await asyncio.gather(*pending.values())))
+
+    is_real = done.get("antispoof", [None] * len(boxes))
+    response = {
+        "faces": [{"box": box, "name": name, "confidence": round(float(confidence), 4), "is_real": real}
+                  for box, (name, confidence), real in zip(box_list(boxes), matches, is_real)],
+    }
+    if ppe:
+        _, ppe_compliant, ppe_compliance_dict = done["ppe"]
+        ppe_items, ppe_confidence = summarize_ppe(ppe_compliance_dict)
+        response["ppe"] = {"compliant": ppe_compliant, "items": ppe_items, "confidence": ppe_confidence}
+    return response
+
+
+@app.post("/antispoof")
+async def antispoof(request: Request):
+    bgr, rgb, boxes = await read_request(request)
+    if boxes is None:
+        boxes = await get_batchers()["detect"].run(rgb)
+    is_real = await get_batchers()["antispoof"].run((bgr, boxes)) if boxes else []
+    return {"faces": [{"box": box, "is_real": real} for box, real in zip(box_list(boxes), is_real)]}
+
+
+@app.post("/ppe")
+async def ppe(request: Request):
+    bgr, _, _ = await read_request(request)
+    ppe_detections, ppe_compliant, ppe_compliance_dict = await get_batchers()["ppe"].run(bgr)
+    return {
+        "compliant": ppe_compliant,
+        "items": ppe_compliance_dict,
+        "detections": (ppe_detections or {}).get("all_detections", []),
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=INFERENCE_HOST, port=INFERENCE_PORT)
@@ -0,0 +1,429 @@
+"""
+Hot-reloadable gallery.
+
+The recognizer used to build all_embeddings and its NearestNeighbors index once
+at import, so people registered through the backend's /register route were
+only recognised after a restart. LiveGallery keeps the templates in segments,
+each with its own small index:
+
+    - adding a person appends a new segment holding just their templates
+    - replacing a person tombstones their old rows and appends a new segment
+    - removing a person only tombstones rows
+
+Nothing already indexed is rebuilt. Every change publishes a new immutable
+GallerySnapshot by a single reference assignment, so a match in flight keeps
+using the snapshot it started with and never sees a half-applied update.
+With batch matching the snapshot's BatchMatcher is built before it is
+published, and segments are merged (and tombstones dropped) once there are
+too many of them, both on the watcher thread, never on the camera loop.
+
+UploadsWatcher polls backend/uploads for new, changed or deleted
+embeddings.csv files (and their quality.csv) and feeds them into a LiveGallery.
+
+Templates keep the gallery's storage: a float16 or int8 gallery (gallery.py
+convert) stays in that form, memmapped where it was loaded, and people added
+later are stored the same way, so the matcher scores the stored rows without
+widening them to float32.
+
+Segment indexes (per-face lookup only, not built with batch matching) come
+from annIndex.create_index, so large segments (the base gallery and merged
+ones) can use an approximate backend while the small per-person segments stay
+exact.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from annIndex import BruteForceIndex, create_index
+from faceMatcher import BatchMatcher
+from gallery import (EMBEDDING_DIM, IDS_FILE, dequantize_int8, l2_normalize, quantize_int8, read_embeddings_csv,
+                     read_quality_csv)
+
+# ------------------- Configuration -------------------
+WATCH_INTERVAL = 2.0        # Seconds between scans of the uploads folder
+MAX_SEGMENTS = 16           # Merge segments beyond this many
+MAX_DEAD_FRACTION = 0.25    # ...or once this share of rows is tombstoned
+# -----------------------------------------------------
+
+FOLDER_ONLY = (None, None)  # UploadsWatcher state of a gallery person whose folder has no embeddings.csv
+
+
+class _Segment:
+    """
+    An immutable block of templates (float32, float16, or int8 codes with
+    per-row scales), their quality (None if unknown) and a cosine index (see
+    annIndex) when indexed is True.
+    """
+
+    def __init__(self, embeddings, labels, quality=None, scales=None, indexed=True):
+        self.embeddings = embeddings
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.quality = None if quality is None else np.asarray(quality, dtype=np.float32)
+        self.scales = None if scales is None else np.asarray(scales, dtype=np.float32)
+        self.index = create_index(self.as_float32()) if indexed else None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def as_float32(self):
+        if self.scales is not None:
+            return dequantize_int8(self.embeddings, self.scales)
+        return np.ascontiguousarray(self.embeddings, dtype=np.float32)
+
+    def search(self, queries, k):
+        # Unindexed segments (batch matching) still answer nearest() by exact search
+        index = self.index if self.index is not None else BruteForceIndex(self.as_float32())
+        return index.search(queries, k)
+
+
+class GallerySnapshot:
+    """
+    A consistent, read-only view of the gallery at one point in time.
+
+    Attributes:
+        segments: tuple of _Segment
+        alive: tuple of bool arrays, one per segment (False = tombstoned row)
+        names: tuple of identity names indexed by label
+        version: increases with every published change
+    """
+
+    def __init__(self, segments, alive, names, version):
+        self.segments = tuple(segments)
+        self.alive = tuple(alive)
+        self.names = tuple(names)
+        self.version = version
+        self.dead = tuple(int(len(mask) - mask.sum()) for mask in self.alive)
+        self.size = sum(int(mask.sum()) for mask in self.alive)
+        self._matchers = {}
+        self._matcher_lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def nearest(self, embedding):
+        """
+        Best matching live template for one embedding.
+
+        Returns:
+            tuple: (name, cosine similarity) or (None, 0.0) for an empty gallery
+        """
+        query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        best_name, best_similarity = None, -np.inf
+        for segment, alive, dead in zip(self.segments, self.alive, self.dead):
+            if dead == len(segment):
+                continue
+            # Ask for enough neighbours to get past every tombstoned row
+            k = min(len(segment), dead + 1)
+            similarities, indices = segment.search(query, k)
+            for similarity, row in zip(similarities[0], indices[0]):
+                # row is -1 when an approximate index found fewer than k candidates
+                if row >= 0 and alive[row]:
+                    if similarity > best_similarity:
+                        best_name, best_similarity = self.names[segment.labels[row]], similarity
+                    break
+        if best_name is None:
+            return None, 0.0
+        return best_name, float(best_similarity)
+
+    def matcher(self, aggregation, top_m, precision="float32", rerank=0):
+        """
+        faceMatcher.BatchMatcher over the live rows, weighted by template
+        quality, kept for the lifetime of this snapshot. LiveGallery builds the
+        configured one before publishing; any other is built on first use.
+        """
+        key = (aggregation, top_m, precision, rerank)
+        with self._matcher_lock:
+            matcher = self._matchers.get(key)
+            if matcher is None:
+                embeddings, labels = self.live_embeddings()
+                matcher = BatchMatcher(embeddings, labels, self.names, aggregation, top_m, precision, rerank,
+                                       weights=self.live_quality(), scales=self.live_scales())
+                self._matchers[key] = matcher
+        return matcher
+
+    def live_embeddings(self):
+        """
+        (embeddings, labels) of all live rows, in the gallery's storage (int8
+        codes pair with live_scales()). A single fully live segment is
+        returned as is (possibly a memmap), so treat the result as read-only.
+        """
+        if len(self.segments) == 1 and self.dead[0] == 0:
+            return self.segments[0].embeddings, self.segments[0].labels
+        blocks = [segment.embeddings[alive] for segment, alive in zip(self.segments, self.alive)]
+        labels = [segment.labels[alive] for segment, alive in zip(self.segments, self.alive)]
+        if not blocks:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32), np.empty(0, dtype=np.int32)
+        return np.concatenate(blocks), np.concatenate(labels)
+
+    def live_scales(self):
+        """(N,) int8 row scales in live_embeddings() order, or None for a float gallery."""
+        if all(segment.scales is None for segment in self.segments):
+            return None
+        if len(self.segments) == 1 and self.dead[0] == 0:
+            return self.segments[0].scales
+        return np.concatenate([segment.scales[alive] for segment, alive in zip(self.segments, self.alive)])
+
+    def live_quality(self):
+        """(N,) quality of the live rows in live_embeddings() order, or None if no segment has any."""
+        if all(segment.quality is None for segment in self.segments):
+            return None
+        blocks = [(np.ones(len(segment), dtype=np.float32) if segment.quality is None else segment.quality)[alive]
+                  for segment, alive in zip(self.segments, self.alive)]
+        return np.concatenate(blocks)
+
+    def person_names(self):
+        labels = set()
+        for segment, alive in zip(self.segments, self.alive):
+            labels.update(segment.labels[alive].tolist())
+        return sorted(self.names[label] for label in labels)
+
+
+class LiveGallery:
+    """
+    Gallery that can change while the recognizer runs.
+
+    Readers call snapshot() once per match (or per frame) and use only that
+    snapshot. Writers (upsert/remove) are serialised by a lock and publish a
+    new snapshot when done.
+
+    Args:
+        gallery: Initial gallery.Gallery, or None to start empty
+        matcher_args: (aggregation, top_m, precision, rerank) of the
+            BatchMatcher every snapshot gets before it is published, or None
+            for per-face index lookup (GallerySnapshot.nearest)
+    """
+
+    def __init__(self, gallery=None, matcher_args=None):
+        self._lock = threading.Lock()
+        self._matcher_args = matcher_args
+        self._names = []
+        self._label_of = {}
+        self._version = 0
+        self._storage = "float32"
+        segments, alive = [], []
+        if gallery is not None and len(gallery):
+            self._names = list(gallery.names)
+            self._label_of = {name: i for i, name in enumerate(self._names)}
+            self._storage = "int8" if gallery.scales is not None else gallery.embeddings.dtype.name
+            segments.append(self._segment(gallery.embeddings, gallery.labels, gallery.quality, gallery.scales))
+            alive.append(np.ones(len(gallery), dtype=bool))
+        self._snapshot = self._prepare(GallerySnapshot(segments, alive, self._names, self._version))
+
+    def snapshot(self):
+        return self._snapshot
+
+    def _segment(self, embeddings, labels, quality=None, scales=None):
+        # Batch matching scores the whole snapshot at once; per-segment indexes would go unused
+        return _Segment(embeddings, labels, quality, scales, indexed=self._matcher_args is None)
+
+    def _store(self, embeddings):
+        """(rows, scales or None) of new float32 templates in the gallery's storage."""
+        if self._storage == "int8":
+            return quantize_int8(embeddings)
+        return embeddings.astype(self._storage, copy=False), None
+
+    def _prepare(self, snapshot):
+        """Build the snapshot's matcher now, so no frame pays for it after a reload."""
+        if self._matcher_args is not None:
+            snapshot.matcher(*self._matcher_args)
+        return snapshot
+
+    def _label(self, name):
+        label = self._label_of.get(name)
+        if label is None:
+            label = len(self._names)
+            self._names.append(name)
+            self._label_of[name] = label
+        return label
+
+    def _tombstone(self, snapshot, label):
+        """Alive masks with every row of label cleared (copy-on-write per segment)."""
+        alive = list(snapshot.alive)
+        removed = 0
+        for i, segment in enumerate(snapshot.segments):
+            hits = (segment.labels == label) & alive[i]
+            if hits.any():
+                alive[i] = alive[i] & ~hits
+                removed += int(hits.sum())
+        return alive, removed
+
+    def _publish(self, segments, alive):
+        self._version += 1
+        snapshot = self._prepare(GallerySnapshot(segments, alive, self._names, self._version))
+        # Single reference assignment: readers see the old or the new snapshot, never a mix
+        self._snapshot = snapshot
+        return snapshot
+
+    def upsert(self, name, embeddings, quality=None):
+        """Add a person, or replace all of their templates (quality: optional (K,) template quality)."""
+        embeddings = l2_normalize(np.asarray(embeddings).reshape(-1, EMBEDDING_DIM))
+        with self._lock:
+            current = self._snapshot
+            label = self._label(name)
+            alive, replaced = self._tombstone(current, label)
+            segments = list(current.segments)
+            if len(embeddings):
+                rows, scales = self._store(embeddings)
+                segments.append(self._segment(rows, np.full(len(embeddings), label, dtype=np.int32), quality, scales))
+                alive.append(np.ones(len(embeddings), dtype=bool))
+            self._publish(segments, alive)
+        return replaced
+
+    def remove(self, name):
+        """Remove a person. Returns the number of templates dropped."""
+        with self._lock:
+            label = self._label_of.get(name)
+            if label is None:
+                return 0
+            current = self._snapshot
+            alive, removed = self._tombstone(current, label)
+            if removed:
+                self._publish(current.segments, alive)
+        return removed
+
+    def needs_compaction(self):
+        snapshot = self._snapshot
+        total = sum(len(segment) for segment in snapshot.segments)
+        dead = sum(snapshot.dead)
+        return len(snapshot.segments) > MAX_SEGMENTS or (total and dead / total > MAX_DEAD_FRACTION)
+
+    def compact(self):
+        """Merge every segment into one and drop tombstoned rows."""
+        with self._lock:
+            current = self._snapshot
+            embeddings, labels = current.live_embeddings()
+            segments, alive = [], []
+            if len(labels):
+                segments.append(self._segment(embeddings, labels, current.live_quality(), current.live_scales()))
+                alive.append(np.ones(len(labels), dtype=bool))
+            self._publish(segments, alive)
+
+
+class UploadsWatcher:
+    """
+    Poll the uploads folder and apply embeddings.csv changes to a LiveGallery.
+
+    A person is removed when the watcher saw their embeddings.csv and it is
+    gone. People of the loaded gallery whose folder has no CSV (a binary
+    gallery from bulkEnrollment without --csv) are removed only when their
+    folder is deleted, and people with no folder at all are left alone.
+
+    Args:
+        live_gallery: LiveGallery to update
+        uploads_folder: Folder with one sub-folder (and embeddings.csv) per person
+        since: Timestamp the gallery was built at; CSVs modified after it are
+            (re)loaded on the first scan. None treats every CSV present now as
+            already loaded.
+    """
+
+    def __init__(self, live_gallery, uploads_folder, since=None, interval=WATCH_INTERVAL):
+        self.live_gallery = live_gallery
+        self.uploads_folder = uploads_folder
+        self.interval = interval
+        self._seen = {}
+        self._since = since
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _scan(self):
+        """
+        ({person: (mtime, size) of their embeddings.csv}, set of every person
+        folder), or None when the uploads folder itself is missing.
+        """
+        found, folders = {}, set()
+        try:
+            entries = list(os.scandir(self.uploads_folder))
+        except FileNotFoundError:
+            return None
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            folders.add(entry.name)
+            csv_path = os.path.join(entry.path, "embeddings.csv")
+            try:
+                stat = os.stat(csv_path)
+            except FileNotFoundError:
+                continue
+            found[entry.name] = (stat.st_mtime, stat.st_size)
+        return found, folders
+
+    def prime(self):
+        """Record the current state of the uploads folder as already loaded."""
+        scan = self._scan()
+        current, folders = scan if scan is not None else ({}, set())
+        # People of the loaded gallery with a folder but no CSV (bulkEnrollment without --csv)
+        # are tracked by their folder, so deleting it removes them
+        seen = {name: FOLDER_ONLY for name in self.live_gallery.snapshot().person_names() if name in folders}
+        if self._since is None:
+            seen.update(current)
+        else:
+            # Only people whose CSV is older than the gallery count as loaded
+            seen.update((name, state) for name, state in current.items() if state[0] <= self._since)
+        self._seen = seen
+
+    def poll(self):
+        """Apply any changes since the last scan. Returns (added_or_replaced, removed) names."""
+        scan = self._scan()
+        if scan is None:
+            # No uploads folder (unmounted, not created yet): nothing can be told apart from a deletion
+            return [], []
+        current, folders = scan
+        changed = [name for name, state in current.items() if self._seen.get(name) != state]
+        # A CSV-tracked person is gone with their CSV; a folder-only one only with their folder
+        removed = [name for name, state in self._seen.items()
+                   if name not in current and (state != FOLDER_ONLY or name not in folders)]
+
+        for name in changed:
+            csv_path = os.path.join(self.uploads_folder, name, "embeddings.csv")
+            try:
+                embeddings = read_embeddings_csv(csv_path)
+            except Exception as e:
+                # Probably still being written by createEmbeddings; retry next scan
+                print(f"[GALLERY] Could not read {csv_path} yet: {e}")
+                current.pop(name, None)
+                continue
+            quality = read_quality_csv(os.path.dirname(csv_path), len(embeddings))
+            replaced = self.live_gallery.upsert(name, embeddings, quality)
+            action = "Updated" if replaced else "Added"
+            print(f"[GALLERY] {action} {name} ({len(embeddings)} template(s))")
+
+        for name in removed:
+            dropped = self.live_gallery.remove(name)
+            print(f"[GALLERY] Removed {name} ({dropped} template(s))")
+
+        # CSVs that failed to read were dropped from current, so they are retried next scan
+        kept = {name: state for name, state in self._seen.items()
+                if state == FOLDER_ONLY and name not in current and name not in removed}
+        self._seen = dict(kept, **current)
+        if self.live_gallery.needs_compaction():
+            self.live_gallery.compact()
+            print(f"[GALLERY] Compacted to {len(self.live_gallery.snapshot())} template(s)")
+        return changed, removed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[GALLERY ERROR] Reload failed: {e}")
+
+    def start(self):
+        self.prime()
+        self.poll()
+        self._thread = threading.Thread(target=self._run, name="gallery-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+
+def gallery_built_at(gallery_dir):
+    """mtime of a binary gallery's ids.json, or None if there is none."""
+    try:
+        return os.path.getmtime(os.path.join(gallery_dir, IDS_FILE))
+    except (OSError, TypeError):
+        return None
@@ -0,0 +1,166 @@
+"""
+Motion gate for the heavy recognition stages.
+
+A cheap change detector runs on a small grayscale copy of every frame. While
+the scene is moving (and for a short hold period after) every frame goes
+through MTCNN / ResNet / anti-spoof / YOLO as before. Once the scene has been
+static for longer than the hold period the heavy stages only run at a low idle
+rate, which is what most of the night shift looks like.
+
+The gate keeps an average of the CPU time a full heavy pass costs and counts
+that as saved for every frame it lets through without one. Its own cost is
+thread CPU time (time.thread_time) of should_process, so other workers and
+cameras running at the same moment are not billed to it. The heavy-pass cost
+is process-wide (time.process_time), because torch runs a pass on its own
+intra-op threads; with several inference workers it also includes whatever
+the others did meanwhile, so the saving is an upper estimate there.
+"""
+
+import threading
+import time
+
+import cv2
+
+# ------------------- Configuration -------------------
+MOTION_DOWNSCALE_WIDTH = 160   # Width (px) of the frame the detector looks at
+MOTION_PIXEL_THRESHOLD = 25    # Per-pixel gray level change that counts as motion
+MOTION_AREA_FRACTION = 0.005   # Fraction of changed pixels that counts as scene motion
+MOTION_HOLD_SECONDS = 2.0      # Keep full rate this long after the last motion
+IDLE_FPS = 1.0                 # Heavy-stage rate while the scene is static
+# -----------------------------------------------------
+
+
+class MotionGate:
+    """
+    Decide per frame whether the heavy stages need to run.
+
+    Args:
+        method: "diff" (difference against the previous frame) or "mog2"
+            (OpenCV background subtractor, more robust to camera noise)
+        downscale_width: Width the frame is resized to before detection
+        pixel_threshold: Gray level change for a pixel to count as changed
+        area_fraction: Fraction of changed pixels needed to call it motion
+        hold_seconds: How long full rate is kept after motion stops
+        idle_fps: Heavy-stage rate while the scene is static (0 disables idle runs)
+    """
+
+    def __init__(self, method="diff", downscale_width=MOTION_DOWNSCALE_WIDTH,
+                 pixel_threshold=MOTION_PIXEL_THRESHOLD, area_fraction=MOTION_AREA_FRACTION,
+                 hold_seconds=MOTION_HOLD_SECONDS, idle_fps=IDLE_FPS):
+        if method not in ("diff", "mog2"):
+            raise ValueError(f"Unknown motion detection method: {method}")
+        self.method = method
+        self.downscale_width = downscale_width
+        self.pixel_threshold = pixel_threshold
+        self.area_fraction = area_fraction
+        self.hold_seconds = hold_seconds
+        self.idle_interval = 1.0 / idle_fps if idle_fps > 0 else float("inf")
+
+        self._lock = threading.Lock()
+        self._previous = None
+        self._subtractor = None
+        if method == "mog2":
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(history=300, detectShadows=False)
+        self._last_motion = None
+        self._last_run = None
+
+        self.frames_seen = 0
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.avg_run_cpu = 0.0   # Process-wide CPU seconds of one heavy pass
+        self.cpu_saved = 0.0     # Process-wide estimate
+        self.gate_cpu = 0.0      # This gate's own thread CPU seconds
+
+    def _small_gray(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.downscale_width / float(width)
+        small = cv2.resize(frame, (self.downscale_width, max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _detect_motion(self, frame):
+        gray = self._small_gray(frame)
+        if self.method == "mog2":
+            mask = self._subtractor.apply(gray)
+            changed = cv2.countNonZero(mask)
+        else:
+            previous, self._previous = self._previous, gray
+            if previous is None or previous.shape != gray.shape:
+                return True
+            diff = cv2.absdiff(gray, previous)
+            _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+            changed = cv2.countNonZero(mask)
+        return changed >= self.area_fraction * gray.size
+
+    def should_process(self, frame):
+        """Return True if the heavy stages should run on this frame."""
+        cpu_start = time.thread_time()
+        now = time.monotonic()
+        with self._lock:
+            self.frames_seen += 1
+            if self._detect_motion(frame):
+                self._last_motion = now
+
+            active = self._last_motion is not None and now - self._last_motion <= self.hold_seconds
+            due = self._last_run is None or now - self._last_run >= self.idle_interval
+            if active or due:
+                self._last_run = now
+                self.frames_processed += 1
+                run = True
+            else:
+                self.frames_skipped += 1
+                self.cpu_saved += self.avg_run_cpu
+                run = False
+            self.gate_cpu += time.thread_time() - cpu_start
+        return run
+
+    def record_run(self, cpu_seconds):
+        """Feed back the process-wide CPU time one heavy pass took (exponential moving average)."""
+        with self._lock:
+            if self.avg_run_cpu == 0.0:
+                self.avg_run_cpu = cpu_seconds
+            else:
+                self.avg_run_cpu = 0.9 * self.avg_run_cpu + 0.1 * cpu_seconds
+
+    @property
+    def idle(self):
+        """True while the scene is static and the gate is at the idle rate."""
+        with self._lock:
+            return self._last_motion is None or time.monotonic() - self._last_motion > self.hold_seconds
+
+    def report(self):
+        with self._lock:
+            return {
+                "seen": self.frames_seen,
+                "processed": self.frames_processed,
+                "skipped": self.frames_skipped,
+                "avg_run_cpu_ms": self.avg_run_cpu * 1000.0,
+                "cpu_saved_s": self.cpu_saved,
+                "gate_cpu_s": self.gate_cpu,
+                "net_cpu_saved_s": self.cpu_saved - self.gate_cpu,
+            }
+
+
+def format_gate_report(report):
+    return (f"seen={report['seen']} processed={report['processed']} skipped={report['skipped']} "
+            f"process cpu saved~{report['cpu_saved_s']:.1f}s (gate thread cpu {report['gate_cpu_s']:.2f}s, "
+            f"heavy pass ~{report['avg_run_cpu_ms']:.0f}ms process cpu)")
+
+
+def run_gated(gate, process_fn, frame):
+    """
+    Run process_fn(frame) unless the gate says the scene is static.
+
+    Returns None for frames the heavy stages were skipped on. The pass is
+    timed with process_time() so torch's intra-op threads are included; that
+    is process-wide, so concurrent workers' CPU lands in it too.
+    """
+    if gate is None:
+        return process_fn(frame)
+    if not gate.should_process(frame):
+        return None
+    cpu_start = time.process_time()
+    result = process_fn(frame)
+    gate.record_run(time.process_time() - cpu_start)
+    return result
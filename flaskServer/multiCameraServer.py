@@ -0,0 +1,165 @@
+"""
+Multi-camera recognition server.
+
+Runs every gate camera listed in a JSON config from one process, so MTCNN,
+InceptionResnetV1, MiniFASNet and YOLO are loaded once (faceRecognition's
+RecognitionEngine) and shared by all cameras. Frames from the cameras are
+scheduled round-robin over a shared pool of inference workers.
+
+Config example (cameras.json):
+    {
+        "workers": 2,
+        "torch_threads": 2,
+        "display": true,
+        "preview_port": 8090,
+        "motion_gating": true,
+        "face_tracking": true,
+        "cameras": [
+            {"name": "gate-1", "source": 0},
+            {"name": "gate-2", "source": "rtsp://192.168.1.20:554/stream1"},
+            {"name": "replay", "source": "recordings/gate3.mp4"}
+        ]
+    }
+
+With "display": false nothing is drawn unless someone opens the preview
+(previewServer) at http://127.0.0.1:<preview_port>/; set "preview_port" to
+null to turn it off.
+
+Usage:
+    python multiCameraServer.py cameras.json
+"""
+
+import functools
+import json
+import os
+import sys
+
+import cv2
+import torch
+
+from faceTracker import FaceTracker
+from motionGate import MotionGate, format_gate_report
+from pipeline import MultiCameraPipeline, format_stats
+from previewServer import PREVIEW_PORT, PreviewServer
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(__file__), "cameras.json")
+
+
+def load_camera_config(config_path):
+    """
+    Read and validate the camera config.
+
+    Returns:
+        dict with "sources" (ordered name -> source), "workers", "torch_threads",
+        "display", "preview_port", "motion_gating" and "face_tracking"
+    """
+    with open(config_path, "r") as f:
+        config = json.load(f)
+
+    cameras = config.get("cameras") or []
+    if not cameras:
+        raise ValueError(f"No cameras listed in {config_path}")
+
+    sources = {}
+    for i, camera in enumerate(cameras):
+        source = camera.get("source")
+        if source is None:
+            raise ValueError(f"Camera #{i} in {config_path} has no 'source'")
+        # Device indices may be written as strings ("0") in hand-edited configs
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        name = str(camera.get("name") or f"camera-{i}")
+        if name in sources:
+            raise ValueError(f"Duplicate camera name '{name}' in {config_path}")
+        sources[name] = source
+
+    return {
+        "sources": sources,
+        "workers": int(config.get("workers", min(len(sources), os.cpu_count() or 1))),
+        "torch_threads": config.get("torch_threads"),
+        "display": bool(config.get("display", True)),
+        "preview_port": config.get("preview_port", PREVIEW_PORT),
+        "motion_gating": bool(config.get("motion_gating", True)),
+        "face_tracking": bool(config.get("face_tracking", True)),
+    }
+
+
+def main(config_path):
+    config = load_camera_config(config_path)
+
+    # Several inference workers each running torch's own thread pool would
+    # oversubscribe the cores, so cap the intra-op threads per worker.
+    torch_threads = config["torch_threads"]
+    if torch_threads is None:
+        torch_threads = max(1, (os.cpu_count() or 1) // config["workers"])
+    torch.set_num_threads(int(torch_threads))
+
+    # Every model is loaded exactly once for all cameras
+    import faceRecognition as fr
+    fr.engine.load()
+    if fr.WARMUP:
+        fr.engine.warmup()
+    print(fr.engine.startup_report())
+    attendance_client = fr.get_attendance_client()
+
+    display = config["display"]
+    preview = None
+    if not display and config["preview_port"]:
+        preview = PreviewServer(fr.render_frame, port=int(config["preview_port"]))
+        preview.start()
+
+    def output(camera_name, frame, result, packet):
+        if not display:
+            return fr.serve_frame(preview, frame, result, packet, camera=camera_name)
+        if result is not None:
+            fr.handle_attendance(result)
+        if packet.stale:
+            # A newer frame of this camera is already on screen
+            return True
+        if result is not None:
+            fr.annotate_frame(frame, result)
+        cv2.imshow(f"Face Recognition Attendance - {camera_name}", frame)
+        return not (cv2.waitKey(1) & 0xFF == ord('q'))
+
+    print(f"🎥 Serving {len(config['sources'])} camera(s) with {config['workers']} inference worker(s)")
+    fr.engine.gallery_watcher.start()
+    # One gate per camera: each scene goes static independently
+    motion_gates = {}
+    if config["motion_gating"]:
+        motion_gates = {name: MotionGate() for name in config["sources"]}
+    # Trackers hold per-scene state, so each camera gets its own
+    trackers = {}
+    if config["face_tracking"]:
+        trackers = {name: FaceTracker() for name in config["sources"]}
+    process_fns = {name: functools.partial(fr.process_frame, tracker=trackers.get(name))
+                   for name in config["sources"]}
+    server = MultiCameraPipeline(config["sources"], process_fns, output,
+                                 num_workers=config["workers"], motion_gates=motion_gates)
+    try:
+        report = server.run()
+    except KeyboardInterrupt:
+        server.stop()
+        report = server.report()
+
+    if display:
+        cv2.destroyAllWindows()
+    if preview is not None:
+        preview.stop()
+    for name, stats in report.items():
+        print(f"[PIPELINE] {name}: {format_stats(stats)}")
+        if name in motion_gates:
+            print(f"[MOTION] {name}: {format_gate_report(motion_gates[name].report())}")
+        if name in trackers:
+            print(f"[TRACKER] {name}: {trackers[name].report()}")
+    fr.engine.gallery_watcher.stop()
+    attendance_client.close()
+    print(f"[ATTENDANCE] {attendance_client.report()}")
+    print("📸 All cameras stopped.")
+
+
+if __name__ == "__main__":
+    config_file = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CONFIG
+    if not os.path.exists(config_file):
+        print(f"[ERROR] Camera config not found: {config_file}")
+        sys.exit(1)
+    main(config_file)
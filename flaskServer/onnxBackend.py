@@ -0,0 +1,272 @@
+"""
+ONNX export and ONNX Runtime inference backend.
+
+Each of the three model families can run on ONNX Runtime's CPU provider
+instead of eager PyTorch / ultralytics, chosen per stage in STAGE_BACKENDS
+(or with RecognitionEngine(backends={...})):
+
+    antispoof   MiniFASNet (predict.AntiSpoofModel)
+    embedding   InceptionResnetV1 / VGGFace2 (recognitionEngine, createEmbeddings)
+    ppe         YOLO (ppeDetection); ultralytics runs the .onnx itself
+
+OrtModule wraps an InferenceSession so it can stand in for an eval-mode
+torch module: forward takes and returns CPU tensors, so the callers' pre-
+and post-processing is the same for both backends.
+
+    python onnxBackend.py export [--ppe-weights yolo11n.pt]    # every graph, dynamic batch axis
+    python onnxBackend.py bench [--batch 1 8]                  # torch vs ONNX Runtime per stage
+    python test_onnx_parity.py                                 # outputs agree within tolerance
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+# ------------------- Configuration -------------------
+STAGE_BACKENDS = {"antispoof": "torch", "embedding": "torch", "ppe": "torch"}  # "torch" or "onnx" per stage
+ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx")
+EMBEDDING_ONNX = "inception_resnet_v1_vggface2.onnx"
+PPE_ONNX = "ppe_yolo.onnx"
+PPE_WEIGHTS = "yolo11n.pt"      # Same default as ppeDetection.load_ppe_model
+ONNX_OPSET = 17
+ORT_THREADS = 0                 # intra-op threads; 0 lets ONNX Runtime decide
+BENCH_REPEATS = 20
+# -----------------------------------------------------
+
+BACKENDS = ("torch", "onnx")
+
+
+def stage_backend(stage, backends=None):
+    """Configured backend of a stage, validated."""
+    backend = (backends or STAGE_BACKENDS).get(stage, "torch")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r} for {stage}; expected one of {BACKENDS}")
+    return backend
+
+
+def antispoof_onnx_path(model_path, onnx_dir=ONNX_DIR):
+    """ONNX file of a Silent-Face .pth (same base name, so parse_model_name still applies)."""
+    return os.path.join(onnx_dir, os.path.splitext(os.path.basename(model_path))[0] + ".onnx")
+
+
+def embedding_onnx_path(onnx_dir=ONNX_DIR):
+    return os.path.join(onnx_dir, EMBEDDING_ONNX)
+
+
+def ppe_onnx_path(onnx_dir=ONNX_DIR):
+    return os.path.join(onnx_dir, PPE_ONNX)
+
+
+class OrtModule:
+    """
+    ONNX Runtime CPU session with the calling convention of an eval-mode
+    torch module: forward(tensor) -> tensor, plus run(array) -> array.
+    """
+
+    def __init__(self, path, threads=ORT_THREADS):
+        import onnxruntime as ort
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run 'python onnxBackend.py export' first")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, batch):
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+
+    def forward(self, inputs):
+        import torch
+        return torch.from_numpy(self.run(inputs.detach().cpu().numpy()))
+
+    __call__ = forward
+
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self  # Always runs on the CPU provider; forward moves inputs to the CPU
+
+    def fingerprint(self):
+        """Hash of the graph file, for embeddingCache.model_version."""
+        digest = hashlib.sha1()
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()[:16]
+
+
+# ------------------- Export -------------------
+
+def export_module(module, example, path, opset=ONNX_OPSET):
+    """Export an eval-mode torch module with a dynamic batch axis on its input and output."""
+    import torch
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(module.eval(), example, path, input_names=["input"], output_names=["output"],
+                          dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+                          opset_version=opset, do_constant_folding=True)
+    return path
+
+
+def load_torch_antispoof(model_path):
+    """Float MiniFASNet of a .pth on the CPU (never the int8 export)."""
+    import torch
+    from predict import AntiSpoofModel
+    return AntiSpoofModel(model_path, torch.device("cpu"), optimized=False, backend="torch")
+
+
+def load_torch_embedding():
+    from facenet_pytorch import InceptionResnetV1
+    return InceptionResnetV1(pretrained='vggface2').eval()
+
+
+def export_antispoof(model_paths, onnx_dir=ONNX_DIR):
+    import torch
+
+    written = []
+    for model_path in model_paths:
+        loaded = load_torch_antispoof(model_path)
+        example = torch.zeros(2, 3, loaded.h_input, loaded.w_input)
+        written.append(export_module(loaded.model, example, antispoof_onnx_path(model_path, onnx_dir)))
+    return written
+
+
+def export_embedding(onnx_dir=ONNX_DIR):
+    import torch
+    return export_module(load_torch_embedding(), torch.zeros(2, 3, 160, 160), embedding_onnx_path(onnx_dir))
+
+
+def export_ppe(weights=PPE_WEIGHTS, onnx_dir=ONNX_DIR):
+    """ultralytics' own exporter (keeps class names in the graph metadata), moved into onnx_dir."""
+    from ultralytics import YOLO
+
+    exported = YOLO(weights).export(format="onnx", dynamic=True, opset=ONNX_OPSET)
+    os.makedirs(onnx_dir, exist_ok=True)
+    return shutil.move(str(exported), ppe_onnx_path(onnx_dir))
+
+
+def antispoof_model_paths(model_dir=None):
+    from antiSpoofEnsemble import MODEL_DIR
+    model_dir = model_dir or MODEL_DIR
+    return sorted(os.path.join(model_dir, name) for name in os.listdir(model_dir) if name.endswith(".pth"))
+
+
+def export_all(onnx_dir=ONNX_DIR, stages=("antispoof", "embedding", "ppe"), ppe_weights=PPE_WEIGHTS,
+               antispoof_dir=None):
+    """Export every requested stage; a stage that fails is reported and skipped."""
+    written = {}
+    exporters = {
+        "antispoof": lambda: export_antispoof(antispoof_model_paths(antispoof_dir), onnx_dir),
+        "embedding": lambda: [export_embedding(onnx_dir)],
+        "ppe": lambda: [export_ppe(ppe_weights, onnx_dir)],
+    }
+    for stage in stages:
+        started = time.perf_counter()
+        try:
+            written[stage] = exporters[stage]()
+        except Exception as e:
+            print(f"[ERROR] Export of {stage} failed: {e}")
+            continue
+        for path in written[stage]:
+            print(f"[ONNX] {stage:<10} {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+        print(f"[INFO] {stage} exported in {time.perf_counter() - started:.1f}s")
+    return written
+
+
+# ------------------- Speed comparison -------------------
+
+def _time_call(run, repeats=BENCH_REPEATS):
+    """Median milliseconds of run() after two warm-up calls."""
+    for _ in range(2):
+        run()
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return float(np.median(times)) * 1000.0
+
+
+def stage_runners(stage, batch_size, onnx_dir=ONNX_DIR, ppe_weights=PPE_WEIGHTS):
+    """(torch run, onnx run) closures over one random batch of a stage's real input shape."""
+    import torch
+
+    rng = np.random.default_rng(0)
+    if stage == "antispoof":
+        model_path = antispoof_model_paths()[0]
+        loaded = load_torch_antispoof(model_path)
+        ort_model = OrtModule(antispoof_onnx_path(model_path, onnx_dir))
+        batch = rng.uniform(0, 255, (batch_size, 3, loaded.h_input, loaded.w_input)).astype(np.float32)
+        tensor = torch.from_numpy(batch)
+        return lambda: loaded.model(tensor), lambda: ort_model.run(batch)
+    if stage == "embedding":
+        model = load_torch_embedding()
+        ort_model = OrtModule(embedding_onnx_path(onnx_dir))
+        batch = rng.uniform(0, 1, (batch_size, 3, 160, 160)).astype(np.float32)
+        tensor = torch.from_numpy(batch)
+        return lambda: model(tensor), lambda: ort_model.run(batch)
+    if stage == "ppe":
+        from ultralytics import YOLO
+        torch_model, ort_model = YOLO(ppe_weights), YOLO(ppe_onnx_path(onnx_dir), task="detect")
+        frames = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(batch_size)]
+        return (lambda: torch_model(frames, verbose=False, device="cpu"),
+                lambda: ort_model(frames, verbose=False, device="cpu"))
+    raise ValueError(f"Unknown stage {stage!r}")
+
+
+def benchmark(stages=("antispoof", "embedding", "ppe"), batch_sizes=(1, 8), onnx_dir=ONNX_DIR,
+              ppe_weights=PPE_WEIGHTS):
+    """[(stage, batch, torch ms, onnx ms)] on the CPU; stages without an export are skipped."""
+    import torch
+
+    rows = []
+    with torch.no_grad():
+        for stage in stages:
+            for batch_size in batch_sizes:
+                try:
+                    run_torch, run_onnx = stage_runners(stage, batch_size, onnx_dir, ppe_weights)
+                except (FileNotFoundError, IndexError, ImportError) as e:
+                    print(f"[WARNING] Skipping {stage}: {e}")
+                    break
+                rows.append((stage, batch_size, _time_call(run_torch), _time_call(run_onnx)))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the models to ONNX and compare ONNX Runtime with torch")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write every ONNX graph")
+    export.add_argument("--out", default=ONNX_DIR)
+    export.add_argument("--stages", nargs="+", default=["antispoof", "embedding", "ppe"])
+    export.add_argument("--ppe-weights", default=PPE_WEIGHTS, help="YOLO weights to export")
+    export.add_argument("--antispoof-dir", help="Folder of MiniFASNet .pth files")
+    bench = commands.add_parser("bench", help="torch vs ONNX Runtime latency per stage on the CPU")
+    bench.add_argument("--onnx-dir", default=ONNX_DIR)
+    bench.add_argument("--stages", nargs="+", default=["antispoof", "embedding", "ppe"])
+    bench.add_argument("--batch", nargs="+", type=int, default=[1, 8])
+    bench.add_argument("--ppe-weights", default=PPE_WEIGHTS)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        written = export_all(args.out, args.stages, args.ppe_weights, args.antispoof_dir)
+        missing = [stage for stage in args.stages if stage not in written]
+        if missing:
+            print(f"[ERROR] Not exported: {', '.join(missing)}")
+            sys.exit(1)
+        print(f"[SUCCESS] ONNX graphs written to {args.out}")
+    else:
+        rows = benchmark(args.stages, args.batch, args.onnx_dir, args.ppe_weights)
+        print(f"[BENCH] {'stage':<10} batch  torch_ms   onnx_ms  speed-up")
+        for stage, batch_size, torch_ms, onnx_ms in rows:
+            print(f"[BENCH] {stage:<10} {batch_size:5d}  {torch_ms:8.2f}  {onnx_ms:8.2f}  {torch_ms / onnx_ms:7.2f}x")
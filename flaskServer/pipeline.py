@@ -0,0 +1,459 @@
+"""
+Threaded capture / inference / output pipeline for the camera loop.
+
+The camera is read on its own thread into a single-slot "latest frame wins"
+buffer, so a slow model never makes frames pile up behind it: a frame that
+has not been picked up by the time the next one arrives is dropped. One or
+more inference workers take frames from that buffer and hand their results to
+the output stage (drawing, attendance, display) through a bounded queue.
+
+MultiCameraPipeline does the same for several sources at once: every camera
+gets its own capture thread and latest-frame slot, and one shared pool of
+inference workers serves the slots round-robin so a busy camera cannot starve
+the others.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from motionGate import run_gated
+
+# How often (seconds) the pipeline prints its running stats
+STATS_INTERVAL = 10.0
+
+
+class FramePacket:
+    """A captured frame travelling through the pipeline."""
+
+    __slots__ = ("frame_id", "frame", "captured_at", "result", "latency", "source", "stale")
+
+    def __init__(self, frame_id, frame, captured_at, source=None):
+        self.frame_id = frame_id
+        self.source = source
+        self.frame = frame
+        self.captured_at = captured_at
+        self.result = None
+        self.latency = None
+        # Set when a newer frame of the same source was already output
+        self.stale = False
+
+
+class LatestFrameBuffer:
+    """Single-slot buffer where a new frame replaces one nobody has taken yet."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the newest item, or None once the buffer is closed and empty."""
+        with self._cond:
+            if self._item is None and not self._closed:
+                self._cond.wait(timeout)
+            item, self._item = self._item, None
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class PipelineStats:
+    """Thread-safe counters for captured/processed/dropped frames and latency."""
+
+    def __init__(self, window=300):
+        self._lock = threading.Lock()
+        self.frames_captured = 0
+        self.frames_processed = 0
+        self.frames_shown = 0
+        self.frames_stale = 0
+        self.latencies = deque(maxlen=window)
+        self.started_at = time.perf_counter()
+
+    def add_captured(self):
+        with self._lock:
+            self.frames_captured += 1
+
+    def add_processed(self):
+        with self._lock:
+            self.frames_processed += 1
+
+    def add_stale(self):
+        with self._lock:
+            self.frames_stale += 1
+
+    def add_shown(self, latency):
+        with self._lock:
+            self.frames_shown += 1
+            self.latencies.append(latency)
+
+    def summary(self, dropped_at_capture=0):
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+            latencies = sorted(self.latencies)
+            avg = sum(latencies) / len(latencies) if latencies else 0.0
+            p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+            return {
+                "captured": self.frames_captured,
+                "processed": self.frames_processed,
+                "shown": self.frames_shown,
+                "dropped": dropped_at_capture + self.frames_stale,
+                "output_fps": self.frames_shown / elapsed,
+                "latency_avg_ms": avg * 1000.0,
+                "latency_p95_ms": p95 * 1000.0,
+            }
+
+
+def format_stats(stats):
+    return (f"captured={stats['captured']} processed={stats['processed']} "
+            f"shown={stats['shown']} dropped={stats['dropped']} "
+            f"fps={stats['output_fps']:.1f} latency avg={stats['latency_avg_ms']:.0f}ms "
+            f"p95={stats['latency_p95_ms']:.0f}ms")
+
+
+class _PipelineBase:
+    """
+    Inference workers, result queue and output stage shared by CameraPipeline
+    and MultiCameraPipeline. Subclasses supply the frame source (_next_frame,
+    _frames_closed), the per-frame work (_process), per-source stats (_stats),
+    the output call (_output) and start/stop/report.
+    """
+
+    def __init__(self, output_fn, num_workers, output_queue_size):
+        self.output_fn = output_fn
+        self.num_workers = max(1, int(num_workers))
+        self.results = queue.Queue(maxsize=output_queue_size)
+        self._stop = threading.Event()
+        self._threads = []
+
+    # ------------------- Stages -------------------
+
+    def _inference_loop(self):
+        while not self._stop.is_set():
+            packet = self._next_frame(timeout=0.5)
+            if packet is None:
+                if self._frames_closed():
+                    break
+                continue
+            try:
+                packet.result = self._process(packet)
+            except Exception as e:
+                where = f"frame {packet.frame_id}" if packet.source is None else f"{packet.source}#{packet.frame_id}"
+                print(f"[PIPELINE ERROR] Inference failed on {where}: {e}")
+                continue
+            self._stats(packet).add_processed()
+            self._put_result(packet)
+        # Tell the output stage this worker is done
+        self._put_result(None)
+
+    def _put_result(self, packet):
+        while not self._stop.is_set():
+            try:
+                self.results.put(packet, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _inference_threads(self):
+        return [threading.Thread(target=self._inference_loop, name=f"inference-{i}", daemon=True)
+                for i in range(self.num_workers)]
+
+    # ------------------- Control -------------------
+
+    def run(self):
+        """Start the capture and inference threads and run the output stage on this thread."""
+        self.start()
+        last_shown_id = {}
+        workers_left = self.num_workers
+        last_report = time.perf_counter()
+        try:
+            while workers_left > 0:
+                try:
+                    packet = self.results.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if packet is None:
+                    workers_left -= 1
+                    continue
+
+                # With several workers results can arrive out of order; the display never goes
+                # back in time, but a late result is still delivered, marked stale
+                stats = self._stats(packet)
+                packet.latency = time.perf_counter() - packet.captured_at
+                if packet.frame_id < last_shown_id.get(packet.source, -1):
+                    packet.stale = True
+                    stats.add_stale()
+                else:
+                    last_shown_id[packet.source] = packet.frame_id
+                    stats.add_shown(packet.latency)
+                if self._output(packet) is False:
+                    break
+
+                if time.perf_counter() - last_report >= STATS_INTERVAL:
+                    self._print_report()
+                    last_report = time.perf_counter()
+        finally:
+            self.stop()
+        return self.report()
+
+
+class CameraPipeline(_PipelineBase):
+    """
+    Run capture, inference and output as separate stages joined by queues.
+
+    Args:
+        source: Anything cv2.VideoCapture accepts (device index, file, RTSP URL)
+        process_fn: process_fn(frame) -> result, the heavy per-frame work
+        output_fn: output_fn(frame, result, packet) -> bool, runs on the calling
+            thread; returning False stops the pipeline. Every processed frame
+            reaches it; one finished after a newer frame has packet.stale set
+            and should not be displayed, but its result still counts
+            (attendance)
+        num_workers: Number of inference threads
+        output_queue_size: Max results waiting for the output stage
+        motion_gate: Optional motionGate.MotionGate; frames it skips reach
+            output_fn with result None
+    """
+
+    def __init__(self, source, process_fn, output_fn, num_workers=1, output_queue_size=4,
+                 motion_gate=None):
+        super().__init__(output_fn, num_workers, output_queue_size)
+        self.source = source
+        self.process_fn = process_fn
+        self.motion_gate = motion_gate
+        self.frames = LatestFrameBuffer()
+        self.stats = PipelineStats()
+        self._cap = None
+
+    # ------------------- Stages -------------------
+
+    def _capture_loop(self):
+        frame_id = 0
+        try:
+            while not self._stop.is_set() and self._cap.isOpened():
+                ret, frame = self._cap.read()
+                if not ret:
+                    break
+                self.stats.add_captured()
+                self.frames.put(FramePacket(frame_id, frame, time.perf_counter()))
+                frame_id += 1
+        finally:
+            self.frames.close()
+
+    def _next_frame(self, timeout):
+        return self.frames.get(timeout=timeout)
+
+    def _frames_closed(self):
+        return self.frames.closed
+
+    def _process(self, packet):
+        return run_gated(self.motion_gate, self.process_fn, packet.frame)
+
+    def _stats(self, packet):
+        return self.stats
+
+    def _output(self, packet):
+        return self.output_fn(packet.frame, packet.result, packet)
+
+    def _print_report(self):
+        print(f"[PIPELINE] {format_stats(self.report())}")
+
+    # ------------------- Control -------------------
+
+    def start(self):
+        self._cap = cv2.VideoCapture(self.source)
+        if not self._cap.isOpened():
+            raise RuntimeError(f"Could not open video source: {self.source}")
+        self.stats = PipelineStats()
+        self._threads = [threading.Thread(target=self._capture_loop, name="capture", daemon=True)]
+        self._threads.extend(self._inference_threads())
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.frames.close()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        if self._cap is not None:
+            self._cap.release()
+
+    def report(self):
+        return self.stats.summary(dropped_at_capture=self.frames.dropped)
+
+
+class FairFrameScheduler:
+    """
+    Latest-frame-wins slots for several cameras, handed out round-robin.
+
+    Each camera owns one slot; a new frame replaces an unclaimed one (counted as
+    dropped for that camera). Workers calling get() are served from the next
+    camera after the one served last, so every camera gets an equal share of
+    the inference pool no matter how fast it produces frames.
+    """
+
+    def __init__(self, sources):
+        self._cond = threading.Condition()
+        self._order = list(sources)
+        self._slots = {source: None for source in self._order}
+        self._open = set(self._order)
+        self._next = 0
+        self.dropped = {source: 0 for source in self._order}
+
+    def put(self, source, item):
+        with self._cond:
+            if self._slots[source] is not None:
+                self.dropped[source] += 1
+            self._slots[source] = item
+            self._cond.notify()
+
+    def close(self, source=None):
+        """Close one camera (or all of them when source is None)."""
+        with self._cond:
+            if source is None:
+                self._open.clear()
+            else:
+                self._open.discard(source)
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        with self._cond:
+            return not self._open and all(item is None for item in self._slots.values())
+
+    def _take_next(self):
+        count = len(self._order)
+        for offset in range(count):
+            source = self._order[(self._next + offset) % count]
+            item = self._slots[source]
+            if item is not None:
+                self._slots[source] = None
+                self._next = (self._next + offset + 1) % count
+                return item
+        return None
+
+    def get(self, timeout=None):
+        """Return the next pending packet in round-robin order, or None on timeout/close."""
+        with self._cond:
+            item = self._take_next()
+            if item is None and self._open:
+                self._cond.wait(timeout)
+                item = self._take_next()
+            return item
+
+
+class MultiCameraPipeline(_PipelineBase):
+    """
+    Serve several video sources from one shared set of inference workers.
+
+    Args:
+        sources: dict of camera name -> cv2.VideoCapture source
+        process_fn: process_fn(frame) -> result shared by all cameras, or a dict
+            of camera name -> process_fn for per-camera state (face trackers)
+        output_fn: output_fn(camera_name, frame, result, packet) -> bool, runs on
+            the calling thread; returning False stops every camera. As in
+            CameraPipeline, late results arrive with packet.stale set
+        num_workers: Size of the shared inference pool
+        output_queue_size: Max results waiting for the output stage
+        motion_gates: Optional dict of camera name -> motionGate.MotionGate;
+            frames a gate skips reach output_fn with result None
+    """
+
+    def __init__(self, sources, process_fn, output_fn, num_workers=1, output_queue_size=8,
+                 motion_gates=None):
+        super().__init__(output_fn, num_workers, output_queue_size)
+        self.sources = dict(sources)
+        if callable(process_fn):
+            process_fn = {name: process_fn for name in self.sources}
+        self.process_fns = process_fn
+        self.motion_gates = motion_gates or {}
+        self.scheduler = FairFrameScheduler(self.sources)
+        self.stats = {name: PipelineStats() for name in self.sources}
+        self._caps = {}
+
+    # ------------------- Stages -------------------
+
+    def _capture_loop(self, name):
+        cap = self._caps[name]
+        stats = self.stats[name]
+        frame_id = 0
+        try:
+            while not self._stop.is_set() and cap.isOpened():
+                ret, frame = cap.read()
+                if not ret:
+                    print(f"[PIPELINE] Camera '{name}' stopped delivering frames")
+                    break
+                stats.add_captured()
+                self.scheduler.put(name, FramePacket(frame_id, frame, time.perf_counter(), source=name))
+                frame_id += 1
+        finally:
+            self.scheduler.close(name)
+
+    def _next_frame(self, timeout):
+        return self.scheduler.get(timeout=timeout)
+
+    def _frames_closed(self):
+        return self.scheduler.closed
+
+    def _process(self, packet):
+        return run_gated(self.motion_gates.get(packet.source), self.process_fns[packet.source], packet.frame)
+
+    def _stats(self, packet):
+        return self.stats[packet.source]
+
+    def _output(self, packet):
+        return self.output_fn(packet.source, packet.frame, packet.result, packet)
+
+    def _print_report(self):
+        for name, camera_stats in self.report().items():
+            print(f"[PIPELINE] {name}: {format_stats(camera_stats)}")
+
+    # ------------------- Control -------------------
+
+    def start(self):
+        for name, source in self.sources.items():
+            cap = cv2.VideoCapture(source)
+            if not cap.isOpened():
+                print(f"[WARNING] Could not open camera '{name}' ({source}), skipping it")
+                self.scheduler.close(name)
+                continue
+            self._caps[name] = cap
+        if not self._caps:
+            raise RuntimeError("None of the configured cameras could be opened")
+
+        for name in self._caps:
+            self._threads.append(threading.Thread(target=self._capture_loop, args=(name,),
+                                                  name=f"capture-{name}", daemon=True))
+        self._threads.extend(self._inference_threads())
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.scheduler.close()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        for cap in self._caps.values():
+            cap.release()
+
+    def report(self):
+        return {name: stats.summary(dropped_at_capture=self.scheduler.dropped[name])
+                for name, stats in self.stats.items()}
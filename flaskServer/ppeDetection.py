@@ -6,8 +6,9 @@ Uses YOLOv11 for detecting safety equipment: helmet, gloves, boots, jacket
 import os
 import cv2
 import numpy as np
-from ultralytics import YOLO
-import torch
+
+# ultralytics and torch are imported in load_ppe_model: they take seconds to import
+# and are only needed once the model is actually loaded
 
 # Required PPE items
 REQUIRED_PPE = {
@@ -48,6 +49,13 @@ def load_ppe_model(model_path=None, use_pretrained=True):
     if ppe_model is not None:
         return ppe_model
     
+    try:
+        from ultralytics import YOLO
+        import torch
+    except ImportError as e:
+        print(f"[PPE ERROR] ultralytics not available: {e}")
+        return None
+    
     try:
         if model_path and os.path.exists(model_path):
             print(f"[PPE] Loading custom model from: {model_path}")
@@ -109,7 +117,8 @@ def detect_ppe_items(frame, model=None, confidence_threshold=PPE_CONFIDENCE_THRE
             "gloves": (detected: bool, confidence: float),
             "boots": (detected: bool, confidence: float),
             "jacket": (detected: bool, confidence: float),
-            "all_detections": list of all detections
+            "all_detections": list of all detections,
+            "failed": True if inference raised (nothing ran, so nothing was detected)
         }
     """
     if model is None:
@@ -119,64 +128,89 @@ def detect_ppe_items(frame, model=None, confidence_threshold=PPE_CONFIDENCE_THRE
     
     if model is None:
         # Return default (all False) if model not available
-        return {
-            "helmet": (False, 0.0),
-            "gloves": (False, 0.0),
-            "boots": (False, 0.0),
-            "jacket": (False, 0.0),
-            "all_detections": [],
-        }
+        return _empty_detections()
     
     try:
         # Run YOLO inference
         results = model(frame, conf=confidence_threshold, verbose=False)
-        
-        # Initialize detection results
-        detections = {
-            "helmet": (False, 0.0),
-            "gloves": (False, 0.0),
-            "boots": (False, 0.0),
-            "jacket": (False, 0.0),
-            "all_detections": [],
-        }
-        
-        # Process detections
-        if len(results) > 0 and results[0].boxes is not None:
-            boxes = results[0].boxes
-            
-            for i in range(len(boxes)):
-                cls = int(boxes.cls[i])
-                conf = float(boxes.conf[i])
-                class_name = model.names[cls] if hasattr(model, 'names') else str(cls)
-                
-                # Normalize class name to our PPE categories
-                ppe_item = normalize_class_name(class_name)
-                
-                if ppe_item and ppe_item in detections:
-                    # Update if this detection has higher confidence
-                    current_conf = detections[ppe_item][1]
-                    if conf > current_conf:
-                        detections[ppe_item] = (True, conf)
-                
-                # Store all detections for debugging
-                detections["all_detections"].append({
-                    "class": class_name,
-                    "ppe_item": ppe_item,
-                    "confidence": conf,
-                    "box": boxes.xyxy[i].cpu().numpy().tolist() if hasattr(boxes, 'xyxy') else None
-                })
-        
-        return detections
+        return _parse_ppe_result(results[0] if len(results) > 0 else None, model)
         
     except Exception as e:
         print(f"[PPE ERROR] Detection failed: {e}")
-        return {
-            "helmet": (False, 0.0),
-            "gloves": (False, 0.0),
-            "boots": (False, 0.0),
-            "jacket": (False, 0.0),
-            "all_detections": [],
-        }
+        return _empty_detections(failed=True)
+
+
+def detect_ppe_items_batch(frames, model=None, confidence_threshold=PPE_CONFIDENCE_THRESHOLD):
+    """
+    Detect PPE items in several frames with one YOLO call.
+    
+    Args:
+        frames: List of BGR frames
+        model: YOLO model instance (if None, uses global model)
+        confidence_threshold: Minimum confidence for detection
+    
+    Returns:
+        list: one detect_ppe_items()-style dict per frame
+    """
+    if model is None:
+        model = ppe_model
+        if model is None:
+            model = load_ppe_model()
+    
+    if model is None or not frames:
+        return [_empty_detections() for _ in frames]
+    
+    try:
+        results = model(list(frames), conf=confidence_threshold, verbose=False)
+        return [_parse_ppe_result(result, model) for result in results]
+    except Exception as e:
+        print(f"[PPE ERROR] Batch detection failed: {e}")
+        return [_empty_detections(failed=True) for _ in frames]
+
+
+def _empty_detections(failed=False):
+    return {
+        "helmet": (False, 0.0),
+        "gloves": (False, 0.0),
+        "boots": (False, 0.0),
+        "jacket": (False, 0.0),
+        "all_detections": [],
+        "failed": failed,
+    }
+
+
+def _parse_ppe_result(result, model):
+    """Turn one YOLO result into the detect_ppe_items() dict."""
+    # Initialize detection results
+    detections = _empty_detections()
+    
+    # Process detections
+    if result is not None and result.boxes is not None:
+        boxes = result.boxes
+        
+        for i in range(len(boxes)):
+            cls = int(boxes.cls[i])
+            conf = float(boxes.conf[i])
+            class_name = model.names[cls] if hasattr(model, 'names') else str(cls)
+            
+            # Normalize class name to our PPE categories
+            ppe_item = normalize_class_name(class_name)
+            
+            if ppe_item and ppe_item in detections:
+                # Update if this detection has higher confidence
+                current_conf = detections[ppe_item][1]
+                if conf > current_conf:
+                    detections[ppe_item] = (True, conf)
+            
+            # Store all detections for debugging
+            detections["all_detections"].append({
+                "class": class_name,
+                "ppe_item": ppe_item,
+                "confidence": conf,
+                "box": boxes.xyxy[i].cpu().numpy().tolist() if hasattr(boxes, 'xyxy') else None
+            })
+    
+    return detections
 
 
 def check_ppe_compliance(detections, required_items=None, confidence_threshold=PPE_CONFIDENCE_THRESHOLD):
@@ -216,6 +250,18 @@ def check_ppe_compliance(detections, required_items=None, confidence_threshold=P
     return is_compliant, missing_items, compliance_dict
 
 
+def summarize_ppe(ppe_compliance_dict):
+    """Turn a compliance dict into the {item: detected} map and average confidence sent to the API."""
+    ppe_items_dict = {}
+    ppe_avg_confidence = 0.0
+    if ppe_compliance_dict:
+        for item, data in ppe_compliance_dict.items():
+            ppe_items_dict[item] = data["detected"]
+        confidences = [data["confidence"] for data in ppe_compliance_dict.values() if data["detected"]]
+        ppe_avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return ppe_items_dict, ppe_avg_confidence
+
+
 def get_ppe_status_string(detections, compliance_dict):
     """Get a human-readable string of PPE status."""
     status_parts = []
@@ -1,6 +1,8 @@
 import os
 import cv2
 import math
+import threading
+import time
 import torch
 import numpy as np
 import torch.nn.functional as F
@@ -16,15 +18,30 @@ MODEL_MAPPING = {
     'MiniFASNetV1SE':MiniFASNetV1SE,
     'MiniFASNetV2SE':MiniFASNetV2SE
 }
+NUM_CLASSES = 3  # MiniFASNet outputs: 1 = real, 0 and 2 = spoof
+USE_OPTIMIZED_CPU = True  # On CPU, load <weights>.int8.pt written by antiSpoofQuantize.py when present
+OPTIMIZED_SUFFIX = ".int8.pt"
+
+
+def optimized_path(model_path):
+    """Where antiSpoofQuantize.py writes the int8 TorchScript model of a .pth."""
+    return os.path.splitext(model_path)[0] + OPTIMIZED_SUFFIX
 
 
 class Detection:
     def __init__(self):
-        caffemodel = os.path.join(os.path.dirname(__file__), "Silent-Face-Anti-Spoofing", "resources", "detection_model", "res10_300x300_ssd_iter_140000.caffemodel")
-        deploy = os.path.join(os.path.dirname(__file__), "Silent-Face-Anti-Spoofing", "resources", "detection_model", "deploy.prototxt")
-        self.detector = cv2.dnn.readNetFromCaffe(deploy, caffemodel)
+        self._detector = None
         self.detector_confidence = 0.6
 
+    @property
+    def detector(self):
+        # Loaded on first get_bbox(); the recognizer brings its own face boxes and never needs it
+        if self._detector is None:
+            caffemodel = os.path.join(os.path.dirname(__file__), "Silent-Face-Anti-Spoofing", "resources", "detection_model", "res10_300x300_ssd_iter_140000.caffemodel")
+            deploy = os.path.join(os.path.dirname(__file__), "Silent-Face-Anti-Spoofing", "resources", "detection_model", "deploy.prototxt")
+            self._detector = cv2.dnn.readNetFromCaffe(deploy, caffemodel)
+        return self._detector
+
     def get_bbox(self, img):
         height, width = img.shape[0], img.shape[1]
         aspect_ratio = width / height
@@ -43,21 +60,41 @@ class Detection:
         return bbox
 
 
-class AntiSpoofPredict(Detection):
-    def __init__(self, device_id):
-        super(AntiSpoofPredict, self).__init__()
-        self.device = torch.device("cuda:{}".format(device_id)
-                                   if torch.cuda.is_available() else "cpu")
+class AntiSpoofModel:
+    """
+    A loaded, eval-mode MiniFASNet and what parse_model_name says about it.
 
-    def _load_model(self, model_path):
-        # define model
-        model_name = os.path.basename(model_path)
-        h_input, w_input, model_type, _ = parse_model_name(model_name)
-        self.kernel_size = get_kernel(h_input, w_input,)
-        self.model = MODEL_MAPPING[model_type](conv6_kernel=self.kernel_size).to(self.device)
+    On CPU the int8 TorchScript export next to the weights (optimized_path)
+    is used instead when there is one, unless optimized is False. With the
+    "onnx" backend the model is an onnxBackend.OrtModule over the exported
+    graph, called the same way.
+    """
+
+    __slots__ = ("path", "name", "h_input", "w_input", "model_type", "scale", "kernel_size", "model", "optimized",
+                 "backend")
+
+    def __init__(self, path, device, optimized=None, backend="torch"):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.h_input, self.w_input, self.model_type, self.scale = parse_model_name(self.name)
+        self.kernel_size = get_kernel(self.h_input, self.w_input)
+        self.backend = backend
+        if backend == "onnx":
+            from onnxBackend import OrtModule, antispoof_onnx_path
+            self.optimized = False
+            self.model = OrtModule(antispoof_onnx_path(path))
+            return
+        if optimized is None:
+            optimized = USE_OPTIMIZED_CPU and torch.device(device).type == "cpu"
+        self.optimized = bool(optimized) and os.path.exists(optimized_path(path))
+        if self.optimized:
+            # Quantized kernels are CPU only
+            self.model = torch.jit.load(optimized_path(path), map_location="cpu").eval()
+            return
+        self.model = MODEL_MAPPING[self.model_type](conv6_kernel=self.kernel_size).to(device)
 
         # load model weight
-        state_dict = torch.load(model_path, map_location=self.device)
+        state_dict = torch.load(path, map_location=device)
         keys = iter(state_dict)
         first_layer_name = keys.__next__()
         if first_layer_name.find('module.') >= 0:
@@ -69,7 +106,77 @@ class AntiSpoofPredict(Detection):
             self.model.load_state_dict(new_state_dict)
         else:
             self.model.load_state_dict(state_dict)
-        return None
+        self.model.eval()
+
+
+class AntiSpoofModelRegistry:
+    """
+    Anti-spoof models keyed by weight path, each built and loaded once.
+
+    get() is safe to call from several threads: a model is loaded by the first
+    caller that needs it while the others wait, and loaded models are shared
+    (an eval-mode forward under no_grad does not modify them).
+    """
+
+    def __init__(self, device, backend="torch"):
+        self.device = device
+        self.backend = backend
+        self._models = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+        self.load_seconds = {}
+
+    def get(self, model_path):
+        key = os.path.abspath(model_path)
+        loaded = self._models.get(key)
+        if loaded is not None:
+            return loaded
+        with self._lock:
+            lock = self._loading.setdefault(key, threading.Lock())
+        with lock:
+            loaded = self._models.get(key)
+            if loaded is None:
+                started = time.perf_counter()
+                loaded = AntiSpoofModel(key, self.device, backend=self.backend)
+                self.load_seconds[loaded.name] = time.perf_counter() - started
+                self._models[key] = loaded
+        return loaded
+
+    def preload(self, model_paths):
+        return [self.get(path) for path in model_paths]
+
+    def loaded(self):
+        return list(self._models.values())
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(device, backend="torch"):
+    """The process-wide registry for a device and backend, so every AntiSpoofPredict shares one copy of each model."""
+    with _registries_lock:
+        key = (str(device), backend)
+        if key not in _registries:
+            _registries[key] = AntiSpoofModelRegistry(device, backend)
+        return _registries[key]
+
+
+class AntiSpoofPredict(Detection):
+    def __init__(self, device_id, model_paths=(), backend="torch"):
+        super(AntiSpoofPredict, self).__init__()
+        self.device = torch.device("cuda:{}".format(device_id)
+                                   if torch.cuda.is_available() else "cpu")
+        self.registry = get_registry(self.device, backend)
+        # Load up front so the first face doesn't pay for it
+        self.registry.preload(model_paths)
+
+    def _load_model(self, model_path):
+        # Kept for callers of the old API; the registry only loads each file once
+        loaded = self.registry.get(model_path)
+        self.kernel_size = loaded.kernel_size
+        self.model = loaded.model
+        return loaded
 
     def predict(self, img, model_path):
         test_transform = trans.Compose([
@@ -77,21 +184,99 @@ class AntiSpoofPredict(Detection):
         ])
         img = test_transform(img)
         img = img.unsqueeze(0).to(self.device)
-        self._load_model(model_path)
-        self.model.eval()
+        model = self.registry.get(model_path).model
         with torch.no_grad():
-            result = self.model.forward(img)
+            result = model.forward(img)
             result = F.softmax(result, dim=1).cpu().numpy()  # Specify the dim parameter for softmax
         return result
 
+    def predict_batch(self, frame, boxes, model_path, scale=None):
+        """
+        Scores for every face box of one BGR frame from a single forward pass.
+
+        Crops are resized and stacked straight from NumPy into one
+        (N, 3, h_input, w_input) tensor, scaled like trans.ToTensor (RGB,
+        0-255, no division), so the scores match predict() face by face.
+        With a scale, each box is first expanded around its centre as in
+        Silent-Face's CropImage (see expand_boxes).
 
+        Returns:
+            (N, classes) softmax array; rows of empty crops are all zeros
+        """
+        return self.predict_many([(frame, boxes)], model_path, scale)[0]
 
+    def predict_many(self, jobs, model_path, scale=None):
+        """predict_batch for several (BGR frame, boxes) pairs with one forward over all their faces."""
+        loaded = self.registry.get(model_path)
+        batch, valid, counts = crop_jobs(jobs, loaded.w_input, loaded.h_input, scale)
+        scores = np.zeros((len(batch), NUM_CLASSES), dtype=np.float32)
+        if valid.any():
+            inputs = torch.from_numpy(batch[valid]).to(self.device)
+            with torch.no_grad():
+                result = F.softmax(loaded.model.forward(inputs), dim=1).cpu().numpy()
+            scores = np.zeros((len(batch), result.shape[1]), dtype=np.float32)
+            scores[valid] = result
+        return split_rows(scores, counts)
 
 
+def expand_boxes(boxes, scale, frame_width, frame_height):
+    """
+    (x1, y1, x2, y2) boxes grown by scale around their centres, shifted back
+    inside the frame and capped at the frame size, like Silent-Face's
+    CropImage._get_new_box. x2 / y2 are exclusive.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    box_w = np.maximum(boxes[:, 2] - boxes[:, 0], 1.0)
+    box_h = np.maximum(boxes[:, 3] - boxes[:, 1], 1.0)
+    scale = np.minimum(np.minimum((frame_height - 1) / box_h, (frame_width - 1) / box_w), scale)
+    new_w, new_h = box_w * scale, box_h * scale
+    center_x, center_y = boxes[:, 0] + box_w / 2, boxes[:, 1] + box_h / 2
 
+    x1, x2 = center_x - new_w / 2, center_x + new_w / 2
+    y1, y2 = center_y - new_h / 2, center_y + new_h / 2
+    # Shift rather than clip, so the crop keeps its scaled size
+    x2, x1 = x2 - np.minimum(x1, 0), np.maximum(x1, 0)
+    y2, y1 = y2 - np.minimum(y1, 0), np.maximum(y1, 0)
+    x1, x2 = x1 - np.maximum(x2 - (frame_width - 1), 0), np.minimum(x2, frame_width - 1)
+    y1, y2 = y1 - np.maximum(y2 - (frame_height - 1), 0), np.minimum(y2, frame_height - 1)
+    return np.stack([x1, y1, x2 + 1, y2 + 1], axis=1).astype(np.int64)
 
 
+def crop_batch(frame, boxes, width, height, scale=None):
+    """
+    (N, 3, height, width) float32 RGB crops of the boxes of a BGR frame, and
+    an (N,) mask of the boxes that had any pixels inside the frame. With a
+    scale the boxes are expanded first (expand_boxes).
+    """
+    batch = np.zeros((len(boxes), height, width, 3), dtype=np.uint8)
+    valid = np.zeros(len(boxes), dtype=bool)
+    frame_height, frame_width = frame.shape[:2]
+    crops = boxes
+    if scale is not None and len(boxes):
+        crops = expand_boxes(boxes, scale, frame_width, frame_height)
+    for i, (box, crop) in enumerate(zip(boxes, crops)):
+        x1, y1, x2, y2 = (int(v) for v in box)
+        # A face outside the frame stays empty even if its expanded box would not be
+        if min(frame_width, x2) <= max(0, x1) or min(frame_height, y2) <= max(0, y1):
+            continue
+        x1, y1, x2, y2 = (int(v) for v in crop)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(frame_width, x2), min(frame_height, y2)
+        batch[i] = cv2.resize(frame[y1:y2, x1:x2], (width, height))
+        valid[i] = True
+    # BGR -> RGB and HWC -> CHW in one copy
+    return np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32), valid
 
 
+def crop_jobs(jobs, width, height, scale=None):
+    """crop_batch over several (BGR frame, boxes) pairs: (batch, valid, boxes per pair)."""
+    counts = [len(boxes) for _, boxes in jobs]
+    parts = [crop_batch(frame, boxes, width, height, scale) for frame, boxes in jobs if len(boxes)]
+    if not parts:
+        return np.zeros((0, 3, height, width), dtype=np.float32), np.zeros(0, dtype=bool), counts
+    return np.concatenate([batch for batch, _ in parts]), np.concatenate([valid for _, valid in parts]), counts
 
 
+def split_rows(rows, counts):
+    """Split an array of stacked rows back into one block per count."""
+    return np.split(rows, np.cumsum(counts)[:-1]) if counts else []
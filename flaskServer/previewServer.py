@@ -0,0 +1,256 @@
+"""
+On-demand annotated preview for headless gate boxes.
+
+Replaces cv2.imshow when there is no display. The pipeline's output stage
+hands every frame to PreviewServer.publish(), which costs nothing while no one
+is watching: frames are only kept, annotated and JPEG-encoded while an MJPEG
+client is connected or a snapshot was asked for recently. Drawing and encoding
+run on the preview's own encoder thread, never on the inference workers or
+the output stage, and at most PREVIEW_MAX_FPS per camera.
+
+Endpoints (default http://127.0.0.1:8090):
+    /                       list of cameras
+    /stream/<camera>.mjpg   multipart MJPEG stream
+    /snapshot/<camera>.jpg  latest annotated frame
+    /health                 JSON viewer counts and encode stats
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import cv2
+
+# ------------------- Configuration -------------------
+PREVIEW_HOST = "127.0.0.1"      # Local only; put a reverse proxy in front to expose it
+PREVIEW_PORT = 8090
+PREVIEW_MAX_FPS = 10            # Encoded frames per second per camera
+PREVIEW_JPEG_QUALITY = 70
+SNAPSHOT_HOLD_SECONDS = 5.0     # Keep encoding this long after a snapshot request
+SNAPSHOT_WAIT_SECONDS = 2.0     # Max wait for a fresh frame when none is encoded yet
+# -----------------------------------------------------
+
+BOUNDARY = "frame"
+
+
+class _CameraPreview:
+    """Latest raw frame and latest encoded JPEG of one camera."""
+
+    def __init__(self):
+        self.viewers = 0
+        self.wanted_until = 0.0
+        self.pending = None          # (frame, result, packet) waiting to be encoded
+        self.jpeg = None
+        self.jpeg_seq = 0
+        self.last_encoded_at = 0.0
+        self.encoded = 0
+
+
+class PreviewServer:
+    """
+    Serve annotated frames over HTTP, rendering only while someone watches.
+
+    Args:
+        render_fn: render_fn(frame, result, packet) -> annotated frame; called
+            on the encoder thread with a copy of the frame
+        host, port: Address to listen on
+        max_fps: Encoded frames per second per camera
+        jpeg_quality: cv2.IMWRITE_JPEG_QUALITY
+    """
+
+    def __init__(self, render_fn, host=PREVIEW_HOST, port=PREVIEW_PORT, max_fps=PREVIEW_MAX_FPS,
+                 jpeg_quality=PREVIEW_JPEG_QUALITY):
+        self.render_fn = render_fn
+        self.host = host
+        self.port = port
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.jpeg_quality = int(jpeg_quality)
+        self._cameras = {}
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._httpd = None
+        self._threads = []
+
+    # ------------------- Output stage side -------------------
+
+    def publish(self, camera, frame, result, packet):
+        """Offer a frame; dropped at once unless a viewer needs it."""
+        preview = self._cameras.get(camera)
+        if preview is None:
+            with self._cond:
+                preview = self._cameras.setdefault(camera, _CameraPreview())
+        if preview.viewers == 0 and time.monotonic() > preview.wanted_until:
+            return
+        if time.monotonic() - preview.last_encoded_at < self.min_interval:
+            return
+        with self._cond:
+            # The pipeline is done with the frame after the output stage, so no copy here
+            preview.pending = (frame, result, packet)
+            self._cond.notify_all()
+
+    # ------------------- Encoder thread -------------------
+
+    def _encode_loop(self):
+        while not self._stop.is_set():
+            with self._cond:
+                work = [(name, p) for name, p in self._cameras.items() if p.pending is not None]
+                if not work:
+                    self._cond.wait(timeout=0.5)
+                    continue
+                jobs = []
+                for name, preview in work:
+                    jobs.append((preview, preview.pending))
+                    preview.pending = None
+
+            for preview, (frame, result, packet) in jobs:
+                try:
+                    image = self.render_fn(frame.copy(), result, packet)
+                    ok, jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                except Exception as e:
+                    print(f"[PREVIEW ERROR] Encoding failed: {e}")
+                    continue
+                if not ok:
+                    continue
+                with self._cond:
+                    preview.jpeg = jpeg.tobytes()
+                    preview.jpeg_seq += 1
+                    preview.last_encoded_at = time.monotonic()
+                    preview.encoded += 1
+                    self._cond.notify_all()
+
+    # ------------------- HTTP side -------------------
+
+    def _camera(self, name):
+        with self._cond:
+            return self._cameras.get(name)
+
+    def wait_for_jpeg(self, preview, after_seq, timeout):
+        """Block until preview has a JPEG newer than after_seq; returns (seq, jpeg) or None."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while preview.jpeg_seq <= after_seq and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            if preview.jpeg is None:
+                return None
+            return preview.jpeg_seq, preview.jpeg
+
+    def snapshot(self, name):
+        preview = self._camera(name)
+        if preview is None:
+            return None
+        preview.wanted_until = time.monotonic() + SNAPSHOT_HOLD_SECONDS
+        # A cached JPEG is only current while frames are being encoded
+        fresh = time.monotonic() - preview.last_encoded_at < max(self.min_interval * 2, 0.5)
+        if preview.jpeg is not None and fresh:
+            return preview.jpeg
+        found = self.wait_for_jpeg(preview, preview.jpeg_seq, SNAPSHOT_WAIT_SECONDS)
+        return found[1] if found else preview.jpeg
+
+    def stream(self, name, write):
+        """Push JPEGs to write() until it raises (client gone) or the server stops."""
+        preview = self._camera(name)
+        if preview is None:
+            return False
+        with self._cond:
+            preview.viewers += 1
+        try:
+            seq = 0
+            while not self._stop.is_set():
+                found = self.wait_for_jpeg(preview, seq, 1.0)
+                if found is None:
+                    continue
+                seq, jpeg = found
+                write(jpeg)
+        finally:
+            with self._cond:
+                preview.viewers -= 1
+        return True
+
+    def health(self):
+        with self._cond:
+            return {name: {"viewers": p.viewers, "encoded": p.encoded,
+                           "last_frame_age_s": round(time.monotonic() - p.last_encoded_at, 2)
+                           if p.encoded else None}
+                    for name, p in self._cameras.items()}
+
+    # ------------------- Control -------------------
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass  # Keep the recognizer's console readable
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = unquote(self.path.split("?", 1)[0])
+                if path == "/health":
+                    self._send(200, "application/json", json.dumps(server.health()).encode("utf-8"))
+                elif path.startswith("/snapshot/") and path.endswith(".jpg"):
+                    jpeg = server.snapshot(path[len("/snapshot/"):-len(".jpg")])
+                    if jpeg is None:
+                        self._send(404, "text/plain", b"No frame for this camera yet\n")
+                    else:
+                        self._send(200, "image/jpeg", jpeg)
+                elif path.startswith("/stream/") and path.endswith(".mjpg"):
+                    self._stream(path[len("/stream/"):-len(".mjpg")])
+                elif path == "/":
+                    links = "".join(f'<li>{name}: <a href="/stream/{name}.mjpg">stream</a> '
+                                    f'<a href="/snapshot/{name}.jpg">snapshot</a></li>'
+                                    for name in sorted(server.health()))
+                    self._send(200, "text/html", f"<ul>{links}</ul>".encode("utf-8"))
+                else:
+                    self._send(404, "text/plain", b"Not found\n")
+
+            def _stream(self, name):
+                if server._camera(name) is None:
+                    self._send(404, "text/plain", b"Unknown camera\n")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+
+                def write(jpeg):
+                    self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                     f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                    self.wfile.write(jpeg)
+                    self.wfile.write(b"\r\n")
+
+                try:
+                    server.stream(name, write)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Viewer closed the page
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self._threads = [
+            threading.Thread(target=self._httpd.serve_forever, name="preview-http", daemon=True),
+            threading.Thread(target=self._encode_loop, name="preview-encoder", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        print(f"[INFO] Preview available at http://{self.host}:{self.port}/")
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
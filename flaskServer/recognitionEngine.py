@@ -0,0 +1,438 @@
+"""
+Recognition engine: the models and the gallery behind the recognizer.
+
+Creating a RecognitionEngine loads nothing. Each component (torch,
+facenet_pytorch, MTCNN, the VGGFace2 ResNet, the anti-spoof model, YOLO and
+the gallery) is loaded on first use, or up front with load(), which imports
+torch once and then loads the rest in parallel. warmup() runs one dummy pass
+through each model so the first real frame doesn't pay for lazy kernel and
+allocator setup. Every load and warm-up is timed; startup_report() prints the
+breakdown. The anti-spoof, embedding and PPE stages can each run on ONNX
+Runtime instead of torch (onnxBackend.STAGE_BACKENDS or backends=).
+
+    engine = RecognitionEngine()
+    engine.load()
+    engine.warmup()
+    print(engine.startup_report())
+    boxes = engine.detect_faces(rgb_frame)
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from onnxBackend import STAGE_BACKENDS, stage_backend
+
+# ------------------- Configuration -------------------
+UPLOADS_FOLDER = '../backend/uploads'
+GALLERY_PATH = './gallery'  # Binary gallery written by gallery.py; falls back to UPLOADS_FOLDER CSVs
+THRESHOLD = 0.65  # Cosine similarity threshold (lowered from 0.75 for better recognition)
+BATCH_MATCHING = True  # Match all faces of a frame in one product (faceMatcher); False = per-face index lookup (annIndex)
+PPE_ENABLED = True  # Load YOLO and check PPE
+ANTI_SPOOF_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Silent-Face-Anti-Spoofing",
+                                     "resources", "anti_spoof_models", "2.7_80x80_MiniFASNetV2.pth")
+ANTI_SPOOF_ENSEMBLE = False  # Average every model in ANTI_SPOOF_MODEL_PATH's folder (see antiSpoofEnsemble)
+ANTI_SPOOF_BUDGET_MS = 20.0  # Ensemble latency budget per frame; None runs every model
+# -----------------------------------------------------
+
+# Load order: torch first (everything else imports it), then the rest in parallel
+COMPONENTS = ("torch", "facenet", "mtcnn", "resnet", "anti_spoof", "ppe", "gallery")
+
+
+class RecognitionEngine:
+    """
+    Lazily loaded detection, embedding, matching, anti-spoof and PPE models.
+
+    Args:
+        gallery_path: Binary gallery directory (see gallery.py)
+        uploads_folder: Per-person embeddings.csv folders, watched for new registrations
+        threshold: Minimum similarity for a match
+        batch_matching: Match faces with faceMatcher (True) or the per-face annIndex lookup
+        enable_ppe: Load and run the PPE model
+        anti_spoof_model_path: MiniFASNet weights used by is_real_face (the
+            ensemble's primary model)
+        anti_spoof_ensemble: Score faces with every model in that folder
+        anti_spoof_budget_ms: Latency budget that limits the ensemble's members
+        backends: {"antispoof" | "embedding" | "ppe": "torch" | "onnx"}
+            overrides of onnxBackend.STAGE_BACKENDS
+    """
+
+    def __init__(self, gallery_path=GALLERY_PATH, uploads_folder=UPLOADS_FOLDER, threshold=THRESHOLD,
+                 batch_matching=BATCH_MATCHING, enable_ppe=PPE_ENABLED,
+                 anti_spoof_model_path=ANTI_SPOOF_MODEL_PATH, anti_spoof_ensemble=ANTI_SPOOF_ENSEMBLE,
+                 anti_spoof_budget_ms=ANTI_SPOOF_BUDGET_MS, backends=None):
+        self.gallery_path = gallery_path
+        self.uploads_folder = uploads_folder
+        self.threshold = threshold
+        self.batch_matching = batch_matching
+        self.enable_ppe = enable_ppe
+        self.anti_spoof_model_path = anti_spoof_model_path
+        self.anti_spoof_ensemble = anti_spoof_ensemble
+        self.anti_spoof_budget_ms = anti_spoof_budget_ms
+        self.backends = dict(STAGE_BACKENDS, **(backends or {}))
+        for stage in self.backends:
+            stage_backend(stage, self.backends)
+
+        self.timings = {}
+        self._components = {}
+        self._locks = {name: threading.Lock() for name in COMPONENTS}
+        self._gallery_watcher = None
+
+    # ------------------- Lazy loading -------------------
+
+    def _get(self, name):
+        if name not in self._components:
+            with self._locks[name]:
+                if name not in self._components:
+                    start = time.perf_counter()
+                    component = getattr(self, f"_load_{name}")()
+                    self.timings[f"load:{name}"] = time.perf_counter() - start
+                    self._components[name] = component
+        return self._components[name]
+
+    def is_loaded(self, name):
+        return name in self._components
+
+    @property
+    def torch(self):
+        return self._get("torch")
+
+    @property
+    def device(self):
+        return 'cuda' if self.torch.cuda.is_available() else 'cpu'
+
+    @property
+    def mtcnn(self):
+        return self._get("mtcnn")
+
+    @property
+    def resnet(self):
+        return self._get("resnet")
+
+    @property
+    def anti_spoof(self):
+        return self._get("anti_spoof")
+
+    @property
+    def ppe_model(self):
+        """The YOLO model, or None if PPE is disabled or the model could not be loaded."""
+        return self._get("ppe")
+
+    @property
+    def live_gallery(self):
+        return self._get("gallery")
+
+    @property
+    def gallery_watcher(self):
+        self._get("gallery")
+        return self._gallery_watcher
+
+    def _load_torch(self):
+        import torch
+        return torch
+
+    def _load_facenet(self):
+        self._get("torch")
+        import facenet_pytorch
+        return facenet_pytorch
+
+    def _load_mtcnn(self):
+        return self._get("facenet").MTCNN(keep_all=True, device=self.device)
+
+    def _load_resnet(self):
+        if self.backends["embedding"] == "onnx":
+            self._get("torch")
+            from onnxBackend import OrtModule, embedding_onnx_path
+            return OrtModule(embedding_onnx_path())
+        return self._get("facenet").InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
+
+    def _load_anti_spoof(self):
+        self._get("torch")
+        from predict import AntiSpoofPredict
+        backend = self.backends["antispoof"]
+        if not self.anti_spoof_ensemble:
+            return AntiSpoofPredict(device_id=0, model_paths=[self.anti_spoof_model_path], backend=backend)
+        from antiSpoofEnsemble import AntiSpoofEnsemble
+        return AntiSpoofEnsemble(AntiSpoofPredict(device_id=0, backend=backend), os.path.dirname(self.anti_spoof_model_path),
+                                 primary=self.anti_spoof_model_path, budget_ms=self.anti_spoof_budget_ms)
+
+    def _load_ppe(self):
+        if not self.enable_ppe:
+            return None
+        from ppeDetection import load_ppe_model
+
+        print("[INFO] Initializing PPE detection model...")
+        if self.backends["ppe"] == "onnx":
+            from onnxBackend import ppe_onnx_path
+            # ultralytics runs an .onnx through ONNX Runtime itself
+            ppe_model = load_ppe_model(ppe_onnx_path(), use_pretrained=False)
+        else:
+            ppe_model = load_ppe_model()
+        if ppe_model is not None:
+            print("[INFO] PPE detection model loaded successfully")
+        else:
+            print("[WARNING] PPE detection model not available. PPE checks will be skipped.")
+        return ppe_model
+
+    def _load_gallery(self):
+        from faceMatcher import MATCH_AGGREGATION, MATCH_TOP_M, MATCH_PRECISION, MATCH_RERANK
+        from gallery import load_gallery
+        from liveGallery import LiveGallery, UploadsWatcher, gallery_built_at
+
+        # Binary gallery (python gallery.py convert ...) if present, else the per-person CSVs
+        gallery = load_gallery(self.gallery_path, self.uploads_folder)
+
+        # Matching goes through a LiveGallery so new registrations are picked up without a restart
+        # With batch matching each reload builds its matcher on the watcher thread, not on a frame
+        matcher_args = (MATCH_AGGREGATION, MATCH_TOP_M, MATCH_PRECISION, MATCH_RERANK) if self.batch_matching else None
+        live_gallery = LiveGallery(gallery, matcher_args)
+        if len(gallery):
+            print(f"[INFO] Loaded {len(gallery)} embeddings from {len(gallery.names)} person(s)")
+            print(f"[INFO] Person names: {', '.join(gallery.names)}")
+        else:
+            print("[WARNING] No embeddings found yet; new registrations will be picked up automatically.")
+
+        self._gallery_watcher = UploadsWatcher(live_gallery, self.uploads_folder,
+                                               since=gallery_built_at(self.gallery_path))
+        return live_gallery
+
+    def load(self, components=COMPONENTS, parallel=True):
+        """Load the given components now (all by default), in parallel after torch."""
+        start = time.perf_counter()
+        components = [name for name in components if name != "ppe" or self.enable_ppe]
+        if "torch" in components or any(name != "gallery" for name in components):
+            # One thread imports torch so the parallel loaders don't queue on the import lock
+            self._get("torch")
+        rest = [name for name in components if name != "torch"]
+        if parallel and len(rest) > 1:
+            with ThreadPoolExecutor(max_workers=len(rest), thread_name_prefix="engine-load") as pool:
+                for future in [pool.submit(self._get, name) for name in rest]:
+                    future.result()
+        else:
+            for name in rest:
+                self._get(name)
+        self.timings["load:total"] = time.perf_counter() - start
+        return self
+
+    def warmup(self, frame_size=(480, 640)):
+        """One dummy pass through every loaded model (loads them if needed)."""
+        start = time.perf_counter()
+        blank = np.zeros((frame_size[0], frame_size[1], 3), dtype=np.uint8)
+        passes = [
+            ("mtcnn", lambda: self.detect_faces(blank, verbose=False)),
+            ("resnet", lambda: self.embed_crops([blank[:160, :160]])),
+            ("anti_spoof", lambda: self.is_real_face(blank, (0, 0, 80, 80))),
+        ]
+        if self.anti_spoof_ensemble:
+            passes.append(("anti_spoof_calib", lambda: self.anti_spoof.calibrate(frame_size)))
+        if self.enable_ppe:
+            passes.append(("ppe", lambda: self.check_ppe(blank)))
+        for name, run in passes:
+            step = time.perf_counter()
+            try:
+                run()
+            except Exception as e:
+                print(f"[WARNING] Warm-up of {name} failed: {e}")
+            self.timings[f"warmup:{name}"] = time.perf_counter() - step
+        self.timings["warmup:total"] = time.perf_counter() - start
+        return self
+
+    def startup_report(self):
+        """Multi-line breakdown of load and warm-up times."""
+        lines = ["[STARTUP] component        seconds"]
+        for key, seconds in self.timings.items():
+            lines.append(f"[STARTUP] {key:<16} {seconds:7.3f}")
+        if self.anti_spoof_ensemble and self.is_loaded("anti_spoof"):
+            lines.append(self.anti_spoof.report())
+        return "\n".join(lines)
+
+    # ------------------- Detection and embedding -------------------
+
+    def detect_faces(self, image, verbose=True):
+        """Run MTCNN on an RGB image and return the list of face boxes (may be empty)."""
+        with self.torch.no_grad():
+            boxes, _ = self.mtcnn.detect(image)
+        if boxes is None:
+            if verbose:
+                print("[DEBUG] No faces detected in frame")
+            return []
+        return list(boxes)
+
+    def detect_faces_batch(self, images):
+        """
+        Run MTCNN once on a list of same-sized RGB images. Returns one list of
+        face boxes per image.
+        """
+        if not images:
+            return []
+        with self.torch.no_grad():
+            boxes, _ = self.mtcnn.detect(list(images))
+        return [list(image_boxes) if image_boxes is not None else [] for image_boxes in boxes]
+
+    def detect_faces_detailed_batch(self, images):
+        """
+        Run MTCNN once on a list of same-sized RGB images, keeping what the
+        enrollment quality gate needs. Returns one (boxes (K, 4), probs (K,),
+        landmarks (K, 5, 2)) tuple per image, K = 0 when no face was found.
+        """
+        if not images:
+            return []
+        with self.torch.no_grad():
+            boxes, probs, landmarks = self.mtcnn.detect(list(images), landmarks=True)
+        empty = (np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32),
+                 np.empty((0, 5, 2), dtype=np.float32))
+        return [empty if image_boxes is None else (image_boxes, image_probs, image_landmarks)
+                for image_boxes, image_probs, image_landmarks in zip(boxes, probs, landmarks)]
+
+    @staticmethod
+    def crop_faces(image, boxes):
+        """
+        160x160 crops of the given face boxes of an RGB image.
+
+        Returns:
+            tuple: (list of crops, indices into boxes of the non-empty crops)
+        """
+        faces = []
+        kept = []
+        for i, box in enumerate(boxes):
+            x1, y1, x2, y2 = map(int, box)
+            face = image[y1:y2, x1:x2]
+            if face.size == 0:
+                print("[DEBUG] Empty face crop detected")
+                continue
+            faces.append(cv2.resize(face, (160, 160)))
+            kept.append(i)
+        return faces, kept
+
+    def embed_crops(self, faces):
+        """Embed 160x160 RGB crops in one ResNet pass; returns an L2-normalised (K, 512) array."""
+        if not faces:
+            return np.empty((0, 512), dtype=np.float32)
+
+        batch = np.stack(faces).transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+        torch = self.torch
+        with torch.no_grad():
+            face_tensor = torch.from_numpy(batch).to(self.device)
+            encodings = self.resnet(face_tensor).cpu().numpy()
+
+        # L2-normalise all embeddings at once (same result as normalize() row by row)
+        norms = np.linalg.norm(encodings, axis=1, keepdims=True)
+        return encodings / np.maximum(norms, 1e-12)
+
+    def encode_faces(self, image, boxes):
+        """
+        Embed the given face boxes of an RGB image in one batched ResNet pass.
+
+        Returns:
+            tuple: (embeddings as an L2-normalised (K, 512) array, indices into
+            boxes of the K faces that had a non-empty crop)
+        """
+        # Crop every face first so the whole frame goes through ResNet in one forward pass
+        faces, kept = self.crop_faces(image, boxes)
+        return self.embed_crops(faces), kept
+
+    def detect_and_encode(self, image):
+        boxes = self.detect_faces(image)
+        if not boxes:
+            return []
+        embeddings, kept = self.encode_faces(image, boxes)
+        return [(embedding, boxes[i]) for embedding, i in zip(embeddings, kept)]
+
+    # ------------------- Matching -------------------
+
+    def match_embeddings(self, embeddings):
+        """
+        Match a (F, 512) batch of faces. Returns one (name or "Unknown", similarity)
+        per face; the similarity is the per-person aggregate of MATCH_AGGREGATION.
+        """
+        from faceMatcher import MATCH_AGGREGATION, MATCH_TOP_M, MATCH_PRECISION, MATCH_RERANK
+
+        # One snapshot per frame: a gallery reload in between can't mix old and new rows
+        snapshot = self.live_gallery.snapshot()
+        if self.batch_matching:
+            matcher = snapshot.matcher(MATCH_AGGREGATION, MATCH_TOP_M, MATCH_PRECISION, MATCH_RERANK)
+            best = [top[0] if top else (None, 0.0) for top in matcher.match(embeddings, k=1)]
+        else:
+            best = [snapshot.nearest(embedding) for embedding in embeddings]
+
+        matches = []
+        for best_name, best_similarity in best:
+            if best_name is None:
+                matches.append(("Unknown", 0.0))
+                continue
+
+            # Debug: print similarity scores
+            if best_similarity < self.threshold:
+                print(f"[DEBUG] Best match: {best_name} with similarity {best_similarity:.4f} "
+                      f"(threshold: {self.threshold})")
+
+            if best_similarity >= self.threshold:
+                matches.append((best_name, best_similarity))
+            else:
+                matches.append(("Unknown", best_similarity))
+        return matches
+
+    def match_embedding(self, input_embedding):
+        return self.match_embeddings(np.asarray(input_embedding).reshape(1, -1))[0]
+
+    # ------------------- Anti-spoofing and PPE -------------------
+
+    def are_real_faces(self, frame, boxes):
+        """is_real_face for every box of a frame, in one anti-spoof pass."""
+        return self.are_real_faces_many([(frame, boxes)])[0]
+
+    def are_real_faces_many(self, jobs):
+        """are_real_faces for several (BGR frame, boxes) pairs, all faces in one anti-spoof pass."""
+        if not any(len(boxes) for _, boxes in jobs):
+            return [[] for _ in jobs]
+        if self.anti_spoof_ensemble:
+            scores = self.anti_spoof.predict_many(jobs)
+        else:
+            scores = self.anti_spoof.predict_many(jobs, self.anti_spoof_model_path)
+        # 1 = real, 0 and 2 = spoof; empty crops score all zeros and argmax to 0
+        return [[bool(label == 1) for label in np.argmax(block, axis=1)] for block in scores]
+
+    def is_real_face(self, frame, box):
+        return self.are_real_faces(frame, [box])[0]
+
+    def check_ppe(self, frame):
+        """Run PPE detection on the full frame. Returns (detections, compliant, compliance_dict)."""
+        ppe_detections = None
+        ppe_compliant = False
+        ppe_compliance_dict = {}
+
+        ppe_model = self.ppe_model
+        if ppe_model is not None:
+            from ppeDetection import detect_ppe_items
+            try:
+                ppe_detections, ppe_compliant, ppe_compliance_dict = self._ppe_outcome(
+                    detect_ppe_items(frame, model=ppe_model))
+            except Exception as e:
+                print(f"[PPE ERROR] Detection failed: {e}")
+                ppe_compliant = True  # Default to compliant if detection fails (don't block attendance)
+        return ppe_detections, ppe_compliant, ppe_compliance_dict
+
+    def check_ppe_batch(self, frames):
+        """check_ppe for several frames with one PPE model call; one tuple per frame."""
+        ppe_model = self.ppe_model
+        if ppe_model is None:
+            return [(None, False, {}) for _ in frames]
+        from ppeDetection import detect_ppe_items_batch
+
+        return [self._ppe_outcome(ppe_detections)
+                for ppe_detections in detect_ppe_items_batch(frames, model=ppe_model)]
+
+    @staticmethod
+    def _ppe_outcome(ppe_detections):
+        """(detections, compliant, compliance_dict) of one frame's PPE detections."""
+        from ppeDetection import check_ppe_compliance
+
+        if ppe_detections.get("failed"):
+            # Default to compliant if detection fails (don't block attendance)
+            return ppe_detections, True, {}
+        ppe_compliant, _, ppe_compliance_dict = check_ppe_compliance(ppe_detections)
+        return ppe_detections, ppe_compliant, ppe_compliance_dict
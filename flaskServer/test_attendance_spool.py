@@ -0,0 +1,92 @@
+"""
+Spooled attendance delivery against a batch route that answers some events
+with a server error: those must stay pending and be sent again, never be
+marked rejected or put the person on the failure cooldown.
+
+    pytest test_attendance_spool.py
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from attendanceClient import AttendanceClient
+from attendanceSpool import AttendanceSpool
+
+
+class _Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+
+class _Session:
+    """
+    Stands in for requests.Session. Each POST takes the next list of
+    per-event statuses: a batch gets them as its results, a single event
+    the first one as the HTTP status.
+    """
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.posted = []
+
+    def post(self, url, json=None, timeout=None):
+        statuses = self.answers.pop(0) if self.answers else [200]
+        if "events" not in json:
+            self.posted.append([json["name"]])
+            return _Response(statuses[0])
+        self.posted.append([event["name"] for event in json["events"]])
+        return _Response(200, {"results": [{"name": event["name"], "status": status}
+                                           for event, status in zip(json["events"], statuses)]})
+
+    def close(self):
+        pass
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = AttendanceSpool(str(tmp_path / "spool.db"))
+    yield spool
+    spool.close()
+
+
+def test_batch_server_error_stays_pending(spool):
+    client = AttendanceClient("http://backend/mark-attendance", spool=spool, backoff_base=0.05,
+                              batch_window=0.1, flush_interval=0.05)
+    # First batch: alice accepted, bob hits a server error; bob's retry is accepted
+    client.session = _Session([200, 500], [200])
+    confirmed = []
+    client.on_confirmed = lambda event: confirmed.append(event["name"])
+    for name in ("alice", "bob"):
+        assert client.submit(name, {"recognized_at": "2026-10-18T08:00:00"})
+
+    assert _wait_until(lambda: len(confirmed) == 2)
+    client.close()
+
+    assert client.session.posted == [["alice", "bob"], ["bob"]]
+    assert confirmed == ["alice", "bob"]
+    stats = spool.stats()
+    assert stats["depth"] == 0 and stats["sent"] == 2 and stats["rejected"] == 0
+    assert client.failed == 0 and client.retries == 1
+    # bob's server error did not put him on the failure cooldown
+    assert client.submit("bob", {"recognized_at": "2026-10-19T08:00:00"})
@@ -0,0 +1,64 @@
+"""
+UploadsWatcher against a binary gallery with no embeddings.csv files (what
+bulkEnrollment writes without --csv): starting the watcher must keep every
+enrolled person, and deleting a person's uploads folder must remove them.
+
+    pytest test_live_gallery.py
+"""
+
+import os
+import shutil
+import sys
+
+import numpy as np
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from gallery import Gallery, l2_normalize
+from liveGallery import LiveGallery, UploadsWatcher, gallery_built_at
+
+
+def _binary_gallery(tmp_path, names, templates=2):
+    rng = np.random.default_rng(0)
+    embeddings = l2_normalize(rng.standard_normal((len(names) * templates, 512)))
+    labels = np.repeat(np.arange(len(names)), templates)
+    gallery_dir = str(tmp_path / "gallery")
+    Gallery(embeddings, labels, names).save(gallery_dir)
+    return gallery_dir
+
+
+def _watch(tmp_path, names, folders):
+    gallery_dir = _binary_gallery(tmp_path, names)
+    uploads = tmp_path / "uploads"
+    for name in folders:
+        # Photos only, as bulkEnrollment reads them; no embeddings.csv
+        (uploads / name).mkdir(parents=True)
+        (uploads / name / "photo.jpg").write_bytes(b"")
+    live_gallery = LiveGallery(Gallery.load(gallery_dir))
+    watcher = UploadsWatcher(live_gallery, str(uploads), since=gallery_built_at(gallery_dir))
+    watcher.prime()
+    return live_gallery, watcher, uploads
+
+
+def test_binary_gallery_survives_startup(tmp_path):
+    live_gallery, watcher, _ = _watch(tmp_path, ["alice", "bob", "carol"], ["alice", "bob"])
+    assert watcher.poll() == ([], [])
+    assert live_gallery.snapshot().person_names() == ["alice", "bob", "carol"]
+    assert len(live_gallery.snapshot()) == 6
+
+
+def test_binary_gallery_without_uploads_folder(tmp_path):
+    live_gallery, watcher, _ = _watch(tmp_path, ["alice", "bob"], [])
+    assert watcher.poll() == ([], [])
+    assert live_gallery.snapshot().person_names() == ["alice", "bob"]
+
+
+def test_deleting_folder_removes_binary_only_person(tmp_path):
+    live_gallery, watcher, uploads = _watch(tmp_path, ["alice", "bob"], ["alice", "bob"])
+    watcher.poll()
+    shutil.rmtree(uploads / "alice")
+    assert watcher.poll() == ([], ["alice"])
+    assert live_gallery.snapshot().person_names() == ["bob"]
+    # Removed once, not again on every scan
+    assert watcher.poll() == ([], [])
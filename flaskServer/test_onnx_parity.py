@@ -0,0 +1,115 @@
+"""
+Parity test for the ONNX Runtime backend.
+
+Runs every exported graph (python onnxBackend.py export) and its torch /
+ultralytics original on the same inputs, at batch 1 and batch 4 so the
+dynamic batch axis is exercised too, and checks the outputs agree.
+Stages without an export are skipped, and so is the whole module without
+torch, cv2 or onnxruntime. For speed, see python onnxBackend.py bench.
+
+    pytest test_onnx_parity.py
+    python test_onnx_parity.py [image_for_ppe]
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("onnxruntime")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from onnxBackend import (OrtModule, antispoof_model_paths, antispoof_onnx_path, embedding_onnx_path,
+                         load_torch_antispoof, load_torch_embedding, ppe_onnx_path, PPE_WEIGHTS)
+
+ANTISPOOF_TOLERANCE = 1e-3      # Largest softmax difference
+EMBEDDING_MIN_COSINE = 0.9999   # Per-row cosine similarity of the embeddings
+PPE_TOLERANCE = 0.02            # Largest per-class confidence difference
+BATCH_SIZES = (1, 4)
+PPE_IMAGE = os.environ.get("ONNX_PARITY_IMAGE",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_face.jpg"))
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    return np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+
+
+def test_antispoof():
+    """Softmax of every exported MiniFASNet against its .pth."""
+    exported = [path for path in antispoof_model_paths() if os.path.exists(antispoof_onnx_path(path))]
+    if not exported:
+        pytest.skip("No anti-spoof model exported")
+    rng = np.random.default_rng(0)
+    for model_path in exported:
+        loaded = load_torch_antispoof(model_path)
+        ort_model = OrtModule(antispoof_onnx_path(model_path))
+        for batch_size in BATCH_SIZES:
+            batch = rng.uniform(0, 255, (batch_size, 3, loaded.h_input, loaded.w_input)).astype(np.float32)
+            with torch.no_grad():
+                expected = _softmax(loaded.model(torch.from_numpy(batch)).numpy())
+            actual = _softmax(ort_model.run(batch))
+            diff = float(np.abs(expected - actual).max())
+            assert diff <= ANTISPOOF_TOLERANCE, f"{loaded.name} batch {batch_size}: max softmax diff {diff:.2e}"
+
+
+def test_embedding():
+    """InceptionResnetV1 embeddings: cosine similarity per row."""
+    onnx_path = embedding_onnx_path()
+    if not os.path.exists(onnx_path):
+        pytest.skip("Embedding model not exported")
+    model = load_torch_embedding()
+    ort_model = OrtModule(onnx_path)
+    rng = np.random.default_rng(1)
+    for batch_size in BATCH_SIZES:
+        batch = rng.uniform(0, 1, (batch_size, 3, 160, 160)).astype(np.float32)
+        with torch.no_grad():
+            expected = model(torch.from_numpy(batch)).numpy()
+        actual = ort_model.run(batch)
+        assert actual.shape == expected.shape, f"batch {batch_size}: shape {actual.shape} != {expected.shape}"
+        cosine = (expected * actual).sum(axis=1) / (
+            np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1))
+        assert float(cosine.min()) >= EMBEDDING_MIN_COSINE, f"batch {batch_size}: min cosine {float(cosine.min()):.6f}"
+
+
+def _class_confidences(detections):
+    best = {}
+    for detection in detections["all_detections"]:
+        best[detection["class"]] = max(best.get(detection["class"], 0.0), detection["confidence"])
+    return best
+
+
+def test_ppe():
+    """Best confidence per YOLO class on one image, ultralytics .pt against the .onnx."""
+    onnx_path = ppe_onnx_path()
+    if not os.path.exists(onnx_path):
+        pytest.skip("PPE model not exported")
+    YOLO = pytest.importorskip("ultralytics").YOLO
+    from ppeDetection import detect_ppe_items_batch
+
+    frame = cv2.imread(PPE_IMAGE)
+    if frame is None:
+        pytest.skip(f"Could not read {PPE_IMAGE}")
+    torch_model, ort_model = YOLO(PPE_WEIGHTS), YOLO(onnx_path, task="detect")
+    for batch_size in BATCH_SIZES:
+        frames = [frame] * batch_size
+        expected = detect_ppe_items_batch(frames, model=torch_model)
+        actual = detect_ppe_items_batch(frames, model=ort_model)
+        assert len(actual) == batch_size, f"batch {batch_size}: {len(actual)} result(s)"
+        diff = 0.0
+        for want, got in zip(expected, actual):
+            want, got = _class_confidences(want), _class_confidences(got)
+            for name in set(want) | set(got):
+                diff = max(diff, abs(want.get(name, 0.0) - got.get(name, 0.0)))
+        assert diff <= PPE_TOLERANCE, f"batch {batch_size}: max class confidence diff {diff:.3f}"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        os.environ["ONNX_PARITY_IMAGE"] = sys.argv[1]
+    sys.exit(pytest.main([os.path.abspath(__file__), "-v", "-rs"]))
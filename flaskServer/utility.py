@@ -24,9 +24,9 @@ def parse_model_name(model_name):
     # Print the info to check what is being extracted
     # print(f"Model name info: {info}")  # Debug print
 
-    # Extract resolution part (it should be in the second-to-last position)
+    # Extract resolution part (the token before the model type, e.g. 2.7_80x80_... or 4_0_0_80x80_...)
     try:
-        resolution = info[1]  # Modify to use the second part as resolution
+        resolution = info[-2]
         # print(f"Resolution extracted: {resolution}")  # Debug print
         h_input, w_input = resolution.split('x')  # Expected to split like 80x80
     except IndexError:
@@ -0,0 +1,12 @@
+-- Migration script to add replay protection for the recognizer's offline spool
+-- Run this in your Supabase SQL editor if the tables already exist
+
+CREATE TABLE IF NOT EXISTS attendance_events (
+    event_id VARCHAR(64) PRIMARY KEY,
+    employee_id VARCHAR(50) NOT NULL,
+    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (employee_id) REFERENCES users(employee_id) ON DELETE CASCADE
+);
+
+-- Add comment for documentation
+COMMENT ON TABLE attendance_events IS 'Event ids delivered by the face recognizer; the primary key makes a replayed event a unique violation instead of a second check-in/check-out';
@@ -22,4 +22,12 @@ CREATE TABLE attendance (
     ppe_items_detected JSONB DEFAULT '{}',
     ppe_detection_confidence DECIMAL(5,2) DEFAULT 0.00,
     FOREIGN KEY (employee_id) REFERENCES users(employee_id) ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+-- Recognizer event ids already recorded, so spool replays are ignored
+CREATE TABLE attendance_events (
+    event_id VARCHAR(64) PRIMARY KEY,
+    employee_id VARCHAR(50) NOT NULL,
+    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (employee_id) REFERENCES users(employee_id) ON DELETE CASCADE
+);